@@ -1,143 +1,45 @@
 # app.py — Amazon PPC Optimizer（含上传进度、早期否定扫描、词库建议 + v1.1 提价➝拆词/SKAG/否定导出，否定词根从 config.yaml 读取）
-import os, io, time, tempfile
+import io, os, hashlib, tempfile, zipfile
 import pandas as pd
 import streamlit as st
 from datetime import datetime
 
 from ppc_optimizer_lib import load_config, calculate_metrics  # 你已有的库：读取 config.yaml & 主分析
+from ppc_optimizer_lib import calculate_metrics_from_std, stream_standardize_csv, read_xlsx_pruned  # 大文件流式读取 / xlsx 列裁剪
+from ppc_optimizer_lib import _build_v11_decision_tables, v11_thresholds, V11_SHEETS  # v1.1 行动表（列式计算，无需 Streamlit 即可复用）
+from ppc_export import export_tables, available_formats, EXPORT_FORMATS  # 导出层：流式 xlsx / CSV 压缩包 / Parquet
+from ppc_optimizer_lib import FrameCache, _config_hash, _frame_nbytes
+from ppc_optimizer_lib import RollupCube  # 活动 / 广告组汇总下钻
+from ppc_optimizer_lib import _stage, ANALYZE_STAGES
+from ppc_instrument import Instrument, instrument_settings  # 阶段计时 / 行数 / 内存，诊断面板与 JSON 日志
+from ppc_bulksheet import build_bulksheet, bulksheet_zip, load_existing_bulk  # Amazon 批量上传文件
+from ppc_batch import run_jobs, account_name, resolve_account_config  # 批量模式（多份报表并行）
+from ppc_service import service_settings, service_available, submit_job, wait_for_job, fetch_results  # 本地分析服务（可选）
 
 st.set_page_config(page_title="Amazon PPC Optimizer", layout="wide")
 
-# =========================
-# v1.1 新增：共用小工具
-# =========================
-def _safe_div(a, b):
-    try:
-        return (a / b) if b else 0.0
-    except Exception:
-        return 0.0
-
-def _standardize_columns(df):
-    """
-    将常见的列名映射成标准列，便于统一计算。
-    有则映射，无则忽略（保持鲁棒）。
-    """
-    rename_map = {
-        # 搜索词
-        "Customer Search Term": "search_term",
-        "customer_search_term": "search_term",
-        "Search Term": "search_term",
-        "Query": "search_term",
-        # 指标
-        "Clicks": "clicks",
-        "Impressions": "impressions",
-        "Spend": "spend",
-        "Cost": "spend",
-        "7 Day Total Sales": "sales",
-        "Sales": "sales",
-        "7 Day Total Orders (#)": "orders",
-        "Orders": "orders",
-        # 结构
-        "Campaign Name": "campaign",
-        "Ad Group Name": "ad_group",
-    }
-    for k, v in rename_map.items():
-        if k in df.columns and v not in df.columns:
-            df = df.rename(columns={k: v})
-    return df
-
-def _ensure_metrics(df):
-    """
-    确保 df 具备 ctr / cpc / acos / cvr 指标；若缺失则计算。
-    """
-    df = df.copy()
-    df = _standardize_columns(df)
-    for col in ["clicks", "impressions", "spend", "sales", "orders"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-    if "ctr" not in df.columns and {"clicks","impressions"}.issubset(df.columns):
-        df["ctr"] = df.apply(lambda r: _safe_div(r["clicks"], r["impressions"]), axis=1)
-    if "cpc" not in df.columns and {"spend","clicks"}.issubset(df.columns):
-        df["cpc"] = df.apply(lambda r: _safe_div(r["spend"], r["clicks"]), axis=1)
-    if "acos" not in df.columns and {"spend","sales"}.issubset(df.columns):
-        df["acos"] = df.apply(lambda r: _safe_div(r["spend"], r["sales"]), axis=1)
-    if "cvr" not in df.columns and {"orders","clicks"}.issubset(df.columns):
-        df["cvr"] = df.apply(lambda r: _safe_div(r["orders"], r["clicks"]), axis=1)
-    return df
-
-def _build_v11_decision_tables(df_all_terms, cfg, target_acos=0.30, min_clicks=20, min_orders=2):
-    """
-    依据规则生成：黄金词（拆词建Exact）、继续测试、降价/否定，
-    并产出 SKAG 建组建议、否定清单（Exact / Phrase Roots 从 config.yaml）
-    """
-    df = _ensure_metrics(df_all_terms)
-
-    # 决策标签
-    cond_pass = (df["clicks"] >= min_clicks) & (df["orders"] >= min_orders) & (df["acos"] <= target_acos)
-    cond_test = (df["clicks"] >= min_clicks) & (
-        (df["orders"] < min_orders) | ((df["acos"] > target_acos) & (df["acos"] <= target_acos + 0.10))
-    )
-    cond_fail = (df["clicks"] >= min_clicks) & (df["orders"] < min_orders) & (df["acos"] > target_acos + 0.10)
-
-    df_dec = df.copy()
-    df_dec["decision"] = pd.Series("样本不足", index=df_dec.index)
-    df_dec.loc[cond_pass, "decision"] = "拆词建Exact"
-    df_dec.loc[cond_test, "decision"] = "继续测试"
-    df_dec.loc[cond_fail, "decision"] = "降价/否定"
-
-    df_pass = df_dec[df_dec["decision"]=="拆词建Exact"].sort_values(["acos","clicks"], ascending=[True, False])
-    df_test = df_dec[df_dec["decision"]=="继续测试"].sort_values(["clicks"], ascending=False)
-    df_fail = df_dec[df_dec["decision"]=="降价/否定"].sort_values(["acos","clicks"], ascending=[False, False])
-
-    # SKAG 建组建议表（Exact 单词组）
-    rows = []
-    for _, r in df_pass.iterrows():
-        kw = str(r.get("search_term","")).strip()
-        base_cpc = r.get("cpc", 0.3) or 0.3
-        start_bid = max(0.05, round(base_cpc * 1.00, 2))  # 初始出价 = 最近期平均CPC * 1.0
-        rows.append({
-            "Campaign Name": "Exact - SKAG - Core",
-            "Ad Group Name": f"Exact - {kw[:70]}",
-            "Match Type": "Exact",
-            "Keyword": kw,
-            "Start Bid": start_bid,
-            "Top of Search Adj": "30%~50%",   # 增长型·中等档
-            "Reason": "黄金词拆分，独立冲量"
-        })
-    df_skag = pd.DataFrame(rows)
-
-    # 否定：点击≥min_clicks 且 无单 或 ACOS>50%
-    neg_exact = df_dec[
-        (df_dec["clicks"] >= min_clicks) & ((df_dec["orders"] == 0) | (df_dec["acos"] > 0.50))
-    ].copy()
-    neg_exact = neg_exact.rename(columns={"search_term":"Negative Term"})
-    if "Negative Term" in neg_exact.columns:
-        neg_exact["Match Type"] = "Negative Exact"
-    neg_exact = neg_exact[["Negative Term","clicks","orders","spend","sales","acos","Match Type"]]
-
-    # ⬇️ 从 config.yaml 读取否定词根
-    phrase_roots = []
-    try:
-        phrase_roots = cfg.get("negatives_scan", {}).get("phrase_roots", [])
-    except Exception:
-        pass
-    df_neg_phrase_roots = pd.DataFrame({"Negative Phrase Root": phrase_roots})
-
-    return df_dec, df_pass, df_test, df_fail, df_skag, neg_exact, df_neg_phrase_roots
-
-def _export_v11_excel(df_all, df_pass, df_test, df_fail, df_skag, df_neg_exact, df_neg_phrase):
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        df_all.to_excel(writer, sheet_name="All_Analyzed", index=False)
-        df_pass.to_excel(writer, sheet_name="To_Exact_Split", index=False)
-        df_test.to_excel(writer, sheet_name="Keep_Testing", index=False)
-        df_fail.to_excel(writer, sheet_name="BidDown_or_Neg", index=False)
-        df_skag.to_excel(writer, sheet_name="SKAG_Plan", index=False)
-        df_neg_exact.to_excel(writer, sheet_name="Neg_Exact", index=False)
-        df_neg_phrase.to_excel(writer, sheet_name="Neg_Phrase_Roots", index=False)
-    buffer.seek(0)
-    return buffer
-
+@st.cache_resource
+def _get_frame_cache(max_entries: int, max_memory_mb: int) -> FrameCache:
+    """进程级单例：跨 rerun / 会话保留原始表与 All_Terms（LRU + 内存上限）。"""
+    return FrameCache(max_entries=max_entries, max_bytes=max_memory_mb * 1024 * 1024)
+
+def _lazy_export(cache, cache_key, tables, fmt, label, file_stem, widget_key, inst=None):
+    """按需导出：点击「生成」才写文件；结果按 cache_key（输入/配置/阈值/格式）缓存，之后直接提供下载。"""
+    ext, mime, _ = EXPORT_FORMATS[fmt]
+    data = cache.get(cache_key)
+    if data is None:
+        if not st.button(f"🛠️ 生成：{label}（{ext}）", key=f"build_{widget_key}", use_container_width=True):
+            return
+        try:
+            with st.spinner(f"正在生成 {label} …"), _stage(inst, f"export:{widget_key}") as rec:
+                data = export_tables(tables, fmt)
+                rec["bytes"] = len(data)
+        except Exception as e:
+            st.error(f"❌ 导出失败：{e}")
+            return
+        cache.put(cache_key, data)
+    st.download_button(f"📥 下载：{file_stem}{ext}", data=data, file_name=f"{file_stem}{ext}", mime=mime,
+                       use_container_width=True, key=f"dl_{widget_key}")
 
 # =========================
 # 页面开始（保留你原有的内容）
@@ -152,61 +54,150 @@ st.markdown("""
 uploaded_file = st.file_uploader("📤 上传 Search Term Report（CSV 或 XLSX）", type=["csv", "xlsx"])
 
 if uploaded_file:
-    st.caption(f"文件：**{uploaded_file.name}** | 大小约 **{len(uploaded_file.getbuffer())/1024/1024:.2f} MB**")
+    file_buf = uploaded_file.getbuffer()
+    st.caption(f"文件：**{uploaded_file.name}** | 大小约 **{len(file_buf)/1024/1024:.2f} MB**")
 
     with st.status("准备处理上传的文件…", state="running") as status:
-        # ── 阶段 1：接收（写入临时文件，带进度条） ──
-        st.write("📦 正在接收文件（写入服务器）…")
-        buf = uploaded_file.getbuffer()
-        total = len(buf)
-        recv_prog = st.progress(0, text="接收进度 0%")
-        chunk = 1024 * 1024  # 1MB
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            tmp_path = tmp.name
-            for i in range(0, total, chunk):
-                end = min(i + chunk, total)
-                tmp.write(buf[i:end])
-                pct = int(end / total * 100) if total else 100
-                recv_prog.progress(min(pct, 100), text=f"接收进度 {pct}%")
-                time.sleep(0.005)
-        st.write("✅ 文件接收完成")
-        recv_prog.empty()
-
-        # ── 阶段 2：解析 ──
-        st.write("📖 正在解析文件（CSV/XLSX）…")
-        parse_prog = st.progress(0, text="开始解析…")
         try:
-            if uploaded_file.name.lower().endswith(".csv"):
-                df = pd.read_csv(tmp_path)
-            else:
-                df = pd.read_excel(tmp_path)
-            parse_prog.progress(100, text="解析完成 100%")
-            st.write("🔎 原始列名：", list(df.columns))
-            st.write("📊 数据预览（前 10 行）")
-            st.dataframe(df.head(10))
+            cfg = load_config()  # 读取 config.yaml
         except Exception as e:
-            parse_prog.empty()
-            status.update(label=f"❌ 解析失败：{e}", state="error")
+            status.update(label=f"❌ 配置读取失败：{e}", state="error")
             st.stop()
-        finally:
+
+        # 按「文件内容哈希 + 配置哈希」复用解析/分析结果：拖动阈值时只重跑判定
+        analyze_prog = None
+
+        def _on_stage(name, depth):
+            # 分析子阶段开始时推进进度条（按 ANALYZE_STAGES 的顺序估算百分比）
+            sub = name.rsplit("/", 1)[-1]
+            if analyze_prog is not None and name.startswith("analyze/") and sub in ANALYZE_STAGES:
+                pct = int(100 * ANALYZE_STAGES.index(sub) / len(ANALYZE_STAGES))
+                analyze_prog.progress(pct, text=f"分析中：{sub}（{pct}%）")
+
+        inst = Instrument.from_config(cfg, label=uploaded_file.name, listener=_on_stage)
+        cache_hits = []
+
+        cache_cfg = cfg.get("cache", {}) or {}
+        cache = _get_frame_cache(int(cache_cfg.get("max_entries", 6)), int(cache_cfg.get("max_memory_mb", 2048)))
+        file_key = hashlib.sha1(file_buf).hexdigest()
+        cfg_key = _config_hash(cfg)
+
+        # 大 CSV 走流式：分块解析 + 增量汇总，不整表载入原始报表
+        ingest_cfg = cfg.get("ingest", {}) or {}
+        is_csv = uploaded_file.name.lower().endswith(".csv")
+        stream_mode = is_csv and len(file_buf) >= float(ingest_cfg.get("stream_threshold_mb", 100)) * 1024 * 1024
+
+        results = cache.get(("results", file_key, cfg_key))
+        df = None if stream_mode else cache.get(("raw", file_key))
+
+        # service.url：解析与分析交给本地分析服务（ppc_service.py），本页面只提交与轮询，不占用会话线程
+        service = service_settings(cfg)
+        remote = bool(service["url"]) and (results is not None or service_available(service["url"]))
+        if service["url"] and not remote:
+            st.warning(f"⚠️ 分析服务 {service['url']} 不可用，改为在本页面内计算")
+        remote_job = None
+        if remote and results is None:
+            st.write(f"🛰️ 已提交到分析服务 {service['url']}（后台解析 + 分析）…")
+            remote_prog = st.progress(0, text="排队中…")
+            try:
+                with _stage(inst, "remote", nbytes=len(file_buf)) as rec:
+                    remote_job = job = submit_job(service["url"], file_buf, uploaded_file.name, cfg)
+                    wait_for_job(service["url"], job["id"], poll=service["poll_seconds"],
+                                 progress=lambda stage, pct: remote_prog.progress(pct, text=f"服务端：{stage or '排队中'}（{pct}%）"))
+                    results, _ = fetch_results(service["url"], job["id"])
+                    rec["rows_out"] = len(results["All_Terms"])
+                remote_prog.progress(100, text="分析完成")
+                st.write(f"✅ 服务端分析完成（任务 {job['id']}{'，命中服务端结果缓存' if job.get('cached') else ''}）")
+            except Exception as e:
+                remote_prog.empty()
+                status.update(label=f"❌ 分析服务失败：{e}", state="error")
+                st.stop()
+            cache.put(("results", file_key, cfg_key), results)
+        if remote:
+            pass   # 原始表留在服务端，下面只展示标准化结果
+        elif stream_mode:
+            if results is None:
+                # ── 阶段 1+2：流式解析（进度按实际解析字节数） ──
+                st.write("📖 正在流式解析 CSV（分块读取 · 仅需要的列 · 增量汇总）…")
+                parse_prog = st.progress(0, text="开始解析…")
+
+                def _on_parse_progress(read_bytes, total_bytes, rows):
+                    pct = int(read_bytes / total_bytes * 100) if total_bytes else 100
+                    parse_prog.progress(min(pct, 100), text=f"解析进度 {pct}%（{read_bytes/1024/1024:.1f} / {total_bytes/1024/1024:.1f} MB，{rows:,} 行）")
+
+                try:
+                    uploaded_file.seek(0)
+                    with _stage(inst, "parse+standardize", nbytes=len(file_buf)) as rec:
+                        df_std, n_raw_rows = stream_standardize_csv(
+                            uploaded_file, cfg,
+                            chunksize=int(ingest_cfg.get("chunk_rows", 200_000)),
+                            progress=_on_parse_progress,
+                        )
+                        rec["rows_in"], rec["rows_out"] = n_raw_rows, len(df_std)
+                    parse_prog.progress(100, text="解析完成 100%")
+                    st.write(f"✅ 流式解析完成：原始 {n_raw_rows:,} 行 → 汇总 {len(df_std):,} 行（活动 × 广告组 × 搜索词）")
+                except Exception as e:
+                    parse_prog.empty()
+                    status.update(label=f"❌ 解析失败：{e}", state="error")
+                    st.stop()
+        elif df is None:
+            # ── 阶段 1+2：解析（直接读取已上传的内存数据，无需写临时文件） ──
+            st.write("📖 正在解析文件（CSV/XLSX）…")
+            parse_prog = st.progress(0, text="开始解析…")
             try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
+                uploaded_file.seek(0)
+                with _stage(inst, "parse", nbytes=len(file_buf)) as parse_rec:
+                    if is_csv:
+                        df = pd.read_csv(uploaded_file)
+                    else:
+                        # xlsx：按表头只读取需要的列（有 python-calamine 时用 calamine 引擎）
+                        def _on_xlsx_progress(rows, total_rows):
+                            pct = int(rows / total_rows * 100) if total_rows else 0
+                            parse_prog.progress(min(pct, 100), text=f"解析进度 {pct}%（{rows:,} 行）")
+
+                        df, xlsx_stats = read_xlsx_pruned(uploaded_file, cfg, progress=_on_xlsx_progress)
+                        st.write(f"⚡ XLSX 解析：{xlsx_stats['rows']:,} 行 · {xlsx_stats['seconds']:.2f}s · "
+                                 f"{xlsx_stats['rows_per_sec']:,.0f} 行/秒（引擎 {xlsx_stats['engine']}，仅读取 {len(xlsx_stats['columns'])} 列）")
+                    parse_rec["rows_out"] = len(df)
+                parse_prog.progress(100, text="解析完成 100%")
+            except Exception as e:
+                parse_prog.empty()
+                status.update(label=f"❌ 解析失败：{e}", state="error")
+                st.stop()
+            cache.put(("raw", file_key), df)
+        else:
+            st.write("⚡ 命中缓存：跳过解析")
+            cache_hits.append("parse")
+        if df is not None:
+            st.write("🔎 原始列名：", list(df.columns))
+            st.write("📊 数据预览（前 10 行）")
+            st.dataframe(df.head(10))
 
-        # ── 阶段 3：分析（沿用你原有 calculate_metrics） ──
-        st.write("🧠 正在分析（计算 CTR/CVR/ACOS；分类建议；早期否定；词库建议）…")
-        analyze_prog = st.progress(0, text="载入配置…")
-        try:
-            cfg = load_config()  # 读取 config.yaml
-            analyze_prog.progress(30, text="指标计算 & 规则分类…")
-            results = calculate_metrics(df, cfg)
-            analyze_prog.progress(100, text="分析完成")
-            st.write("✅ 分析完成")
-        except Exception as e:
-            analyze_prog.empty()
-            status.update(label=f"❌ 分析失败：{e}", state="error")
-            st.stop()
+        if results is None:
+            # ── 阶段 3：分析（沿用你原有 calculate_metrics） ──
+            st.write("🧠 正在分析（计算 CTR/CVR/ACOS；分类建议；早期否定；词库建议）…")
+            analyze_prog = st.progress(0, text="载入配置…")
+            try:
+                base_rows = len(df_std) if stream_mode else len(df)
+                with _stage(inst, "analyze", rows=base_rows) as rec:
+                    if stream_mode:
+                        results = calculate_metrics_from_std(df_std, cfg, timings=inst)
+                    else:
+                        results = calculate_metrics(df, cfg, timings=inst)
+                    rec["rows_out"] = len(results["All_Terms"])
+                analyze_prog.progress(100, text="分析完成")
+                st.write("✅ 分析完成")
+            except Exception as e:
+                analyze_prog.empty()
+                status.update(label=f"❌ 分析失败：{e}", state="error")
+                st.stop()
+            cache.put(("results", file_key, cfg_key), results)
+        elif remote_job is None:
+            st.write("⚡ 命中缓存：沿用已有分析结果（仅重新计算阈值判定）")
+            cache_hits.append("analyze")
+        if df is None:
+            st.write("📊 标准化数据预览（前 10 行）")
+            st.dataframe(results["All_Terms"].head(10))
 
         # ── 阶段 4：展示你原有的输出 ──
         today_str = datetime.now().strftime("%Y-%m-%d")
@@ -226,6 +217,35 @@ if uploaded_file:
             st.subheader("🌱 Harvest（高转化率）")
             st.dataframe(results["Harvest"].head(200))
 
+        if "Bid_Sheet" in results:
+            st.subheader("💲 出价调整表（Bid_Sheet：目标 ACOS × CVR × 客单价，含步长限制）")
+            st.caption("搜索词级的建议精确出价；生成 bulksheet 时只对现有 bulksheet 里同广告组、同词的精确关键词改价。")
+            st.dataframe(results["Bid_Sheet"].head(300), use_container_width=True)
+
+        if "Term_Clusters" in results:
+            st.subheader("🧬 搜索词变体聚类（Term_Clusters：同一簇合并统计，按簇决策 / 提炼否定词根）")
+            st.dataframe(results["Term_Clusters"].head(300), use_container_width=True)
+
+        # 活动 / 广告组下钻（汇总在分析时一次算好，这里只做字典查找）
+        st.subheader("🏷️ 活动 / 广告组汇总（下钻）")
+        cube = cache.get(("cube", file_key, cfg_key))
+        if cube is None:
+            cube = RollupCube(results["Rollup"], results["All_Terms"])
+            cache.put(("cube", file_key, cfg_key), cube, nbytes=_frame_nbytes(results["Rollup"]) + 8 * len(results["All_Terms"]))
+        acct = cube.node()
+        if acct is not None:
+            st.caption(f"账户合计：花费 {acct['spend']:,.2f} ｜ 销售额 {acct['sales']:,.2f} ｜ ACOS {acct['acos']:.1%} ｜ "
+                       f"点击 {acct['clicks']:,} ｜ 订单 {acct['orders']:,} ｜ 搜索词 {acct['terms']:,}")
+        campaigns = cube.children()
+        st.dataframe(campaigns.drop(columns=["level", "ad_group"]).head(300), use_container_width=True)
+        if len(campaigns):
+            sel_camp = st.selectbox("选择活动查看广告组", campaigns["campaign"].tolist(), key="rollup_campaign")
+            ad_groups = cube.children(sel_camp)
+            st.dataframe(ad_groups.drop(columns=["level"]), use_container_width=True)
+            if len(ad_groups):
+                sel_adg = st.selectbox("选择广告组查看搜索词", ad_groups["ad_group"].tolist(), key="rollup_ad_group")
+                st.dataframe(cube.terms(sel_camp, sel_adg).head(300), use_container_width=True)
+
         # 早期否定（低数据量也能输出建议）
         st.subheader("🧭 早期否定词（含来源与理由）")
         st.caption("说明：当样本很少/无转化时，基于词根库识别潜在无效词供你审核。")
@@ -272,6 +292,14 @@ if uploaded_file:
                 st.code(yaml_block, language="yaml")
                 st.caption("把上面列表粘到 config.yaml 对应的 patterns 分类下（或按你的分类拆分）。")
 
+        # 否定词冲突：拟否定的词 / 词组 / 词根会挡住的有转化搜索词
+        if "Negative_Conflicts" in results:
+            conflicts = results["Negative_Conflicts"]
+            st.subheader("⚠️ 否定词冲突（Negative_Conflicts：这些否定会挡住已出单的搜索词）")
+            st.caption(f"{len(conflicts)} 条拟否定项会误伤转化词，合计挡住订单 {conflicts['Blocked Orders'].sum():,.0f}、"
+                       f"销售额 {conflicts['Blocked Sales'].sum():,.2f}。上传前请复核（Sample Terms 为被挡住的销售额最高的词）。")
+            st.dataframe(conflicts.head(300), use_container_width=True)
+
         # =========================
         # v1.1 新增面板：提价 ➝ 拆词 / SKAG / 否定 / 一键导出
         # =========================
@@ -280,15 +308,19 @@ if uploaded_file:
         st.caption("根据目标 ACOS、最少点击、最少订单，自动判定黄金词/继续测试/降价否定，并生成 SKAG 建组与否定词清单（否定词根来自 config.yaml）。")
 
         with st.expander("⚙️ 判定阈值（可调整）", expanded=False):
-            target_acos = st.slider("🎯 目标 ACOS", 0.10, 0.60, 0.30, 0.01)
-            min_clicks  = st.number_input("🔎 最少点击（进入判断）", 5, 200, 20, 1)
-            min_orders  = st.number_input("📦 最少订单（黄金词门槛）", 1, 10, 2, 1)
+            th_default = v11_thresholds(cfg)  # 默认值来自 config.yaml 的 v11 段
+            target_acos = st.slider("🎯 目标 ACOS", 0.10, 0.60, min(max(th_default["target_acos"], 0.10), 0.60), 0.01)
+            min_clicks  = st.number_input("🔎 最少点击（进入判断）", 5, 200, min(max(th_default["min_clicks"], 5), 200), 1)
+            min_orders  = st.number_input("📦 最少订单（黄金词门槛）", 1, 10, min(max(th_default["min_orders"], 1), 10), 1)
 
         # 使用你 pipeline 的 All_Terms 作为基础（若没有则回退用原 df）
         base_df_for_v11 = results.get("All_Terms", df)
-        df_all, df_pass, df_test, df_fail, df_skag, df_neg_exact, df_neg_phrase = _build_v11_decision_tables(
-            base_df_for_v11, cfg, target_acos=target_acos, min_clicks=min_clicks, min_orders=min_orders
-        )
+        with _stage(inst, "v11_tables", rows=len(base_df_for_v11)) as rec:
+            df_all, df_pass, df_test, df_fail, df_skag, df_neg_exact, df_neg_phrase = _build_v11_decision_tables(
+                base_df_for_v11, cfg, target_acos=target_acos, min_clicks=min_clicks, min_orders=min_orders,
+                conflict_index=results.get("Conflict_Index"),
+            )
+            rec["rows_out"] = len(df_pass)
 
         st.success(f"分析结果：✅ 拆词建Exact {len(df_pass)} 条 ｜ ⚠️ 继续测试 {len(df_test)} 条 ｜ ❌ 降价/否定 {len(df_fail)} 条")
 
@@ -306,16 +338,13 @@ if uploaded_file:
         st.subheader("🧱 词根否定（Negative Phrase Roots / 来自 config.yaml）")
         st.dataframe(df_neg_phrase, use_container_width=True)
 
-        # —— v1.1 专用导出 —— #
+        # —— v1.1 专用导出（按需生成，按 文件/配置/阈值/格式 缓存） —— #
         today_compact = datetime.now().strftime("%Y%m%d")
-        v11_excel = _export_v11_excel(df_all, df_pass, df_test, df_fail, df_skag, df_neg_exact, df_neg_phrase)
-        st.download_button(
-            label=f"📥 下载：ppc_actions_{today_compact}.xlsx",
-            data=v11_excel,
-            file_name=f"ppc_actions_{today_compact}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True
-        )
+        export_fmt = st.radio("📦 导出格式", available_formats(), format_func=lambda f: EXPORT_FORMATS[f][2],
+                              horizontal=True, key="export_fmt")
+        v11_tables = dict(zip(V11_SHEETS, [df_all, df_pass, df_test, df_fail, df_skag, df_neg_exact, df_neg_phrase]))
+        _lazy_export(cache, ("export", file_key, cfg_key, "v11", target_acos, min_clicks, min_orders, export_fmt),
+                     v11_tables, export_fmt, "v1.1 行动表", f"ppc_actions_{today_compact}", "v11", inst)
         st.download_button(
             "📥 下载：skag_plan.csv",
             data=df_skag.to_csv(index=False).encode("utf-8-sig"),
@@ -338,26 +367,97 @@ if uploaded_file:
             use_container_width=True
         )
 
-        # ── 阶段 5：你的“总导出”（原有逻辑保留） ──
+        # —— Amazon 批量上传文件（bulksheets 2.0：否定词 / SKAG 建组 / 改价；超过行数上限自动拆分） —— #
         st.markdown("---")
-        st.write("📤 正在导出 Excel（全部结果合集） …")
-        try:
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-                for name, df_out in results.items():
-                    if isinstance(df_out, pd.DataFrame):
-                        df_out.to_excel(writer, sheet_name=name[:31], index=False)
-            st.download_button(
-                "⬇️ 下载 Excel（全部结果）",
-                data=output.getvalue(),
-                file_name=f"ppc_output_{today_str}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True,
-            )
-            status.update(label="🎉 全流程完成：接收 → 解析 → 分析 → 导出", state="complete")
-        except Exception as e:
-            status.update(label=f"❌ 导出失败：{e}", state="error")
-            st.stop()
+        st.write("📦 Amazon 批量上传文件（Sponsored Products bulksheet）")
+        st.caption("可选上传后台下载的现有 bulksheet：补全活动/广告组 ID、跳过已存在的否定词，并为改价行提供 Keyword ID。")
+        existing_file = st.file_uploader("现有 bulksheet（可选，XLSX / CSV）", type=["xlsx", "csv"], key="existing_bulk")
+        existing_key = hashlib.sha1(existing_file.getbuffer()).hexdigest() if existing_file else None
+        bulk_key = ("bulk", file_key, cfg_key, target_acos, min_clicks, min_orders, existing_key)
+        bulk_data = cache.get(bulk_key)
+        if bulk_data is None and st.button("🛠️ 生成：Amazon 批量上传文件（.zip）", key="build_bulk", use_container_width=True):
+            try:
+                with st.spinner("正在生成 bulksheet …"), _stage(inst, "bulksheet") as rec:
+                    existing = load_existing_bulk(existing_file, existing_file.name) if existing_file else None
+                    bulk, bulk_stats = build_bulksheet(results, v11_tables, cfg, existing)
+                    bulk_data = (bulksheet_zip(bulk, cfg, stem=f"bulksheet_{today_compact}"), bulk_stats)
+                    rec["rows_out"], rec["bytes"] = len(bulk), len(bulk_data[0])
+                cache.put(bulk_key, bulk_data)
+            except Exception as e:
+                st.error(f"❌ bulksheet 生成失败：{e}")
+        if bulk_data is not None:
+            data, bulk_stats = bulk_data
+            st.caption(" ｜ ".join(f"{k}: {v}" for k, v in bulk_stats.items()))
+            st.download_button("📥 下载：bulksheet.zip", data=data, file_name=f"bulksheet_{today_compact}.zip",
+                               mime="application/zip", use_container_width=True, key="dl_bulk")
+
+        # ── 阶段 5：你的“总导出”（按需生成；同一输入只生成一次） ──
+        st.markdown("---")
+        st.write("📤 导出全部结果合集（点击生成后下载）")
+        _lazy_export(cache, ("export", file_key, cfg_key, "all", export_fmt),
+                     results, export_fmt, "全部结果", f"ppc_output_{today_str}", "all", inst)
+
+        # ── 诊断：本次运行各阶段的真实耗时 / 行数 / 内存（可下载 JSON，或在 config 的 diagnostics.json_log 落盘） ──
+        diag = instrument_settings(cfg)
+        with st.expander("🩺 诊断：各阶段耗时 / 行数 / 内存", expanded=False):
+            st.caption(f"本次运行合计 {inst.total_seconds:.2f}s" +
+                       (f" ｜ 命中缓存跳过：{'、'.join(cache_hits)}" if cache_hits else "") +
+                       ("" if diag["trace_memory"] else " ｜ 峰值内存需在 config.yaml 打开 diagnostics.trace_memory"))
+            if inst.records:
+                st.dataframe(inst.table(), use_container_width=True,
+                             column_config={"share": st.column_config.ProgressColumn("share", format="%.0f%%", min_value=0, max_value=1)})
+            if diag["profile"]:
+                st.code(inst.profile_text(diag["profile_top"]) or "（无）", language="text")
+            run_json = inst.emit(diag["json_log"], file=uploaded_file.name, file_bytes=len(file_buf), cache_hits=cache_hits)
+            st.download_button("⬇️ 下载运行记录（JSON）", data=run_json.encode("utf-8"),
+                               file_name=f"ppc_run_{today_compact}.json", mime="application/json", key="dl_diag")
+        status.update(label="🎉 全流程完成：解析 → 分析（导出按需生成）", state="complete")
 
 else:
     st.info("👆 请上传文件后，系统会显示处理进度。")
+
+# =========================
+# 批量模式：多品牌 / 多站点报表（进程池并行）
+# =========================
+st.markdown("---")
+with st.expander("📦 批量模式：一次处理多份报表（多品牌 / 多站点，进程池并行）", expanded=False):
+    st.caption("每份报表按文件名作为账户名，可在 config.yaml 的 `batch.overrides` 中按账户名（支持通配符）覆盖配置。")
+    batch_files = st.file_uploader("📤 上传多份 Search Term Report（CSV 或 XLSX）", type=["csv", "xlsx"],
+                                   accept_multiple_files=True, key="batch_files")
+    if batch_files and st.button("🚀 开始批量处理", use_container_width=True):
+        try:
+            cfg_b = load_config()
+        except Exception as e:
+            st.error(f"❌ 配置读取失败：{e}")
+            st.stop()
+        batch_cfg = cfg_b.get("batch", {}) or {}
+        with tempfile.TemporaryDirectory() as out_dir:
+            jobs = []
+            for f in batch_files:
+                acc = account_name(f.name)
+                jobs.append({
+                    "account": acc, "name": f.name, "data": f.getvalue(), "out_dir": out_dir,
+                    "cfg": resolve_account_config(cfg_b, acc, batch_cfg.get("overrides")),
+                })
+            with st.spinner(f"正在并行处理 {len(jobs)} 份报表…"):
+                summary = run_jobs(jobs, workers=batch_cfg.get("workers"))
+                summary.to_csv(os.path.join(out_dir, "summary.csv"), index=False, encoding="utf-8-sig")
+            zip_buf = io.BytesIO()
+            with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
+                for root, _, files in os.walk(out_dir):
+                    for fn in files:
+                        full = os.path.join(root, fn)
+                        zf.write(full, os.path.relpath(full, out_dir))
+        st.session_state["batch_result"] = (summary, zip_buf.getvalue())
+
+    if "batch_result" in st.session_state:
+        summary, zip_bytes = st.session_state["batch_result"]
+        st.subheader("📋 跨账户汇总")
+        st.dataframe(summary, use_container_width=True)
+        st.download_button(
+            "⬇️ 下载批量结果（各账户明细 + summary.csv）",
+            data=zip_bytes,
+            file_name=f"ppc_batch_{datetime.now().strftime('%Y%m%d')}.zip",
+            mime="application/zip",
+            use_container_width=True,
+        )
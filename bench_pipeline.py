@@ -0,0 +1,288 @@
+# bench_pipeline.py — 分析流程性能基准：各阶段耗时 / 峰值内存 + 基线对比；v1.1 决策表旧版 vs 列式实现；标准化数据内存报告
+# 用法：python bench_pipeline.py --stages [--rows 10000 100000 1000000] [--baseline bench_baseline.json] [--save-baseline]
+#       python bench_pipeline.py [--rows ...] [--legacy-max 100000]      # v1.1 旧版对照
+#       python bench_pipeline.py --memory                                # 标准化数据内存报告
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from ppc_optimizer_lib import (load_config, standardize_df, scan_potential_negatives, suggest_lexicon_updates,
+                               calculate_metrics_from_std, _build_v11_decision_tables, v11_thresholds, _frame_nbytes)
+
+# ---------- 合成报表 ----------
+_WORDS = ["brew","heater","fermentation","wine","beer","home","mat","heat","pad","belt",
+          "kit","set","starter","bundle","digital","thermostat","kombucha","carboy","temperature","controller"]
+_SYLLABLES = ["ka","lo","mi","ren","tor","vis","pa","qu","zen","dor","fi","lan","mo","sel","tri","bo"]
+# 命中 negatives_scan.patterns 的词（与 config.yaml 默认词库一致）
+_PATTERN_WORDS = ["car","12v","reptile","aquarium","replacement","spare","adapter","cheap","free","budget"]
+
+def _zipf_cdf(n: int, a: float) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1, dtype="float64") ** a
+    return np.cumsum(w) / w.sum()
+
+def make_synthetic_report(rows: int, seed: int = 0, campaigns: int = 50, ad_groups: int = 5,
+                          vocab_size: int = 2000, zipf_a: float = 1.1, pattern_rate: float = 0.05,
+                          unique_terms: int = None) -> pd.DataFrame:
+    """
+    固定种子的搜索词报表（列名同亚马逊 Search Term Report）：
+    - 词表 = 产品词 + 合成词，搜索词由 1–4 个按 Zipf 抽取的词组成；
+    - 每行的搜索词按 Zipf（指数 zipf_a）从 unique_terms 个不同搜索词（默认 rows // 4）中抽取，头部词出现在很多广告组；
+    - pattern_rate 比例的搜索词带一个否定词库中的词（car / cheap / replacement …），转化率更低；
+    - 曝光对数正态，点击 / 订单按 CTR / CVR 二项抽样，热门词曝光更多。
+    """
+    rng = np.random.default_rng(seed)
+    n_syn = max(0, vocab_size - len(_WORDS))
+    syl = np.array(_SYLLABLES)
+    syn = ["".join(p) for p in syl[rng.integers(0, len(syl), (n_syn, 3))]]
+    vocab = np.array(list(dict.fromkeys(_WORDS + syn)), dtype=object)
+
+    n_terms = max(10, unique_terms or rows // 4)
+    n_tok = rng.integers(1, 5, n_terms)
+    tok = np.searchsorted(_zipf_cdf(len(vocab), 1.0), rng.random((n_terms, 4)))
+    words = vocab[np.minimum(tok, len(vocab) - 1)]
+    is_pattern = rng.random(n_terms) < pattern_rate
+    pat = np.array(_PATTERN_WORDS, dtype=object)[rng.integers(0, len(_PATTERN_WORDS), n_terms)]
+    catalog = np.array([" ".join(w[:k]) + (" " + p if hit else "")
+                        for w, k, p, hit in zip(words, n_tok, pat, is_pattern)], dtype=object)
+
+    rank = np.minimum(np.searchsorted(_zipf_cdf(n_terms, zipf_a), rng.random(rows)), n_terms - 1)
+    popularity = 1.0 + 4.0 / np.sqrt(rank + 1.0)
+    impressions = np.round(rng.lognormal(4.0, 1.2, rows) * popularity).astype("int64")
+    clicks = rng.binomial(impressions, rng.beta(2, 60, rows))
+    cvr = np.where(is_pattern[rank], rng.beta(1, 60, rows), rng.beta(2, 18, rows))
+    orders = rng.binomial(clicks, cvr)
+    return pd.DataFrame({
+        "Customer Search Term": catalog[rank],
+        "Clicks": clicks,
+        "Impressions": impressions,
+        "Spend": (clicks * rng.uniform(0.2, 1.5, rows)).round(2),
+        "7 Day Total Sales": (orders * rng.uniform(15, 40, rows)).round(2),
+        "7 Day Total Orders (#)": orders,
+        "Campaign Name": np.char.add("Campaign ", rng.integers(0, campaigns, rows).astype(str)),
+        "Ad Group Name": np.char.add("AG ", rng.integers(0, ad_groups, rows).astype(str)),
+    })
+
+# ---------- 旧版实现（逐行 apply / iterrows / object 字符串列，仅作对照） ----------
+def _legacy_standardize_df(raw_df, cfg):
+    df = pd.DataFrame()
+    df["search_term"] = raw_df["Customer Search Term"].astype(str).astype(object)
+    for src, dst in [("Clicks","clicks"),("Impressions","impressions"),("Spend","spend"),
+                     ("7 Day Total Sales","sales"),("7 Day Total Orders (#)","orders")]:
+        df[dst] = pd.to_numeric(raw_df[src], errors="coerce").astype("float64")
+    df["campaign"] = raw_df["Campaign Name"].astype(str).astype(object)
+    df["ad_group"] = raw_df["Ad Group Name"].astype(str).astype(object)
+    df["ctr"]  = df["clicks"] / df["impressions"].replace(0, pd.NA)
+    df["cpc"]  = df["spend"]  / df["clicks"].replace(0, pd.NA)
+    df["acos"] = df["spend"]  / df["sales"].replace(0, pd.NA)
+    df["cvr"]  = df["orders"] / df["clicks"].replace(0, pd.NA)
+    return df.fillna(0)
+
+def _legacy_safe_div(a, b):
+    try:
+        return (a / b) if b else 0.0
+    except Exception:
+        return 0.0
+
+def _legacy_ensure_metrics(df):
+    df = df.copy()
+    for col in ["clicks", "impressions", "spend", "sales", "orders"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+    if "ctr" not in df.columns:
+        df["ctr"] = df.apply(lambda r: _legacy_safe_div(r["clicks"], r["impressions"]), axis=1)
+    if "cpc" not in df.columns:
+        df["cpc"] = df.apply(lambda r: _legacy_safe_div(r["spend"], r["clicks"]), axis=1)
+    if "acos" not in df.columns:
+        df["acos"] = df.apply(lambda r: _legacy_safe_div(r["spend"], r["sales"]), axis=1)
+    if "cvr" not in df.columns:
+        df["cvr"] = df.apply(lambda r: _legacy_safe_div(r["orders"], r["clicks"]), axis=1)
+    return df
+
+def _legacy_build_v11(df_all_terms, target_acos=0.30, min_clicks=20, min_orders=2):
+    df = _legacy_ensure_metrics(df_all_terms)
+    cond_pass = (df["clicks"] >= min_clicks) & (df["orders"] >= min_orders) & (df["acos"] <= target_acos)
+    cond_test = (df["clicks"] >= min_clicks) & (
+        (df["orders"] < min_orders) | ((df["acos"] > target_acos) & (df["acos"] <= target_acos + 0.10))
+    )
+    cond_fail = (df["clicks"] >= min_clicks) & (df["orders"] < min_orders) & (df["acos"] > target_acos + 0.10)
+    df_dec = df.copy()
+    df_dec["decision"] = pd.Series("样本不足", index=df_dec.index)
+    df_dec.loc[cond_pass, "decision"] = "拆词建Exact"
+    df_dec.loc[cond_test, "decision"] = "继续测试"
+    df_dec.loc[cond_fail, "decision"] = "降价/否定"
+    df_pass = df_dec[df_dec["decision"]=="拆词建Exact"].sort_values(["acos","clicks"], ascending=[True, False])
+    rows = []
+    for _, r in df_pass.iterrows():
+        kw = str(r.get("search_term","")).strip()
+        base_cpc = r.get("cpc", 0.3) or 0.3
+        rows.append({"Keyword": kw, "Start Bid": max(0.05, round(base_cpc * 1.00, 2))})
+    return df_dec, pd.DataFrame(rows)
+
+# ---------- 基准 ----------
+def _timeit(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return time.perf_counter() - t0, out
+
+def bench_v11(sizes, legacy_max=100_000, seed=0):
+    cfg = load_config()
+    cfg["bids"] = dict(cfg.get("bids") or {}, enabled=False)   # 与旧版的 Start Bid 规则对照
+    print(f"{'rows':>10} | {'legacy (s)':>10} | {'columnar (s)':>12} | {'speedup':>8}")
+    for n in sizes:
+        # 仅保留原始指标列，让两种实现都从头计算 ctr/cpc/acos/cvr
+        std = standardize_df(make_synthetic_report(n, seed=seed), cfg)
+        std = std.drop(columns=["ctr","cpc","acos","cvr"])
+        t_new, out_new = _timeit(_build_v11_decision_tables, std, cfg)
+        if n <= legacy_max:
+            t_old, (dec_old, skag_old) = _timeit(_legacy_build_v11, std)
+            assert (dec_old["decision"].to_numpy() == out_new[0]["decision"].to_numpy()).all()
+            # 半分位（如 0.435）时 round() 与 np.round 可能相差 1 分
+            assert np.allclose(skag_old["Start Bid"].to_numpy(dtype=float) if len(skag_old) else [],
+                               out_new[4]["Start Bid"].to_numpy(dtype=float), rtol=0, atol=0.0101)
+            print(f"{n:>10} | {t_old:>10.3f} | {t_new:>12.3f} | {t_old / max(t_new, 1e-9):>7.1f}x")
+        else:
+            print(f"{n:>10} | {'skipped':>10} | {t_new:>12.3f} | {'-':>8}")
+
+def memory_report(rows, seed=0):
+    """标准化数据的内存占用（按每百万行折算）：旧版 object/float64 vs 紧凑 dtype。"""
+    cfg = load_config()
+    raw = make_synthetic_report(rows, seed=seed)
+    old = _legacy_standardize_df(raw, cfg)
+    new = standardize_df(raw, cfg)
+    new = new[[c for c in new.columns if c in old.columns]]   # 只比较两版共有的列（不含贝叶斯平滑等派生列）
+    scale = 1_000_000 / rows / 1024 / 1024
+    print(f"{'column':>12} | {'legacy MB/1M':>12} | {'compact MB/1M':>13} | dtype")
+    for c in new.columns:
+        print(f"{c:>12} | {_frame_nbytes(old[c]) * scale:>12.1f} | {_frame_nbytes(new[c]) * scale:>13.1f} | {new[c].dtype.name}")
+    t_old, t_new = _frame_nbytes(old) * scale, _frame_nbytes(new) * scale
+    print(f"{'total':>12} | {t_old:>12.1f} | {t_new:>13.1f} | {t_old / max(t_new, 1e-9):.1f}x smaller")
+
+# ---------- 分阶段基准 ----------
+# (名称, 函数(原始报表, 标准化数据, cfg))；calculate_metrics 内部也会调用扫描与词库建议，这里单独计时便于定位
+STAGES = [
+    ("standardize_df",            lambda raw, std, cfg: standardize_df(raw, cfg)),
+    ("scan_potential_negatives",  lambda raw, std, cfg: scan_potential_negatives(std, cfg)),
+    ("suggest_lexicon_updates",   lambda raw, std, cfg: suggest_lexicon_updates(std, cfg)),
+    ("calculate_metrics",         lambda raw, std, cfg: calculate_metrics_from_std(std, cfg)),
+    ("v11_decision_tables",       lambda raw, std, cfg: _build_v11_decision_tables(std, cfg, **v11_thresholds(cfg))),
+]
+
+def _peak_mb(fn, *args) -> float:
+    """fn 运行期间 tracemalloc 记录的新增内存峰值（MB；numpy / pandas 缓冲区也计入）。"""
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        fn(*args)
+        return (tracemalloc.get_traced_memory()[1] - base) / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+def bench_stages(sizes, seed=0, repeat=1, memory=True, cfg_path="config.yaml", **gen) -> dict:
+    """
+    每个行数、每个阶段：墙钟时间（repeat 次取最小）与峰值内存（单独再跑一次 tracemalloc，避免拖慢计时）。
+    返回 {"meta": …, "results": {行数: {阶段: {"seconds", "peak_mb"}}}}。
+    """
+    cfg = load_config(cfg_path)
+    results = {}
+    print(f"{'rows':>10} | {'stage':<26} | {'seconds':>9} | {'peak MB':>9}")
+    for n in sizes:
+        raw = make_synthetic_report(n, seed=seed, **gen)
+        std = standardize_df(raw, cfg)
+        res = results[str(n)] = {}
+        for name, fn in STAGES:
+            secs = min(_timeit(fn, raw, std, cfg)[0] for _ in range(max(1, repeat)))
+            peak = _peak_mb(fn, raw, std, cfg) if memory else None
+            res[name] = {"seconds": round(secs, 4), "peak_mb": None if peak is None else round(peak, 1)}
+            print(f"{n:>10} | {name:<26} | {secs:>9.3f} | {'-' if peak is None else f'{peak:9.1f}':>9}")
+        del raw, std
+    meta = {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "machine": platform.machine(), "seed": seed, "generator": gen,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+    return {"meta": meta, "results": results}
+
+def compare_baseline(current: dict, baseline: dict, time_tol: float = 1.25, mem_tol: float = 1.25,
+                     min_seconds: float = 0.05) -> list:
+    """
+    与基线对比，返回回归列表 [(行数, 阶段, 指标, 基线, 当前, 倍数)]。
+    耗时超过基线 × time_tol、峰值内存超过基线 × mem_tol 记为回归；基线耗时 < min_seconds 的阶段只看内存（计时噪声太大）。
+    """
+    regressions = []
+    print(f"{'rows':>10} | {'stage':<26} | {'base s':>8} | {'now s':>8} | {'ratio':>6} | {'base MB':>8} | {'now MB':>8} | {'ratio':>6}")
+    for n, stages in current["results"].items():
+        for name, cur in stages.items():
+            base = (baseline.get("results", {}).get(n) or {}).get(name)
+            if not base:
+                continue
+            t_ratio = cur["seconds"] / max(base["seconds"], 1e-9)
+            m_ratio = (cur["peak_mb"] / max(base["peak_mb"], 1e-9)
+                       if cur.get("peak_mb") is not None and base.get("peak_mb") is not None else None)
+            flag = ""
+            if base["seconds"] >= min_seconds and t_ratio > time_tol:
+                regressions.append((n, name, "seconds", base["seconds"], cur["seconds"], t_ratio))
+                flag += " SLOWER"
+            if m_ratio is not None and base["peak_mb"] >= 1 and m_ratio > mem_tol:
+                regressions.append((n, name, "peak_mb", base["peak_mb"], cur["peak_mb"], m_ratio))
+                flag += " MORE-MEM"
+            m_base = "-" if base.get("peak_mb") is None else f"{base['peak_mb']:.1f}"
+            m_cur = "-" if cur.get("peak_mb") is None else f"{cur['peak_mb']:.1f}"
+            m_txt = "-" if m_ratio is None else f"{m_ratio:.2f}"
+            print(f"{n:>10} | {name:<26} | {base['seconds']:>8.3f} | {cur['seconds']:>8.3f} | {t_ratio:>6.2f} | "
+                  f"{m_base:>8} | {m_cur:>8} | {m_txt:>6}{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="分析流程性能基准")
+    ap.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--stages", action="store_true", help="分阶段基准（耗时 + 峰值内存），可与基线对比")
+    ap.add_argument("--memory", action="store_true", help="输出标准化数据的内存报告（按最大的 --rows 计算）")
+    ap.add_argument("--legacy-max", type=int, default=1_000_000, help="超过该行数时跳过旧版实现")
+    g = ap.add_argument_group("合成报表")
+    g.add_argument("--campaigns", type=int, default=50)
+    g.add_argument("--ad-groups", type=int, default=5)
+    g.add_argument("--zipf", type=float, default=1.1, help="搜索词频次的 Zipf 指数")
+    g.add_argument("--pattern-rate", type=float, default=0.05, help="命中否定词库的搜索词比例")
+    b = ap.add_argument_group("分阶段基准")
+    b.add_argument("--config", default="config.yaml")
+    b.add_argument("--repeat", type=int, default=1, help="每阶段重复次数（取最快一次）")
+    b.add_argument("--no-peak", action="store_true", help="不测峰值内存（省去 tracemalloc 的额外一轮）")
+    b.add_argument("--baseline", default="bench_baseline.json", help="基线 JSON（存在时自动对比）")
+    b.add_argument("--save-baseline", action="store_true", help="把本次结果写入 --baseline")
+    b.add_argument("--json", default=None, help="本次结果另存为 JSON")
+    b.add_argument("--time-tol", type=float, default=1.25)
+    b.add_argument("--mem-tol", type=float, default=1.25)
+    args = ap.parse_args()
+    if args.stages:
+        gen = {"campaigns": args.campaigns, "ad_groups": args.ad_groups,
+               "zipf_a": args.zipf, "pattern_rate": args.pattern_rate}
+        current = bench_stages(args.rows, seed=args.seed, repeat=args.repeat, memory=not args.no_peak,
+                               cfg_path=args.config, **gen)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+        if args.save_baseline:
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+            print(f"baseline saved: {args.baseline}")
+        elif os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            if baseline.get("meta", {}).get("generator") != gen:
+                print("warning: 基线使用了不同的合成报表参数，对比仅供参考")
+            print()
+            regs = compare_baseline(current, baseline, args.time_tol, args.mem_tol)
+            if regs:
+                print(f"{len(regs)} regression(s) vs {args.baseline}")
+                sys.exit(1)
+            print(f"no regressions vs {args.baseline}")
+    elif args.memory:
+        memory_report(max(args.rows), seed=args.seed)
+    else:
+        bench_v11(args.rows, legacy_max=args.legacy_max, seed=args.seed)
@@ -0,0 +1,149 @@
+# ppc_batch.py — 批量处理：多品牌 / 多站点（US/UK/DE/JP…）的 Search Term Report，进程池并行
+# 用法：python ppc_batch.py reports/ --config config.yaml --out batch_out/ [--overrides overrides.yaml] [--workers 8]
+import argparse
+import fnmatch
+import io
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import yaml
+
+from ppc_optimizer_lib import load_config, run_pipeline, validate_config, _deep_merge
+
+REPORT_EXTS = (".csv", ".xlsx")
+
+# ---------- 任务准备 ----------
+def discover_reports(input_dir: str) -> list:
+    """目录下所有 CSV / XLSX 报表（按文件名排序，忽略 Excel 临时文件 ~$*）。"""
+    names = sorted(os.listdir(input_dir))
+    return [
+        os.path.join(input_dir, n) for n in names
+        if n.lower().endswith(REPORT_EXTS) and not n.startswith("~$")
+    ]
+
+def account_name(path_or_name: str) -> str:
+    return os.path.splitext(os.path.basename(str(path_or_name)))[0]
+
+def resolve_account_config(base_cfg: dict, account: str, overrides: dict = None, sidecar: str = None) -> dict:
+    """
+    账户配置 = 基础配置 ← 匹配的 overrides（键为账户名或通配符，按声明顺序依次覆盖）
+               ← 报表旁的同名 YAML（如 brand_uk.csv 旁的 brand_uk.yaml）。
+    """
+    cfg = dict(base_cfg)
+    for pattern, ov in (overrides or {}).items():
+        if fnmatch.fnmatch(account, str(pattern)):
+            cfg = _deep_merge(cfg, ov or {})
+    if sidecar and os.path.exists(sidecar):
+        with open(sidecar, "r", encoding="utf-8") as f:
+            cfg = _deep_merge(cfg, yaml.safe_load(f) or {})
+    return cfg
+
+def _sidecar_path(report_path: str):
+    stem = os.path.splitext(report_path)[0]
+    for ext in (".yaml", ".yml"):
+        if os.path.exists(stem + ext):
+            return stem + ext
+    return None
+
+# ---------- 单个账户（在子进程中执行） ----------
+def process_report(job: dict) -> dict:
+    """
+    处理一份报表并把结果写到 out_dir/<account>/，返回该账户的汇总行。
+    job: {"account", "cfg", "out_dir", "path"} 或用 {"name", "data"(bytes)} 代替 path。
+    结果表在子进程内直接落盘，不回传 DataFrame，避免大对象跨进程序列化。
+    """
+    account, cfg = job["account"], job["cfg"]
+    summary = {"account": account, "status": "ok", "error": ""}
+    t0 = time.perf_counter()
+    try:
+        # 账户配置 = 基础配置 + overrides + 同名 YAML，合并后的结果同样要校验；出错只影响该账户
+        errors, _ = validate_config(cfg)
+        if errors:
+            raise ValueError("配置校验失败：" + "；".join(errors))
+        if job.get("data") is not None:
+            src, name = io.BytesIO(job["data"]), job.get("name") or account
+        else:
+            src, name = job["path"], job["path"]
+        results, v11 = run_pipeline(src, cfg, name=name)
+        df = results["All_Terms"]
+
+        acc_dir = os.path.join(job["out_dir"], account)
+        os.makedirs(acc_dir, exist_ok=True)
+        for table, df_out in list(results.items()) + list(v11.items()):
+            if isinstance(df_out, pd.DataFrame):
+                df_out.to_csv(os.path.join(acc_dir, f"{table}.csv"), index=False, encoding="utf-8-sig")
+
+        spend, sales = float(df["spend"].sum()), float(df["sales"].sum())
+        summary.update({
+            "terms": int(len(df)),
+            "clicks": int(df["clicks"].sum()),
+            "orders": int(df["orders"].sum()),
+            "spend": round(spend, 2),
+            "sales": round(sales, 2),
+            "acos": round(spend / sales, 4) if sales else 0.0,
+        })
+        for table, df_out in list(results.items()) + list(v11.items()):
+            if table not in ("All_Terms", "All_Analyzed") and isinstance(df_out, pd.DataFrame):
+                summary[table] = int(len(df_out))
+    except Exception as e:
+        summary.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    summary["seconds"] = round(time.perf_counter() - t0, 3)
+    return summary
+
+# ---------- 批量入口 ----------
+def run_jobs(jobs: list, workers: int = None) -> pd.DataFrame:
+    """并行执行 process_report；返回按提交顺序排列的跨账户汇总表。"""
+    workers = int(workers or 0) or os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs) or 1))
+    if workers == 1:
+        rows = [process_report(j) for j in jobs]
+    else:
+        # spawn：网页版在多线程的 Streamlit 进程里调用，fork 可能死锁
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            rows = list(pool.map(process_report, jobs))
+    return pd.DataFrame(rows)
+
+def run_batch(input_dir: str, base_cfg: dict, out_dir: str, overrides: dict = None, workers: int = None) -> pd.DataFrame:
+    """处理目录下的全部报表，写出每个账户的结果与 out_dir/summary.csv。"""
+    batch_cfg = base_cfg.get("batch", {}) or {}
+    overrides = _deep_merge(batch_cfg.get("overrides") or {}, overrides or {})
+    jobs = []
+    for path in discover_reports(input_dir):
+        account = account_name(path)
+        jobs.append({
+            "account": account,
+            "path": path,
+            "cfg": resolve_account_config(base_cfg, account, overrides, _sidecar_path(path)),
+            "out_dir": out_dir,
+        })
+    os.makedirs(out_dir, exist_ok=True)
+    summary = run_jobs(jobs, workers=workers if workers is not None else batch_cfg.get("workers"))
+    summary.to_csv(os.path.join(out_dir, "summary.csv"), index=False, encoding="utf-8-sig")
+    return summary
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="批量处理多份 Search Term Report（进程池并行）")
+    ap.add_argument("input_dir", help="报表目录（CSV / XLSX；可在报表旁放同名 .yaml 覆盖配置）")
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--out", default="batch_out")
+    ap.add_argument("--overrides", help="账户级覆盖 YAML：{账户名或通配符: {配置项…}}")
+    ap.add_argument("--workers", type=int, default=None, help="进程数（默认 batch.workers，0 = CPU 核数）")
+    args = ap.parse_args(argv)
+
+    cfg = load_config(args.config)
+    overrides = None
+    if args.overrides:
+        with open(args.overrides, "r", encoding="utf-8") as f:
+            overrides = yaml.safe_load(f) or {}
+    t0 = time.perf_counter()
+    summary = run_batch(args.input_dir, cfg, args.out, overrides=overrides, workers=args.workers)
+    n_err = int((summary.get("status", pd.Series(dtype=object)) == "error").sum())
+    print(summary.to_string(index=False))
+    print(f"\n{len(summary)} 份报表，失败 {n_err} 份，用时 {time.perf_counter() - t0:.1f}s → {os.path.join(args.out, 'summary.csv')}")
+    return 1 if n_err else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,328 @@
+# ppc_bulksheet.py — 生成 Amazon Sponsored Products 批量上传文件（bulksheets 2.0 表头）
+# 来源：Early_Negatives_Upload / Neg_Exact / Neg_Phrase_Roots（否定）、SKAG_Plan（建活动/广告组/关键词）、Bid_Sheet（改价）
+# 可传入从后台下载的现有 bulksheet：补全活动/广告组/关键词 ID，并跳过已经存在的否定词。
+# 按行数上限自动拆成多个文件（同一活动的行不拆开），xlsx 用 ppc_export 的流式写入。
+import io
+import os
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from ppc_optimizer_lib import _find_col
+
+BULK_SHEET = "Sponsored Products Campaigns"
+BULK_COLUMNS = [
+    "Product", "Entity", "Operation", "Campaign ID", "Ad Group ID", "Portfolio ID", "Ad ID", "Keyword ID",
+    "Product Targeting ID", "Campaign Name", "Ad Group Name", "Start Date", "End Date", "Targeting Type",
+    "State", "Daily Budget", "SKU", "Ad Group Default Bid", "Bid", "Keyword Text", "Match Type",
+    "Bidding Strategy", "Placement", "Percentage", "Product Targeting Expression",
+]
+_PRODUCT = "Sponsored Products"
+# bulksheets 2.0 的匹配方式写法；比较时统一为小写、去空格（"Negative Exact" / "negativeExact" → "negativeexact"）
+_MATCH_OUT = {"negativeexact": "negativeExact", "negativephrase": "negativePhrase"}
+
+def _match_key(s) -> np.ndarray:
+    return pd.Series(s, dtype=object).astype(str).str.lower().str.replace(r"\s+", "", regex=True).to_numpy(dtype=object)
+
+def bulk_settings(cfg: dict) -> dict:
+    b = (cfg or {}).get("bulksheet", {}) or {}
+    return {
+        "max_rows": int(b.get("max_rows", 100_000)),
+        "daily_budget": float(b.get("daily_budget", 20.0)),
+        "bidding_strategy": str(b.get("bidding_strategy", "Dynamic bids - down only")),
+        "skus": [str(x) for x in (b.get("skus") or [])],
+        "phrase_roots_scope": str(b.get("phrase_roots_scope", "campaign")).lower(),   # campaign / none
+        "include": [str(x) for x in (b.get("include") or ["negatives", "skag", "bids"])],
+    }
+
+# ---------- 现有 bulksheet（ID 与已有否定词） ----------
+class ExistingBulk:
+    """后台下载的 bulksheet：名称 → ID 映射、现有关键词 ID、现有否定词集合（名称 / 词统一小写比较）。"""
+    def __init__(self, df: pd.DataFrame = None):
+        self.campaign_ids, self.ad_group_ids, self.keyword_ids = {}, {}, {}
+        self.negatives = set()
+        if df is not None and len(df):
+            self._index(df)
+
+    def _index(self, df: pd.DataFrame):
+        cols = list(df.columns)
+        col = lambda *names: _find_col(cols, list(names))
+        c_ent, c_cid, c_aid, c_kid = col("Entity"), col("Campaign ID"), col("Ad Group ID"), col("Keyword ID")
+        c_cname = col("Campaign Name (Informational only)", "Campaign Name")
+        c_aname = col("Ad Group Name (Informational only)", "Ad Group Name")
+        c_text, c_match = col("Keyword Text"), col("Match Type")
+        if not c_ent:
+            raise ValueError("现有 bulksheet 缺少 Entity 列")
+        get = lambda c: df[c].astype(str).str.strip().replace({"nan": ""}).to_numpy() if c else np.full(len(df), "")
+        ent, cid, aid, kid = get(c_ent), get(c_cid), get(c_aid), get(c_kid)
+        cname, aname = get(c_cname), get(c_aname)
+        if c_cname and c_cname != "Campaign Name" and "Campaign Name" in cols:
+            cname = np.where(cname == "", get("Campaign Name"), cname)
+        if c_aname and c_aname != "Ad Group Name" and "Ad Group Name" in cols:
+            aname = np.where(aname == "", get("Ad Group Name"), aname)
+        text = np.char.lower(get(c_text).astype(str))
+        match = _match_key(get(c_match))
+
+        for e, ci, ai, ki, cn, an, t, m in zip(ent, cid, aid, kid, cname, aname, text, match):
+            if e == "Campaign":
+                self.campaign_ids[cn] = ci
+            elif e == "Ad Group":
+                self.ad_group_ids[(cn, an)] = (ci, ai)
+            elif e == "Keyword":
+                self.keyword_ids[(cn, an, t, m)] = (ci, ai, ki)
+            elif e == "Negative Keyword":
+                self.negatives.add((cn, an, t, m))
+            elif e == "Campaign Negative Keyword":
+                self.negatives.add((cn, "", t, m))
+
+def load_existing_bulk(src, name: str = None) -> ExistingBulk:
+    """读取后台下载的 bulksheet（xlsx 取 Sponsored Products Campaigns 表，也支持 CSV）。"""
+    name = str(name or src)
+    if name.lower().endswith(".csv"):
+        df = pd.read_csv(src, dtype=str)
+    else:
+        sheets = pd.read_excel(src, sheet_name=None, dtype=str)
+        df = sheets.get(BULK_SHEET, next(iter(sheets.values())) if sheets else None)
+    return ExistingBulk(df)
+
+# ---------- 生成 ----------
+def _frame(n: int, **cols) -> pd.DataFrame:
+    out = pd.DataFrame({c: cols.get(c, np.full(n, "", dtype=object)) for c in BULK_COLUMNS})
+    out["Product"] = _PRODUCT
+    return out
+
+def _ids(existing: ExistingBulk, campaigns: np.ndarray, ad_groups: np.ndarray):
+    """名称 → ID；现有 bulksheet 里没有的沿用名称作为 ID（新建实体的临时 ID，已有实体则需人工补全）。"""
+    cid = np.array([existing.campaign_ids.get(c, c) for c in campaigns], dtype=object)
+    aid = np.array([existing.ad_group_ids.get((c, a), (None, a))[1] if a else "" for c, a in zip(campaigns, ad_groups)],
+                   dtype=object)
+    missing = int(sum(c not in existing.campaign_ids for c in campaigns))
+    return cid, aid, missing
+
+def _negative_rows(neg: pd.DataFrame, existing: ExistingBulk, stats: dict) -> pd.DataFrame:
+    """neg: campaign / ad_group（空 = 活动级）/ text / match → 去重后的 Negative Keyword 行。"""
+    if neg.empty:
+        return _frame(0)
+    neg = neg.assign(text=neg["text"].astype(str).str.strip(), match=_match_key(neg["match"]))
+    neg = neg[neg["text"] != ""]
+    keys_t = neg["text"].str.lower().to_numpy()
+    camp, adg, match = neg["campaign"].to_numpy(), neg["ad_group"].to_numpy(), neg["match"].to_numpy()
+    # 已存在：同一广告组的同词同匹配，或活动级已否定
+    have = existing.negatives
+    dup = np.fromiter(((c, a, t, m) in have or (c, "", t, m) in have
+                       for c, a, t, m in zip(camp, adg, keys_t, match)), dtype=bool, count=len(neg))
+    keep = ~dup & ~pd.DataFrame({"c": camp, "a": adg, "t": keys_t, "m": match}).duplicated().to_numpy()
+    stats["negatives_skipped_existing"] = stats.get("negatives_skipped_existing", 0) + int(dup.sum())
+    neg = neg[keep]
+    n = len(neg)
+    camp, adg = neg["campaign"].to_numpy(dtype=object), neg["ad_group"].to_numpy(dtype=object)
+    cid, aid, missing = _ids(existing, camp, adg)
+    stats["rows_missing_campaign_id"] = stats.get("rows_missing_campaign_id", 0) + missing
+    return _frame(
+        n,
+        **{
+            "Entity": np.where(adg == "", "Campaign Negative Keyword", "Negative Keyword"),
+            "Operation": np.full(n, "Create", dtype=object),
+            "Campaign ID": cid, "Ad Group ID": aid,
+            "Campaign Name": camp, "Ad Group Name": adg,
+            "State": np.full(n, "enabled", dtype=object),
+            "Keyword Text": neg["text"].to_numpy(dtype=object),
+            "Match Type": neg["match"].map(lambda m: _MATCH_OUT.get(m, m)).to_numpy(dtype=object),
+        },
+    )
+
+def _collect_negatives(results: dict, v11: dict, cfg: dict) -> pd.DataFrame:
+    parts = []
+    early = results.get("Early_Negatives_Upload")
+    if isinstance(early, pd.DataFrame) and not early.empty:
+        parts.append(pd.DataFrame({
+            "campaign": early["Campaign Name"].astype(str), "ad_group": early["Ad Group Name"].astype(str),
+            "text": early["Negative Keyword"], "match": early["Match Type"],
+        }))
+    neg_exact = (v11 or {}).get("Neg_Exact")
+    all_an = (v11 or {}).get("All_Analyzed")
+    if isinstance(neg_exact, pd.DataFrame) and not neg_exact.empty:
+        if "campaign" in neg_exact.columns:
+            loc = neg_exact
+        elif isinstance(all_an, pd.DataFrame) and {"campaign", "ad_group"}.issubset(all_an.columns):
+            loc = all_an.loc[neg_exact.index, ["campaign", "ad_group"]]   # Neg_Exact 与 All_Analyzed 同索引
+        else:
+            loc = None
+        if loc is not None:
+            parts.append(pd.DataFrame({
+                "campaign": loc["campaign"].astype(str).to_numpy(), "ad_group": loc["ad_group"].astype(str).to_numpy(),
+                "text": neg_exact["Negative Term"].to_numpy(), "match": neg_exact["Match Type"].to_numpy(),
+            }))
+    roots = (v11 or {}).get("Neg_Phrase_Roots")
+    if (isinstance(roots, pd.DataFrame) and not roots.empty and bulk_settings(cfg)["phrase_roots_scope"] == "campaign"
+            and isinstance(results.get("All_Terms"), pd.DataFrame)):
+        camps = pd.unique(results["All_Terms"]["campaign"].astype(str))
+        rs = roots["Negative Phrase Root"].astype(str).to_numpy()
+        parts.append(pd.DataFrame({
+            "campaign": np.repeat(camps, len(rs)), "ad_group": "",
+            "text": np.tile(rs, len(camps)), "match": "negative phrase",
+        }))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["campaign", "ad_group", "text", "match"])
+
+def _pct(s: pd.Series) -> np.ndarray:
+    """'30%' / '30%~50%' → 30（取第一个数字）。"""
+    return s.astype(str).str.extract(r"(\d+(?:\.\d+)?)", expand=False).astype(float).fillna(0).to_numpy()
+
+def _skag_rows(skag: pd.DataFrame, existing: ExistingBulk, cfg: dict, stats: dict) -> pd.DataFrame:
+    if skag is None or skag.empty:
+        return _frame(0)
+    b = bulk_settings(cfg)
+    start = datetime.now().strftime("%Y%m%d")
+    frames = []
+    for camp, grp in skag.groupby("Campaign Name", sort=False):
+        camp = str(camp)
+        cid = existing.campaign_ids.get(camp, camp)
+        if camp not in existing.campaign_ids:
+            frames.append(_frame(1, **{
+                "Entity": ["Campaign"], "Operation": ["Create"], "Campaign ID": [cid], "Campaign Name": [camp],
+                "Start Date": [start], "Targeting Type": ["Manual"], "State": ["enabled"],
+                "Daily Budget": [b["daily_budget"]], "Bidding Strategy": [b["bidding_strategy"]],
+            }))
+            pct = int(round(float(np.median(_pct(grp["Top of Search Adj"]))) / 10) * 10) if "Top of Search Adj" in grp else 0
+            if pct > 0:
+                frames.append(_frame(1, **{
+                    "Entity": ["Bidding Adjustment"], "Operation": ["Create"], "Campaign ID": [cid],
+                    "Bidding Strategy": [b["bidding_strategy"]], "Placement": ["Placement Top"], "Percentage": [pct],
+                }))
+        # 已存在的同名广告组不重复创建
+        grp = grp[[(camp, str(a)) not in existing.ad_group_ids for a in grp["Ad Group Name"]]]
+        stats["skag_ad_groups"] = stats.get("skag_ad_groups", 0) + len(grp)
+        n = len(grp)
+        if not n:
+            continue
+        adg = grp["Ad Group Name"].astype(str).to_numpy(dtype=object)
+        bid = grp["Start Bid"].to_numpy(dtype="float64")
+        cids = np.full(n, cid, dtype=object)
+        common = {"Campaign ID": cids, "Ad Group ID": adg, "Operation": np.full(n, "Create", dtype=object),
+                  "State": np.full(n, "enabled", dtype=object)}
+        blocks = [_frame(n, **common, **{"Entity": np.full(n, "Ad Group", dtype=object), "Ad Group Name": adg,
+                                          "Ad Group Default Bid": bid})]
+        for sku in b["skus"]:
+            blocks.append(_frame(n, **common, **{"Entity": np.full(n, "Product Ad", dtype=object),
+                                                  "SKU": np.full(n, sku, dtype=object)}))
+        blocks.append(_frame(n, **common, **{"Entity": np.full(n, "Keyword", dtype=object), "Bid": bid,
+                                              "Keyword Text": grp["Keyword"].astype(str).to_numpy(dtype=object),
+                                              "Match Type": np.full(n, "exact", dtype=object)}))
+        # 每个广告组的 广告组 → 商品广告 → 关键词 相邻排列
+        block = pd.concat(blocks, ignore_index=True)
+        order = np.argsort(np.tile(np.arange(n), len(blocks)), kind="stable")
+        frames.append(block.iloc[order])
+    if not b["skus"]:
+        stats["note"] = "未配置 bulksheet.skus：新建广告组没有商品广告，上传后需补充 SKU 才会投放"
+    return pd.concat(frames, ignore_index=True) if frames else _frame(0)
+
+def _bid_rows(bid_sheet: pd.DataFrame, existing: ExistingBulk, stats: dict) -> pd.DataFrame:
+    """
+    Bid_Sheet 是搜索词级的建议精确出价：只有现有 bulksheet 的同一活动/广告组里有同词的精确关键词（有 Keyword ID）时
+    才转成关键词改价，由 broad / phrase / 自动投放带来的搜索词没有可改价的关键词，计入 bid_updates_without_keyword_id。
+    """
+    if bid_sheet is None or bid_sheet.empty:
+        return _frame(0)
+    keys = zip(bid_sheet["Campaign Name"].astype(str), bid_sheet["Ad Group Name"].astype(str),
+               bid_sheet["Search Term"].astype(str).str.lower(), np.full(len(bid_sheet), "exact"))
+    found = [existing.keyword_ids.get(k) for k in keys]
+    hit = np.fromiter((f is not None for f in found), dtype=bool, count=len(found))
+    stats["bid_updates_without_keyword_id"] = int((~hit).sum())
+    sel = bid_sheet[hit]
+    ids = [f for f in found if f is not None]
+    n = len(sel)
+    return _frame(n, **{
+        "Entity": np.full(n, "Keyword", dtype=object), "Operation": np.full(n, "Update", dtype=object),
+        "Campaign ID": np.array([i[0] for i in ids], dtype=object),
+        "Ad Group ID": np.array([i[1] for i in ids], dtype=object),
+        "Keyword ID": np.array([i[2] for i in ids], dtype=object),
+        "Campaign Name": sel["Campaign Name"].to_numpy(dtype=object),
+        "Ad Group Name": sel["Ad Group Name"].to_numpy(dtype=object),
+        "Bid": sel["Recommended Bid"].to_numpy(dtype="float64"),
+        "Keyword Text": sel["Search Term"].to_numpy(dtype=object),
+        "Match Type": np.full(n, "exact", dtype=object),
+    })
+
+def build_bulksheet(results: dict, v11: dict = None, cfg: dict = None, existing: ExistingBulk = None):
+    """
+    results（calculate_metrics）+ v11（V11_SHEETS 表）→ bulksheet 行（BULK_COLUMNS），同一活动的行相邻。
+    返回 (bulk_df, stats)。没有现有 bulksheet 时：否定词用活动/广告组名称充当 ID（需人工补全），改价行全部跳过。
+    """
+    cfg = cfg or {}
+    existing = existing or ExistingBulk()
+    include = set(bulk_settings(cfg)["include"])
+    stats = {}
+    parts = []
+    if "negatives" in include:
+        parts.append(_negative_rows(_collect_negatives(results, v11, cfg), existing, stats))
+    if "skag" in include:
+        parts.append(_skag_rows((v11 or {}).get("SKAG_Plan"), existing, cfg, stats))
+    if "bids" in include:
+        parts.append(_bid_rows(results.get("Bid_Sheet"), existing, stats))
+    bulk = pd.concat(parts, ignore_index=True) if parts else _frame(0)
+    # 按活动聚在一起（活动内保持生成顺序：新建活动行在其广告组/关键词之前）
+    if len(bulk):
+        first = pd.factorize(bulk["Campaign ID"].astype(str))[0]
+        bulk = bulk.iloc[np.argsort(first, kind="stable")].reset_index(drop=True)
+    stats["rows"] = int(len(bulk))
+    stats.update({f"entity:{k}": int(v) for k, v in bulk["Entity"].value_counts().items()})
+    return bulk, stats
+
+# ---------- 写出 ----------
+def split_bounds(bulk: pd.DataFrame, max_rows: int) -> list:
+    """按行数上限切分为 [(start, stop), …]，尽量只在活动边界处切；单个活动超过上限时才在活动内部切。"""
+    n = len(bulk)
+    if n <= max_rows:
+        return [(0, n)]
+    cid = bulk["Campaign ID"].astype(str).to_numpy()
+    cuts = np.flatnonzero(cid[1:] != cid[:-1]) + 1          # 活动边界
+    bounds, start = [], 0
+    while start < n:
+        limit = start + max_rows
+        if limit >= n:
+            bounds.append((start, n))
+            break
+        i = np.searchsorted(cuts, limit, side="right") - 1
+        stop = int(cuts[i]) if i >= 0 and cuts[i] > start else limit
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+def write_bulksheets(bulk: pd.DataFrame, dest, cfg: dict = None, fmt: str = "xlsx", stem: str = "bulksheet") -> list:
+    """
+    写出到目录 dest（返回文件路径列表）或 zip 文件对象（dest 为可写二进制对象）。
+    超过 bulksheet.max_rows 时拆成 stem_1、stem_2 …；xlsx 用 constant_memory 流式写入。
+    """
+    from ppc_export import export_tables
+    max_rows = bulk_settings(cfg)["max_rows"]
+    bounds = split_bounds(bulk, max_rows)
+    names = [f"{stem}.{fmt}" if len(bounds) == 1 else f"{stem}_{i}.{fmt}" for i in range(1, len(bounds) + 1)]
+
+    def _payload(part):
+        if fmt == "csv":
+            return part.to_csv(index=False).encode("utf-8-sig")
+        return export_tables({BULK_SHEET: part}, "xlsx")
+
+    if isinstance(dest, (str, os.PathLike)):
+        os.makedirs(dest, exist_ok=True)
+        paths = []
+        for (lo, hi), fn in zip(bounds, names):
+            path = os.path.join(dest, fn)
+            part = bulk.iloc[lo:hi]
+            if fmt == "csv":
+                part.to_csv(path, index=False, encoding="utf-8-sig")
+            else:
+                export_tables({BULK_SHEET: part}, "xlsx", dest=path)
+            paths.append(path)
+        return paths
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as zf:
+        for (lo, hi), fn in zip(bounds, names):
+            zf.writestr(fn, _payload(bulk.iloc[lo:hi]))
+    return names
+
+def bulksheet_zip(bulk: pd.DataFrame, cfg: dict = None, fmt: str = "xlsx", stem: str = "bulksheet") -> bytes:
+    buf = io.BytesIO()
+    write_bulksheets(bulk, buf, cfg, fmt=fmt, stem=stem)
+    return buf.getvalue()
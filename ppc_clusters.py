@@ -0,0 +1,212 @@
+# ppc_clusters.py — 搜索词变体聚类：归一化 + 词干 + MinHash/LSH（近线性，几十万搜索词也只需数秒）
+# "brew heater" / "brewing heater" / "heater for brew" 归为同一簇，簇级汇总指标用于按簇做决策与否定词根。
+import numpy as np
+import pandas as pd
+
+from ppc_optimizer_lib import _safe_div_array, compile_config
+
+_MERSENNE = (1 << 61) - 1
+
+def cluster_settings(cfg: dict) -> dict:
+    c = (cfg or {}).get("clusters", {}) or {}
+    return {
+        "enabled": bool(c.get("enabled", True)),
+        "num_perm": int(c.get("num_perm", 32)),
+        "bands": int(c.get("bands", 8)),
+        "min_jaccard": float(c.get("min_jaccard", 0.7)),
+        "min_cluster_terms": int(c.get("min_cluster_terms", 2)),
+        "seed": int(c.get("seed", 1)),
+        "stopwords": ({str(w).lower() for w in c["stopwords"]} if c.get("stopwords")
+                      else compile_config(cfg)["stopwords"]),
+    }
+
+# ---------- 归一化 ----------
+def stem(token: str) -> str:
+    """轻量英文词干（只去常见屈折后缀，不依赖 nltk）：brewing → brew，heaters → heater，batteries → battery。"""
+    w = token
+    if len(w) > 4 and w.endswith("ies"):
+        return w[:-3] + "y"
+    if len(w) > 5 and w.endswith("ing"):
+        w = w[:-3]
+    elif len(w) > 4 and w.endswith("ed") and not w.endswith("eed"):
+        w = w[:-2]
+    elif len(w) > 4 and w.endswith(("ches", "shes", "sses", "xes")):
+        return w[:-2]
+    elif len(w) > 3 and w.endswith("s") and not w.endswith(("ss", "us", "is")):
+        return w[:-1]
+    else:
+        return w
+    # brewing → brew；running → runn → run
+    if len(w) > 3 and w[-1] == w[-2] and w[-1] not in "lsz":
+        w = w[:-1]
+    return w
+
+def _token_sets(terms: pd.Series, stopwords: set):
+    """去重后的搜索词 → (CSR 形式的词干编号集合 indptr / indices, 词干表)。"""
+    toks = terms.str.lower().str.replace(r"[\W_]+", " ", regex=True).str.split()
+    vocab, stems = {}, {}
+    indptr = np.zeros(len(toks) + 1, dtype=np.int64)
+    indices = []
+    for i, tl in enumerate(toks):
+        ids = set()
+        for t in tl:
+            if t in stopwords:
+                continue
+            s = stems.get(t)
+            if s is None:
+                s = stems[t] = stem(t)
+            ids.add(vocab.setdefault(s, len(vocab)))
+        if not ids:   # 全是停用词时退回原词
+            ids = {vocab.setdefault(" ".join(tl), len(vocab))}
+        indices.extend(sorted(ids))
+        indptr[i + 1] = len(indices)
+    return indptr, np.asarray(indices, dtype=np.int64), list(vocab)
+
+# ---------- MinHash / LSH ----------
+def _minhash(indptr: np.ndarray, indices: np.ndarray, n_vocab: int, num_perm: int, seed: int) -> np.ndarray:
+    """每个集合的 MinHash 签名 (n_sets, num_perm)：先对词表算一次哈希矩阵，再按 CSR 分段取最小值。"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE, num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE, num_perm, dtype=np.uint64)
+    x = np.arange(n_vocab, dtype=np.uint64)[:, None] + np.uint64(1)
+    h = (x * a + b) % np.uint64(_MERSENNE)           # uint64 乘法溢出自动取模 2^64，作为哈希足够
+    return np.minimum.reduceat(h[indices], indptr[:-1], axis=0)
+
+def _find(parent: np.ndarray, i: int) -> int:
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+def _candidate_pairs(sig: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """LSH：每个 band 内签名相同的词落入同一桶，桶内每个词与桶首组成候选对；跨 band 去重，返回编码 i * n + j（i < j）。"""
+    n = sig.shape[0]
+    pairs = []
+    for band in range(bands):
+        block = np.ascontiguousarray(sig[:, band * rows:(band + 1) * rows])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        _, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        sorted_inv = inverse[order]
+        starts = np.flatnonzero(np.r_[True, sorted_inv[1:] != sorted_inv[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        lead = np.repeat(order[starts], sizes)
+        mask = lead != order
+        pairs.append(np.stack([lead[mask], order[mask]], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.concatenate(pairs)
+    pairs.sort(axis=1)
+    return np.unique(pairs[:, 0].astype(np.int64) * n + pairs[:, 1])
+
+def cluster_terms(terms, cfg: dict = None) -> tuple:
+    """
+    去重后的搜索词 → (每个词的簇编号 ndarray[int32], 簇签名列表)。
+    LSH 分桶（bands × rows）找候选，桶内每个词只与桶首比较精确 Jaccard（≥ min_jaccard 才合并），
+    候选对数量与词数近似线性；词干集合完全相同的词必然同桶且 Jaccard = 1。
+    合并时两个簇的根也须达到 min_jaccard，簇内不会出现经多次传递才相连的词。
+    """
+    st = cluster_settings(cfg)
+    terms = pd.Series(terms, dtype=object).astype(str)
+    n = len(terms)
+    if n == 0:
+        return np.zeros(0, dtype=np.int32), []
+    indptr, indices, vocab = _token_sets(terms, st["stopwords"])
+    bands = max(1, min(st["bands"], st["num_perm"]))
+    rows = max(1, st["num_perm"] // bands)
+    sig = _minhash(indptr, indices, len(vocab), bands * rows, st["seed"])
+
+    keys = _candidate_pairs(sig, bands, rows)
+    sets = {}
+    def _set(i):
+        a = sets.get(i)
+        if a is None:
+            a = sets[i] = frozenset(indices[indptr[i]:indptr[i + 1]].tolist())
+        return a
+
+    def _sim(i, j):
+        a, b = _set(i), _set(j)
+        inter = len(a & b)
+        return inter / (len(a) + len(b) - inter)
+
+    parent = np.arange(n)
+    min_j = st["min_jaccard"]
+    for i, j in zip((keys // n).tolist(), (keys % n).tolist()):
+        if _sim(i, j) < min_j:
+            continue
+        ri, rj = _find(parent, i), _find(parent, j)
+        # 两个簇的根也须相似，避免 a~b~c~d 逐个传递把不相干的词连成一个大簇
+        if ri != rj and (ri == i and rj == j or _sim(ri, rj) >= min_j):
+            parent[rj] = ri
+    roots = np.fromiter((_find(parent, i) for i in range(n)), dtype=np.int64, count=n)
+    cluster_id = pd.factorize(roots)[0].astype(np.int32)
+    # 簇签名：簇内第一个词的词干集合
+    first = np.unique(cluster_id, return_index=True)[1]
+    labels = [" ".join(sorted(vocab[t] for t in indices[indptr[i]:indptr[i + 1]])) for i in first]
+    return cluster_id, labels
+
+# ---------- 簇级汇总 ----------
+def cluster_keys(s: pd.Series) -> tuple:
+    """(每行编码, 去重后的搜索词)：category 列直接用编码与类别，其它列先 factorize。"""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.cat.codes.to_numpy(), pd.Series(s.cat.categories.astype(str), dtype=object)
+    codes, uniq = pd.factorize(s.astype(str))
+    return codes, pd.Series(uniq, dtype=object)
+
+def assign_clusters(df: pd.DataFrame, cfg: dict = None, clustered: tuple = None):
+    """
+    为每行加 cluster_id（int32；只在去重后的搜索词上聚类），返回 (新 df, 簇签名列表)。
+    clustered 为已在别处（如子进程）对 cluster_keys 的去重搜索词算好的 cluster_terms 结果时直接使用。
+    """
+    codes, uniq = cluster_keys(df["search_term"])
+    cid, labels = clustered if clustered is not None else cluster_terms(uniq, cfg)
+    row_cid = np.where(codes >= 0, cid[np.maximum(codes, 0)] if len(cid) else 0, -1)
+    df = df.copy(deep=False)
+    df["cluster_id"] = row_cid.astype(np.int32)
+    return df, labels
+
+def cluster_table(df: pd.DataFrame, labels: list, cfg: dict = None) -> pd.DataFrame:
+    """
+    簇级汇总（只保留包含 ≥ min_cluster_terms 个不同搜索词的簇，按花费降序）：
+    词数、代表词（点击最多的变体）、样例、各计数指标与比率，以及按 calculate_metrics 阈值给出的簇级动作。
+    """
+    st = cluster_settings(cfg)
+    cfg = cfg or {}
+    num = ["impressions", "clicks", "spend", "sales", "orders"]
+    terms = df["search_term"].astype(str)
+    per_term = (pd.DataFrame({"cluster_id": df["cluster_id"].to_numpy(), "search_term": terms.to_numpy(),
+                              **{c: df[c].to_numpy() for c in num}})
+                .groupby(["cluster_id", "search_term"], sort=False, as_index=False)[num].sum())
+    n_terms = per_term.groupby("cluster_id", sort=False).size()
+    keep = n_terms.index[n_terms.to_numpy() >= st["min_cluster_terms"]]
+    per_term = per_term[per_term["cluster_id"].isin(keep)]
+    if per_term.empty:
+        return pd.DataFrame(columns=["cluster_id", "Cluster", "Representative", "Terms", "Samples"] + num +
+                            ["ctr", "cpc", "acos", "cvr", "Cluster Action"])
+
+    per_term = per_term.sort_values(["cluster_id", "clicks"], ascending=[True, False], kind="stable")
+    g = per_term.groupby("cluster_id", sort=False)
+    out = g[num].sum()
+    out["Terms"] = g.size()
+    out["Representative"] = g["search_term"].first()
+    out["Samples"] = g["search_term"].agg(lambda x: " | ".join(x.iloc[:5]))
+    out = out.reset_index()
+    out["Cluster"] = [labels[i] for i in out["cluster_id"].to_numpy()]
+    out["ctr"] = _safe_div_array(out["clicks"], out["impressions"])
+    out["cpc"] = _safe_div_array(out["spend"], out["clicks"])
+    out["acos"] = _safe_div_array(out["spend"], out["sales"])
+    out["cvr"] = _safe_div_array(out["orders"], out["clicks"])
+
+    target_acos = float(cfg.get("target_acos", 0.50))
+    min_clicks = int(cfg.get("min_clicks", 5))
+    min_conv = int(cfg.get("min_conversions", 1))
+    out["Cluster Action"] = np.select(
+        [(out["clicks"] >= max(30, min_clicks)) & (out["orders"] == 0),
+         (out["acos"] > target_acos) & (out["clicks"] >= min_clicks),
+         (out["acos"] < target_acos) & (out["orders"] >= min_conv)],
+        ["否定词根候选", "降价", "提价"], default="",
+    )
+    cols = ["cluster_id", "Cluster", "Representative", "Terms", "Samples"] + num + ["ctr", "cpc", "acos", "cvr", "Cluster Action"]
+    return out[cols].sort_values("spend", ascending=False, kind="stable").reset_index(drop=True)
@@ -0,0 +1,338 @@
+# ppc_conflicts.py — 否定词冲突检查：拟否定的词 / 词组 / 词根会挡住多少有转化的搜索词（订单、销售额、花费）
+# 转化词索引只建一次：精确（归一化词 → 搜索词）、词组（词 n-gram → 搜索词）、子串（词根 Aho-Corasick 扫描去重后的词表），
+# 每个否定词的查询代价与它命中的转化词数成正比，而不是「否定词数 × 搜索词数」。
+import re
+
+import numpy as np
+import pandas as pd
+
+from ppc_optimizer_lib import compile_config
+
+CONFLICT_COLUMNS = ["Source", "Negative", "Match", "Campaign Name", "Ad Group Name",
+                    "Blocked Terms", "Blocked Orders", "Blocked Sales", "Blocked Spend", "Sample Terms"]
+
+def conflict_settings(cfg: dict) -> dict:
+    c = (cfg or {}).get("conflicts", {}) or {}
+    return {
+        "enabled": bool(c.get("enabled", True)),
+        "min_orders": int(c.get("min_orders", 1)),
+        "fold_plurals": bool(c.get("fold_plurals", True)),
+        "max_ngram": max(1, int(c.get("max_ngram", 4))),
+        "samples": int(c.get("samples", 3)),
+    }
+
+def _fold(token: str) -> str:
+    """复数归一（亚马逊否定精确 / 词组同样覆盖单复数）：heaters → heater，batteries → battery。"""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+def _tokens(text: str, fold: bool) -> tuple:
+    toks = re.sub(r"[\W_]+", " ", str(text).lower()).split()
+    return tuple(_fold(t) for t in toks) if fold else tuple(toks)
+
+class _AhoCorasick:
+    """多模式子串匹配：一次扫描文本即找出所有命中的模式（含重叠），代价与文本长度 + 命中数成正比。"""
+    def __init__(self, patterns: list):
+        self.goto, self.fail, self.out = [{}], [0], [[]]
+        for pid, p in enumerate(patterns):
+            node = 0
+            for ch in p:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = self.goto[node][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(pid)
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, nxt in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0) if node else 0   # 根的子节点失败时回到根
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def finditer(self, text: str):
+        """(模式编号, 结束位置)。"""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                yield pid, i
+
+class ConflictIndex:
+    """
+    转化词（orders ≥ min_orders）的索引，按需构建：
+    - exact：归一化搜索词 → 搜索词编号；phrase：词 n-gram（n ≤ max_ngram）→ 搜索词编号；
+    - 词表：小写原文按空白切出的片段 → 搜索词编号（子串 / 整词词根在片段上用 Aho-Corasick 匹配）；
+    - 每个搜索词的转化行按编号排成 CSR，查询时再按 活动 / 广告组 过滤并汇总指标。
+    """
+    def __init__(self, df: pd.DataFrame, cfg: dict = None):
+        self.st = conflict_settings(cfg)
+        conv = df[df["orders"].to_numpy() >= self.st["min_orders"]]
+        codes, uniq = pd.factorize(conv["search_term"].astype(str))
+        self.terms = np.asarray(uniq, dtype=object)
+        order = np.argsort(codes, kind="stable")
+        self.row_ptr = np.zeros(len(uniq) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(uniq)), out=self.row_ptr[1:])
+        # 范围过滤用整数编码：活动、(活动, 广告组)
+        camp = conv["campaign"].astype(str).to_numpy()[order]
+        adg = conv["ad_group"].astype(str).to_numpy()[order]
+        self.camp, camp_uniq = pd.factorize(camp)
+        self.scope, scope_uniq = pd.factorize(pd.MultiIndex.from_arrays([camp, adg]))
+        self._camp_ids = {c: i for i, c in enumerate(camp_uniq)}
+        self._scope_ids = {k: i for i, k in enumerate(scope_uniq)}
+        self.orders = conv["orders"].to_numpy(dtype="float64")[order]
+        self.sales = conv["sales"].to_numpy(dtype="float64")[order]
+        self.spend = conv["spend"].to_numpy(dtype="float64")[order]
+        self.term_sales = np.add.reduceat(self.sales, self.row_ptr[:-1]) if len(uniq) else np.zeros(0)
+        # 每个搜索词的 [行数, 订单, 销售额, 花费] 合计（整个账户范围的否定直接取用）
+        self.term_totals = np.stack([np.diff(self.row_ptr)] + [np.add.reduceat(v, self.row_ptr[:-1]) if len(uniq) else np.zeros(0)
+                                    for v in (self.orders, self.sales, self.spend)], axis=1).astype("float64")
+        self._norm = [_tokens(t, self.st["fold_plurals"]) for t in self.terms]
+        self._exact = {}
+        for tid, toks in enumerate(self._norm):
+            self._exact.setdefault(toks, []).append(tid)
+        # 每个搜索词的归一化词编号（精确否定批量标注用）
+        self._key_ids = {k: i for i, k in enumerate(self._exact)}
+        self.term_key = np.fromiter((self._key_ids[t] for t in self._norm), dtype=np.int64, count=len(self._norm))
+        self._exact_orders = None
+        self._scoped = None
+        self._phrase = None
+        self._chunks = None
+
+    # ---------- 候选搜索词 ----------
+    def exact_ids(self, text: str) -> np.ndarray:
+        return np.asarray(self._exact.get(_tokens(text, self.st["fold_plurals"]), []), dtype=np.int64)
+
+    def phrase_ids(self, text: str) -> np.ndarray:
+        if self._phrase is None:
+            n_max, idx = self.st["max_ngram"], {}
+            for tid, toks in enumerate(self._norm):
+                seen = set()
+                for n in range(1, min(n_max, len(toks)) + 1):
+                    for i in range(len(toks) - n + 1):
+                        g = toks[i:i + n]
+                        if g not in seen:
+                            seen.add(g)
+                            idx.setdefault(g, []).append(tid)
+            self._phrase = idx
+        q = _tokens(text, self.st["fold_plurals"])
+        if not q:
+            return np.zeros(0, dtype=np.int64)
+        n_max = self.st["max_ngram"]
+        cands = self._phrase.get(q[:n_max], [])
+        if len(q) <= n_max:
+            return np.asarray(cands, dtype=np.int64)
+        # 比索引更长的词组：用前 max_ngram 个词取候选，再逐个确认连续包含
+        k = len(q)
+        return np.asarray([t for t in cands if any(self._norm[t][i:i + k] == q for i in range(len(self._norm[t]) - k + 1))],
+                          dtype=np.int64)
+
+    def root_ids(self, roots: list, word: bool = False) -> list:
+        """
+        一批词根（与 scan_potential_negatives 相同语义：小写原文上的子串，word=True 时为整词 / 整短语）→ 每个词根的搜索词编号。
+        不含空白的词根在去重后的片段词表上用一个 Aho-Corasick 自动机一次扫完；含空白的词根逐个在转化词上匹配。
+        """
+        roots = [str(r).lower() for r in roots]
+        out = [np.zeros(0, dtype=np.int64)] * len(roots)
+        if self._chunks is None:
+            chunk_terms = {}
+            for tid, t in enumerate(self.terms):
+                for ch in set(str(t).lower().split()):
+                    chunk_terms.setdefault(ch, []).append(tid)
+            self._chunks = (list(chunk_terms), list(chunk_terms.values()))
+        chunks, postings = self._chunks
+        single = [i for i, r in enumerate(roots) if r and not any(c.isspace() for c in r)]
+        if single:
+            ac = _AhoCorasick([roots[i] for i in single])
+            hits = [[] for _ in single]
+            for cid, text in enumerate(chunks):
+                matched = set()
+                for pid, end in ac.finditer(text):
+                    if pid in matched:
+                        continue
+                    if word:
+                        start = end - len(roots[single[pid]]) + 1
+                        if (start > 0 and (text[start - 1].isalnum() or text[start - 1] == "_")) or \
+                           (end + 1 < len(text) and (text[end + 1].isalnum() or text[end + 1] == "_")):
+                            continue
+                    matched.add(pid)
+                    hits[pid].append(cid)
+            for pid, cids in enumerate(hits):
+                if cids:
+                    out[single[pid]] = np.unique(np.concatenate([postings[c] for c in cids]))
+        lowered, single = None, set(single)
+        for i, r in enumerate(roots):
+            if r and i not in single:
+                if lowered is None:
+                    lowered = pd.Series(self.terms, dtype=object).str.lower()
+                pat = rf"(?<!\w){re.escape(r)}(?!\w)" if word else re.escape(r)
+                out[i] = np.flatnonzero(lowered.str.contains(pat, regex=True).to_numpy(dtype=bool))
+        return out
+
+    # ---------- 汇总 ----------
+    def _scoped_totals(self) -> tuple:
+        """(范围数, 排序后的 搜索词编号 × 范围数 + 范围编号, 对应的 [行数, 订单, 销售额, 花费])，首次调用时计算。"""
+        if self._scoped is None:
+            n_scope = int(self.scope.max()) + 1 if len(self.scope) else 1
+            tid = np.repeat(np.arange(len(self.terms)), np.diff(self.row_ptr))
+            keys, inv = np.unique(tid * n_scope + self.scope, return_inverse=True)
+            sums = np.stack([np.bincount(inv, weights=w, minlength=len(keys))
+                             for w in (None, self.orders, self.sales, self.spend)], axis=1)
+            self._scoped = (n_scope, keys, sums)
+        return self._scoped
+
+    def blocked_many(self, cands: list, scopes: np.ndarray) -> pd.DataFrame:
+        """
+        一批否定项一次汇总（不逐项查询）：cands[i] 为第 i 项的候选搜索词编号，scopes[i] 为其 (活动, 广告组)
+        范围编号（-1 = 整个账户，-2 = 数据里没有的广告组）。(否定项, 搜索词) 对与按 (搜索词, 范围) 预汇总的指标合并，
+        再按否定项 bincount；返回以否定项编号为索引的 Blocked Terms / Orders / Sales / Spend / Sample Terms，
+        只含挡住了转化行的项。
+        """
+        cols = CONFLICT_COLUMNS[5:]
+        n = len(cands)
+        n_cand = np.fromiter((len(c) for c in cands), dtype=np.int64, count=n)
+        if n_cand.sum() == 0:
+            return pd.DataFrame(columns=cols)
+        prop = np.repeat(np.arange(n), n_cand)
+        tids = np.concatenate([np.asarray(c, dtype=np.int64) for c in cands if len(c)])
+        sc = np.asarray(scopes, dtype=np.int64)[prop]
+        # 整个账户：搜索词合计；限定广告组：(搜索词, 范围) 合计，该范围没有转化行时为 0
+        vals = np.zeros((len(tids), 4))
+        wide = sc == -1
+        vals[wide] = self.term_totals[tids[wide]]
+        scoped = np.flatnonzero(sc >= 0)
+        if len(scoped):
+            n_scope, keys, sums = self._scoped_totals()
+            q = tids[scoped] * n_scope + sc[scoped]
+            pos = np.minimum(np.searchsorted(keys, q), len(keys) - 1)
+            found = keys[pos] == q
+            vals[scoped[found]] = sums[pos[found]]
+        hit = vals[:, 0] > 0
+        if not hit.any():
+            return pd.DataFrame(columns=cols)
+        hp, ht = prop[hit], tids[hit]
+        out = pd.DataFrame({name: np.bincount(hp, weights=vals[hit, k], minlength=n)
+                            for k, name in ((1, "Blocked Orders"), (2, "Blocked Sales"), (3, "Blocked Spend"))})
+        out["Blocked Terms"] = np.bincount(hp, minlength=n)
+        # 每项按销售额取前 samples 个样例词
+        order = np.lexsort((ht, -self.term_sales[ht], hp))   # 同销售额按编号，与逐项查询时一致
+        hp, ht = hp[order], ht[order]
+        rank = np.arange(len(hp)) - np.searchsorted(hp, hp, side="left")
+        sel = rank < self.st["samples"]
+        samples = pd.Series(self.terms[ht[sel]], dtype=object).groupby(hp[sel], sort=False).agg(" | ".join)
+        out["Sample Terms"] = samples.reindex(out.index).fillna("")
+        return out.loc[out["Blocked Orders"] > 0, cols]
+
+    def exact_orders(self) -> tuple:
+        """精确否定批量标注用：(按 (归一化词编号, 范围编号) 汇总的订单, 按归一化词编号汇总的订单)，首次调用时计算。"""
+        if self._exact_orders is None:
+            row_key = np.repeat(self.term_key, np.diff(self.row_ptr))
+            per_scope = (pd.DataFrame({"key": row_key, "scope": self.scope, "orders": self.orders})
+                         .groupby(["key", "scope"])["orders"].sum())
+            self._exact_orders = (per_scope, per_scope.groupby(level="key").sum())
+        return self._exact_orders
+
+    def key_id(self, text: str) -> int:
+        return self._key_ids.get(_tokens(text, self.st["fold_plurals"]), -1)
+
+    def scope_id(self, campaign: str, ad_group: str) -> int:
+        return self._scope_ids.get((campaign, ad_group), -2)
+
+    @property
+    def nbytes(self) -> int:
+        """近似内存占用（FrameCache 计量用）：数组 + 每个搜索词约 200 字节的词表 / 索引。"""
+        arrays = [self.row_ptr, self.camp, self.scope, self.orders, self.sales, self.spend, self.term_sales, self.term_totals, self.term_key]
+        return int(sum(a.nbytes for a in arrays) + 200 * len(self.terms))
+
+def _match_kind(match_type: str) -> str:
+    return "phrase" if "phrase" in str(match_type).lower() else "exact"
+
+def negative_conflicts(df: pd.DataFrame, cfg: dict, early_upload: pd.DataFrame = None,
+                       lexicon: pd.DataFrame = None, index: ConflictIndex = None) -> pd.DataFrame:
+    """
+    Negative_Conflicts：会挡住转化词的拟否定项（只列 Blocked Orders > 0，按 Blocked Sales 降序）。检查对象：
+    - Early_Negatives_Upload：按所在活动 / 广告组，negative exact / phrase；
+    - negatives_scan.phrase_roots：整个账户，词组匹配；
+    - negatives_scan.patterns 的词根与 Lexicon_Suggestions 中 ADD_TO_PATTERNS 的词：整个账户，
+      与早期否定扫描相同的子串 / 整词语义（match_mode）。
+    """
+    st = conflict_settings(cfg)
+    if not st["enabled"] or df is None or len(df) == 0:
+        return pd.DataFrame(columns=CONFLICT_COLUMNS)
+    idx = index or ConflictIndex(df, cfg)
+    meta, cands, scopes = [], [], []
+
+    def _add(source, negative, match, campaign, ad_group, ids):
+        meta.append((source, negative, match, campaign or "", ad_group or ""))
+        cands.append(ids)
+        scopes.append(-1 if campaign is None else idx.scope_id(campaign, ad_group))
+
+    if early_upload is not None and len(early_upload):
+        lookup = {}   # 同一否定词在多个广告组出现时只查一次候选
+        for camp, adg, kw, mt in zip(early_upload["Campaign Name"].astype(str), early_upload["Ad Group Name"].astype(str),
+                                     early_upload["Negative Keyword"].astype(str), early_upload["Match Type"]):
+            kind = _match_kind(mt)
+            ids = lookup.get((kw, kind))
+            if ids is None:
+                ids = lookup[(kw, kind)] = idx.phrase_ids(kw) if kind == "phrase" else idx.exact_ids(kw)
+            _add("Early_Negatives_Upload", kw, f"negative {kind}", camp, adg, ids)
+
+    compiled = compile_config(cfg)
+    for root in compiled["phrase_roots"]:
+        _add("Neg_Phrase_Roots", root, "negative phrase", None, None, idx.phrase_ids(root))
+
+    word = str(((cfg or {}).get("negatives_scan") or {}).get("match_mode", "substring")).lower() == "word"
+    roots, sources = [], []
+    for tag, plist in compiled["patterns"].items():
+        for r in sorted(plist):
+            roots.append(r)
+            sources.append(f"patterns.{tag}")
+    if lexicon is not None and len(lexicon) and "Recommendation" in lexicon.columns:
+        for tok in lexicon.loc[lexicon["Recommendation"] == "ADD_TO_PATTERNS", "Token"].astype(str):
+            roots.append(tok)
+            sources.append("Lexicon_Suggestions")
+    match = "word" if word else "substring"
+    for src, root, ids in zip(sources, roots, idx.root_ids(roots, word)):
+        _add(src, root, match, None, None, ids)
+
+    blocked = idx.blocked_many(cands, np.asarray(scopes, dtype=np.int64))
+    if blocked.empty:
+        return pd.DataFrame(columns=CONFLICT_COLUMNS)
+    head = pd.DataFrame([meta[i] for i in blocked.index], columns=CONFLICT_COLUMNS[:5], index=blocked.index)
+    return (pd.concat([head, blocked], axis=1)
+            .sort_values(["Blocked Sales", "Blocked Orders"], ascending=False, kind="stable")
+            .reset_index(drop=True))
+
+def annotate_exact_negatives(neg_exact: pd.DataFrame, scope: pd.DataFrame, df: pd.DataFrame, cfg: dict,
+                             index: ConflictIndex = None) -> pd.DataFrame:
+    """
+    v1.1 Neg_Exact 加两列：Blocked Orders（该否定在所在广告组会挡住的转化订单，含单复数变体）与
+    Orders Elsewhere（同一归一化词在其它广告组的订单，提示「别处在出单」）。scope 为与 neg_exact 同索引的 campaign / ad_group。
+    index 为分析阶段已建好的 ConflictIndex（results["Conflict_Index"]）时直接复用，调阈值重算时不再重建。
+    """
+    neg_exact = neg_exact.copy()
+    if not conflict_settings(cfg)["enabled"] or neg_exact.empty:
+        neg_exact["Blocked Orders"] = np.zeros(len(neg_exact))
+        neg_exact["Orders Elsewhere"] = np.zeros(len(neg_exact))
+        return neg_exact
+    idx = index or ConflictIndex(df, cfg)
+    # 转化行已按 (归一化词, 活动 + 广告组) 汇总，否定词按同样的键合并，不逐条查询
+    per_scope, per_key = idx.exact_orders()
+    keys = np.fromiter((idx.key_id(t) for t in neg_exact["Negative Term"].astype(str)), dtype=np.int64, count=len(neg_exact))
+    scopes = np.fromiter((idx.scope_id(c, a) for c, a in zip(scope["campaign"].astype(str), scope["ad_group"].astype(str))),
+                         dtype=np.int64, count=len(neg_exact))
+    here = per_scope.reindex(pd.MultiIndex.from_arrays([keys, scopes])).fillna(0.0).to_numpy()
+    neg_exact["Blocked Orders"] = here
+    neg_exact["Orders Elsewhere"] = per_key.reindex(keys).fillna(0.0).to_numpy() - here
+    return neg_exact
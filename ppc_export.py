@@ -0,0 +1,128 @@
+# ppc_export.py — 导出层：xlsx（xlsxwriter constant_memory 流式写入）/ CSV 压缩包 / Parquet 压缩包
+import io
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+XLSX_MAX_ROWS = 1_048_576          # 单个 sheet 行数上限（含表头）
+_XLSX_CHUNK_ROWS = 50_000          # 每次转换为 Python 对象的行数（控制峰值内存）
+
+EXPORT_FORMATS = {
+    # fmt: (扩展名, MIME, 说明)
+    "xlsx":    (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "Excel（流式写入）"),
+    "csv_zip": (".zip",  "application/zip", "CSV 压缩包（每张表一个 CSV）"),
+    "parquet": (".zip",  "application/zip", "Parquet 压缩包（每张表一个 .parquet）"),
+}
+
+def parquet_available() -> bool:
+    for mod in ("pyarrow", "fastparquet"):
+        try:
+            __import__(mod)
+            return True
+        except ImportError:
+            continue
+    return False
+
+def available_formats() -> list:
+    return [f for f in EXPORT_FORMATS if f != "parquet" or parquet_available()]
+
+# ---------- xlsx ----------
+def _cell_rows(df: pd.DataFrame, start: int, stop: int) -> list:
+    """把 df[start:stop] 转为行列表：缺失值 → None（空单元格），category → 原字符串。"""
+    part = df.iloc[start:stop]
+    cols = []
+    for c in part.columns:
+        s = part[c]
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            v = s.to_numpy(dtype="float64", na_value=np.nan).astype(object)
+            v[pd.isna(s).to_numpy()] = None
+        else:
+            v = s.astype(object).to_numpy(copy=True)
+            v[pd.isna(v)] = None
+        cols.append(v)
+    return list(zip(*cols)) if cols else []
+
+def write_xlsx_streaming(tables: dict, dest):
+    """
+    xlsxwriter constant_memory 模式逐行写出：每个 sheet 写完即落盘，内存只保留当前行。
+    超过 Excel 行数上限的表自动拆成 Name、Name_2、Name_3…
+    dest 为路径或二进制文件对象。
+    """
+    import xlsxwriter
+
+    wb = xlsxwriter.Workbook(dest, {
+        "constant_memory": True,
+        "strings_to_formulas": False,   # 以 = 开头的搜索词按文本写入
+        "strings_to_urls": False,
+        "nan_inf_to_errors": True,
+    })
+    try:
+        used = set()
+        for name, df in tables.items():
+            if not isinstance(df, pd.DataFrame):
+                continue
+            n = len(df)
+            per_sheet = XLSX_MAX_ROWS - 1
+            for part_no, start in enumerate(range(0, max(n, 1), per_sheet), start=1):
+                base = str(name)[:31] if part_no == 1 else f"{str(name)[:27]}_{part_no}"
+                sheet, k = base, 2
+                while sheet.lower() in used:   # Excel 工作表名不区分大小写
+                    sheet = f"{base[:28]}_{k}"
+                    k += 1
+                used.add(sheet.lower())
+                ws = wb.add_worksheet(sheet)
+                ws.write_row(0, 0, [str(c) for c in df.columns])
+                stop = min(start + per_sheet, n)
+                row_no = 1
+                for c0 in range(start, stop, _XLSX_CHUNK_ROWS):
+                    for row in _cell_rows(df, c0, min(c0 + _XLSX_CHUNK_ROWS, stop)):
+                        ws.write_row(row_no, 0, row)
+                        row_no += 1
+    finally:
+        wb.close()
+
+# ---------- CSV / Parquet 压缩包 ----------
+def write_csv_zip(tables: dict, dest):
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, df in tables.items():
+            if isinstance(df, pd.DataFrame):
+                with zf.open(f"{name}.csv", "w") as fh:
+                    text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+                    df.to_csv(text, index=False)
+                    text.flush()
+                    text.detach()
+
+def write_parquet_zip(tables: dict, dest):
+    if not parquet_available():
+        raise ImportError("Parquet 导出需要安装 pyarrow（pip install pyarrow）")
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_STORED) as zf:   # parquet 自带压缩
+        for name, df in tables.items():
+            if isinstance(df, pd.DataFrame):
+                with zf.open(f"{name}.parquet", "w") as fh:
+                    df.reset_index(drop=True).to_parquet(fh, index=False)
+
+_WRITERS = {
+    "xlsx": write_xlsx_streaming,
+    "csv_zip": write_csv_zip,
+    "parquet": write_parquet_zip,
+}
+
+def export_tables(tables: dict, fmt: str = "xlsx", dest=None):
+    """
+    按格式导出一组表。dest 为路径时直接写文件并返回路径；为 None 时返回 bytes。
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"不支持的导出格式：{fmt}（可选 {', '.join(_WRITERS)}）")
+    if dest is not None:
+        if isinstance(dest, (str, os.PathLike)):
+            os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        _WRITERS[fmt](tables, dest)
+        return dest
+    buf = io.BytesIO()
+    _WRITERS[fmt](tables, buf)
+    return buf.getvalue()
+
+def export_filename(stem: str, fmt: str) -> str:
+    return f"{stem}{EXPORT_FORMATS[fmt][0]}"
@@ -0,0 +1,170 @@
+# ppc_instrument.py — 轻量埋点：阶段计时、行数 / 字节计数，可选 cProfile 与 tracemalloc，结果可输出为 JSON 日志
+# 与 ppc_optimizer_lib._stage 配合：把 Instrument 当作 timings 传入 run_pipeline / calculate_metrics_from_std，
+# 各阶段（含 analyze/scan_negatives 这类子阶段）自动记录；只传普通 dict 时行为与以前一样（阶段名 → 秒）。
+import cProfile
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger("ppc.instrument")
+
+def instrument_settings(cfg: dict) -> dict:
+    d = (cfg or {}).get("diagnostics", {}) or {}
+    return {
+        "profile": bool(d.get("profile", False)),
+        "trace_memory": bool(d.get("trace_memory", False)),
+        "json_log": d.get("json_log") or None,
+        "profile_top": int(d.get("profile_top", 30)),
+    }
+
+class Instrument:
+    """
+    一次运行的埋点记录。stage(name) 为上下文管理器，可嵌套（子阶段名为 "父/子"），yield 的记录字典里
+    可写入 rows_out 等计数；profile=True 时整个运行期间开启 cProfile，trace_memory=True 时记录每个阶段的
+    tracemalloc 峰值（会拖慢纯 Python 代码，默认关闭）。listener(name, depth) 在阶段开始时回调（进度条用）。
+    """
+    def __init__(self, label: str = None, profile: bool = False, trace_memory: bool = False, listener=None):
+        self.label = label
+        self.records = []
+        self.listener = listener
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self._local = threading.local()   # 阶段栈按线程保存（ppc_stages 并发执行子阶段）
+        self._lock = threading.Lock()
+        self._profiler = cProfile.Profile() if profile else None
+        self._own_tracemalloc = False
+
+    @classmethod
+    def from_config(cls, cfg: dict, label: str = None, listener=None, profile: bool = None, trace_memory: bool = None):
+        """diagnostics 段的开关；显式传入的 profile / trace_memory（非 None）优先。"""
+        st = instrument_settings(cfg)
+        return cls(label, profile=st["profile"] if profile is None else profile,
+                   trace_memory=st["trace_memory"] if trace_memory is None else trace_memory, listener=listener)
+
+    # ---------- 阶段 ----------
+    @property
+    def _stack(self) -> list:
+        return self._local.__dict__.setdefault("stack", [])
+
+    @property
+    def requires_serial(self) -> bool:
+        """cProfile 只采集开启它的线程，tracemalloc 峰值是进程级的：开启任一项时阶段应串行执行。"""
+        return self._profiler is not None or self.trace_memory
+
+    def current_path(self) -> list:
+        return [f["name"] for f in self._stack]
+
+    @contextmanager
+    def adopt(self, path: list):
+        """在工作线程中沿用调用线程的阶段路径（不重复计时，只影响子阶段的名称与层级）。"""
+        saved = self._local.__dict__.get("stack")
+        self._local.stack = [{"name": n, "peak": 0} for n in path]
+        try:
+            yield
+        finally:
+            self._local.stack = saved if saved is not None else []
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None, nbytes: int = None):
+        full = "/".join([f["name"] for f in self._stack] + [name])
+        rec = {"stage": full, "depth": len(self._stack), "seconds": 0.0,
+               "rows_in": rows, "rows_out": None, "bytes": nbytes, "peak_mb": None}
+        with self._lock:
+            self.records.append(rec)
+        if self.listener is not None:
+            self.listener(full, rec["depth"])
+        if not self._stack:
+            self._start()
+        frame = {"name": name, "peak": 0}
+        if self.trace_memory:
+            if self._stack:   # 父阶段到此为止的峰值先记下，再为子阶段重置
+                parent = self._stack[-1]
+                parent["peak"] = max(parent["peak"], tracemalloc.get_traced_memory()[1])
+            frame["base"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["seconds"] += time.perf_counter() - t0
+            self._stack.pop()
+            if self.trace_memory:
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                rec["peak_mb"] = round((peak - frame["base"]) / 1024 / 1024, 2)
+                if self._stack:
+                    self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+                tracemalloc.reset_peak()
+            if not self._stack:
+                self._stop()
+
+    def _start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracemalloc = True
+        if self._profiler is not None:
+            self._profiler.enable()
+
+    def _stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+            self._own_tracemalloc = False
+
+    # ---------- 结果 ----------
+    @property
+    def timings(self) -> dict:
+        """顶层阶段耗时 {阶段: 秒}（同名阶段累加），与旧的 timings 字典一致。"""
+        out = {}
+        for r in self.records:
+            if r["depth"] == 0:
+                out[r["stage"]] = out.get(r["stage"], 0.0) + r["seconds"]
+        return out
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.timings.values())
+
+    def table(self):
+        """阶段明细 DataFrame：阶段、耗时、占比、行数、字节、峰值内存（子阶段缩进显示）。"""
+        import pandas as pd
+        total = self.total_seconds or 1e-9
+        return pd.DataFrame([{
+            "stage": "  " * r["depth"] + r["stage"].rsplit("/", 1)[-1],
+            "seconds": round(r["seconds"], 4),
+            "share": r["seconds"] / total,
+            "rows_in": r["rows_in"], "rows_out": r["rows_out"],
+            "MB": None if r["bytes"] is None else round(r["bytes"] / 1024 / 1024, 2),
+            "peak_MB": r["peak_mb"],
+        } for r in self.records])
+
+    def profile_text(self, top: int = 30, sort: str = "cumulative") -> str:
+        if self._profiler is None:
+            return ""
+        buf = io.StringIO()
+        pstats.Stats(self._profiler, stream=buf).strip_dirs().sort_stats(sort).print_stats(top)
+        return buf.getvalue()
+
+    def to_dict(self) -> dict:
+        return {
+            "event": "ppc_run",
+            "label": self.label,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "total_seconds": round(self.total_seconds, 4),
+            "stages": [dict(r, seconds=round(r["seconds"], 4)) for r in self.records],
+        }
+
+    def emit(self, path: str = None, **extra) -> str:
+        """一行 JSON：写到 logging（logger "ppc.instrument"，INFO），给了 path 时再追加到该 JSONL 文件。"""
+        line = json.dumps(dict(self.to_dict(), **extra), ensure_ascii=False, default=str)
+        logger.info(line)
+        if path:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return line
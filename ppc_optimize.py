@@ -0,0 +1,173 @@
+# ppc_optimize.py — 无界面命令行（不导入 streamlit；仅在需要时才加载 openpyxl / xlsxwriter）
+# 用法：
+#   python ppc_optimize.py run report.csv [more.csv …] --config config.yaml --out out/ [--format csv|xlsx|csv_zip|parquet] [--timings]
+#                          [--bulksheet [--existing-bulk bulk.xlsx]] [--profile] [--trace-memory] [--json-log runs.jsonl] [--serial]
+#   python ppc_optimize.py batch reports/ --config config.yaml --out batch_out/ [--workers 8]
+#   python ppc_optimize.py history ingest|window|info …（历史库，见 ppc_store.py）
+#   python ppc_optimize.py check-config --config config.yaml（重复键 / 类型 / 未知配置项检查）
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from ppc_optimizer_lib import load_config, run_pipeline, _stage
+from ppc_instrument import Instrument, instrument_settings
+
+def write_tables(tables: dict, out_dir: str, fmt: str = "csv", stem: str = None):
+    """
+    fmt=csv：每张表写一个 CSV（utf-8-sig，Excel 直接打开不乱码）；
+    其它格式（xlsx / csv_zip / parquet）经 ppc_export 写成一个文件 out_dir/<stem>.<ext>。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if fmt == "csv":
+        for name, df in tables.items():
+            if not isinstance(df, pd.DataFrame):   # 如 Conflict_Index
+                continue
+            df.to_csv(os.path.join(out_dir, f"{name}.csv"), index=False, encoding="utf-8-sig")
+        return
+    from ppc_export import export_tables, export_filename
+    export_tables(tables, fmt, dest=os.path.join(out_dir, export_filename(stem, fmt)))
+
+def _print_timings(label: str, inst: Instrument):
+    print(f"⏱  {label}", file=sys.stderr)
+    for r in inst.records:
+        name = "  " * r["depth"] + r["stage"].rsplit("/", 1)[-1]
+        rows_in = "" if r["rows_in"] is None else f"{r['rows_in']:,}"
+        rows_out = "" if r["rows_out"] is None else f"→ {r['rows_out']:,}"
+        rows = f"{rows_in:>10} {rows_out:<12}"
+        peak = f"  peak {r['peak_mb']:.1f} MB" if r["peak_mb"] is not None else ""
+        print(f"   {name:<22} {r['seconds']:8.3f}s  {rows}{peak}", file=sys.stderr)
+    print(f"   {'total':<22} {inst.total_seconds:8.3f}s", file=sys.stderr)
+
+def write_bulk(results: dict, v11: dict, cfg: dict, out_dir: str, existing=None):
+    """Amazon 批量上传文件 → out_dir/bulksheet/（超过 bulksheet.max_rows 自动拆分）。"""
+    from ppc_bulksheet import build_bulksheet, write_bulksheets
+    bulk, stats = build_bulksheet(results, v11, cfg, existing)
+    return write_bulksheets(bulk, os.path.join(out_dir, "bulksheet"), cfg), stats
+
+def cmd_run(args) -> int:
+    cfg = load_config(args.config)
+    if args.serial:
+        cfg["stages"] = dict(cfg.get("stages") or {}, executor="serial")
+    existing = None
+    if args.existing_bulk:
+        from ppc_bulksheet import load_existing_bulk
+        existing = load_existing_bulk(args.existing_bulk)
+    multi = len(args.reports) > 1
+    failed = 0
+    for path in args.reports:
+        account = os.path.splitext(os.path.basename(path))[0]
+        out_dir = os.path.join(args.out, account) if multi else args.out
+        timings = Instrument.from_config(cfg, label=path, profile=args.profile or None, trace_memory=args.trace_memory or None)
+        try:
+            results, v11 = run_pipeline(
+                path, cfg, name=path, timings=timings,
+                target_acos=args.target_acos, min_clicks=args.min_clicks, min_orders=args.min_orders,
+            )
+            with _stage(timings, "export"):
+                fmt = "xlsx" if args.excel else args.format
+                write_tables(results, out_dir, fmt, stem="ppc_output")
+                write_tables(v11, out_dir if fmt != "csv" else os.path.join(out_dir, "v11"), fmt, stem="ppc_actions")
+            if args.bulksheet:
+                with _stage(timings, "bulksheet"):
+                    paths, bulk_stats = write_bulk(results, v11, cfg, out_dir, existing)
+                print(f"📦 bulksheet：{bulk_stats['rows']} 行 → {len(paths)} 个文件（{os.path.join(out_dir, 'bulksheet')}）"
+                      + (f" ｜ {bulk_stats['note']}" if bulk_stats.get("note") else ""))
+        except Exception as e:
+            failed += 1
+            print(f"❌ {path}: {type(e).__name__}: {e}", file=sys.stderr)
+            continue
+        print(f"✅ {path} → {out_dir} | 拆词建Exact {len(v11['To_Exact_Split'])} ｜ 继续测试 {len(v11['Keep_Testing'])} ｜ "
+              f"降价/否定 {len(v11['BidDown_or_Neg'])} ｜ 早期否定 {len(results['Early_Negatives_Upload'])}")
+        if args.timings:
+            _print_timings(path, timings)
+        if args.profile:
+            print(timings.profile_text(instrument_settings(cfg)["profile_top"]), file=sys.stderr)
+        json_log = args.json_log or instrument_settings(cfg)["json_log"]
+        if json_log:
+            timings.emit(json_log, rows=len(results["All_Terms"]))
+    return 1 if failed else 0
+
+def cmd_batch(args) -> int:
+    from ppc_batch import main as batch_main
+    argv = [args.input_dir, "--config", args.config, "--out", args.out]
+    if args.overrides:
+        argv += ["--overrides", args.overrides]
+    if args.workers is not None:
+        argv += ["--workers", str(args.workers)]
+    return batch_main(argv)
+
+def cmd_history(args) -> int:
+    from ppc_store import main as store_main
+    return store_main(args.history_args)
+
+def cmd_check_config(args) -> int:
+    import yaml
+    from ppc_optimizer_lib import _UniqueKeyLoader, validate_config
+    try:
+        with open(args.config, encoding="utf-8") as f:
+            cfg = yaml.load(f, Loader=_UniqueKeyLoader) or {}
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        print(f"❌ {args.config}: {e}", file=sys.stderr)
+        return 1
+    errors, warnings = validate_config(cfg)
+    for w in warnings:
+        print(f"⚠️  {w}", file=sys.stderr)
+    for e in errors:
+        print(f"❌ {e}", file=sys.stderr)
+    if not errors:
+        print(f"✅ {args.config} 校验通过" + (f"（{len(warnings)} 条警告）" if warnings else ""))
+    return 1 if errors else 0
+
+def main(argv=None) -> int:
+    t0 = time.perf_counter()
+    ap = argparse.ArgumentParser(prog="ppc-optimize", description="Amazon PPC Optimizer 命令行（无 Streamlit）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    ap_run = sub.add_parser("run", help="分析一份或多份报表（同一进程内依次处理）")
+    ap_run.add_argument("reports", nargs="+", help="Search Term Report（CSV / XLSX）")
+    ap_run.add_argument("--config", default="config.yaml")
+    ap_run.add_argument("--out", default="out")
+    ap_run.add_argument("--format", default="csv", choices=["csv", "xlsx", "csv_zip", "parquet"],
+                        help="输出格式：csv（每表一个文件）/ xlsx（流式写入）/ csv_zip / parquet（需要 pyarrow）")
+    ap_run.add_argument("--excel", action="store_true", help="等同 --format xlsx")
+    ap_run.add_argument("--timings", action="store_true", help="打印每个阶段（含分析子阶段）的耗时与行数")
+    ap_run.add_argument("--profile", action="store_true", help="cProfile 整个流程，打印最耗时的函数")
+    ap_run.add_argument("--trace-memory", action="store_true", help="tracemalloc 记录每个阶段的峰值内存（较慢）")
+    ap_run.add_argument("--serial", action="store_true", help="分析子阶段逐个执行（不并发，便于排查 / 对比耗时）")
+    ap_run.add_argument("--json-log", default=None, help="每份报表追加一行 JSON 运行记录（默认读 config 的 diagnostics.json_log）")
+    ap_run.add_argument("--target-acos", type=float, default=None, help="v1.1 目标 ACOS（默认读 config 的 v11 段）")
+    ap_run.add_argument("--min-clicks", type=int, default=None)
+    ap_run.add_argument("--min-orders", type=int, default=None)
+    ap_run.add_argument("--bulksheet", action="store_true", help="同时生成 Amazon SP 批量上传文件（bulksheets 2.0）")
+    ap_run.add_argument("--existing-bulk", default=None,
+                        help="后台下载的现有 bulksheet：补全 ID、跳过已存在的否定词（改价需要它提供 Keyword ID）")
+    ap_run.set_defaults(func=cmd_run)
+
+    ap_batch = sub.add_parser("batch", help="并行处理目录下的全部报表（见 ppc_batch.py）")
+    ap_batch.add_argument("input_dir")
+    ap_batch.add_argument("--config", default="config.yaml")
+    ap_batch.add_argument("--out", default="batch_out")
+    ap_batch.add_argument("--overrides")
+    ap_batch.add_argument("--workers", type=int, default=None)
+    ap_batch.set_defaults(func=cmd_batch)
+
+    ap_hist = sub.add_parser("history", help="历史库：ingest 增量写入 / window 按时间窗分析 / info（见 ppc_store.py）",
+                             add_help=False)
+    ap_hist.add_argument("history_args", nargs=argparse.REMAINDER)
+    ap_hist.set_defaults(func=cmd_history)
+
+    ap_check = sub.add_parser("check-config", help="校验 config.yaml（重复键、类型、取值范围、未知配置项）")
+    ap_check.add_argument("--config", default="config.yaml")
+    ap_check.set_defaults(func=cmd_check_config)
+
+    args = ap.parse_args(argv)
+    rc = args.func(args)
+    if getattr(args, "timings", False):
+        print(f"⏱  process total {time.perf_counter() - t0:.3f}s", file=sys.stderr)
+    return rc
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,110 +1,739 @@
 # ppc_optimizer_lib.py
+import io
+import os
 import re
+import json
+import copy
+import hashlib
+import logging
+import threading
+import time
 import yaml
+import numpy as np
 import pandas as pd
-from collections import Counter
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from statistics import NormalDist
+from pandas.api.types import is_numeric_dtype
 
 # ---------- 配置 ----------
+_config_log = logging.getLogger("ppc.config")
+
+class _UniqueKeyLoader(yaml.SafeLoader):
+    """同一层出现重复键时报错（yaml.safe_load 会静默保留后一个，整段配置被悄悄覆盖）。"""
+
+def _construct_unique_mapping(loader, node, deep=False):
+    seen = {}
+    for key_node, _ in node.value:
+        if key_node.tag == "tag:yaml.org,2002:merge":
+            continue
+        key = loader.construct_object(key_node, deep=deep)
+        try:
+            first = seen.setdefault(key, key_node.start_mark.line)
+        except TypeError:
+            continue
+        if first != key_node.start_mark.line:
+            raise ValueError(f"配置重复键 {key!r}：第 {first + 1} 行与第 {key_node.start_mark.line + 1} 行（后者会整段覆盖前者）")
+    return loader.construct_mapping(node, deep)
+
+_UniqueKeyLoader.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, _construct_unique_mapping)
+
+# 未写在 config.yaml 里时使用的默认值（其余各段由各自的 *_settings 补默认）
+_CONFIG_DEFAULTS = {
+    "target_acos": 0.50,
+    "min_clicks": 5,
+    "min_conversions": 1,
+    "harvest_threshold": 0.05,
+    "v11": {"target_acos": 0.30, "min_clicks": 20, "min_orders": 2},
+    "negatives_scan": {
+        "mode": "conservative", "min_clicks_no_order": 1, "min_ctr": 0.0, "match_type": "negative exact",
+        "match_mode": "substring", "patterns": {}, "phrase_roots": [],
+    },
+    "lexicon": {
+        "min_clicks_for_bad": 1, "min_clicks_for_good": 1, "suggest_top_k": 50, "ngram_max": 2,
+        "min_bad_freq": 2, "whitelist": [], "stopwords": [],
+    },
+}
+
+# 已知键的类型："num" / "int" / "bool" / "str" / "list" / "dict"，末尾 ? 表示可为空，tuple 为可选值；
+# 值为 dict 表示子段。未列出的键只给警告（便于自定义扩展），类型不符才报错。
+_CONFIG_SCHEMA = {
+    "columns_map": "dict",
+    "target_acos": "num", "min_clicks": "int", "min_conversions": "int", "harvest_threshold": "num",
+    "v11": {"target_acos": "num", "min_clicks": "int", "min_orders": "int"},
+    "negatives_scan": {
+        "mode": ("conservative", "aggressive"), "min_clicks_no_order": "int", "min_ctr": "num", "match_type": "str",
+        "match_mode": ("substring", "word"), "patterns": "patterns", "phrase_roots": "list",
+    },
+    "bayes": {"enabled": "bool", "prior_strength": "num", "aov_prior_orders": "num", "credible_level": "num",
+              "use_for_rules": "bool", "negative_max_cvr_hi": "num"},
+    "bids": {"enabled": "bool", "target_acos": "num?", "use_smoothed": "bool", "min_bid": "num", "max_bid": "num",
+             "max_step_up": "num", "max_step_down": "num", "default_cpc": "num"},
+    "bulksheet": {"max_rows": "int", "include": "list", "phrase_roots_scope": ("campaign", "none"),
+                  "daily_budget": "num", "bidding_strategy": "str", "skus": "list"},
+    "ingest": {"stream_threshold_mb": "num", "chunk_rows": "int", "xlsx_engine": ("auto", "calamine", "openpyxl")},
+    "batch": {"workers": "int?", "overrides": "dict?"},
+    "history": {"db_path": "str", "on_overlap": ("replace", "upsert"), "window_days": "int"},
+    "trends": {"windows": "list", "worsening_window": "int", "worsening_ratio": "num", "worsening_min_clicks": "int",
+               "block_scale_up_when_worsening": "bool", "bid_down_when_worsening": "bool"},
+    "memory": {"compact_dtypes": "bool"},
+    "cache": {"max_entries": "int", "max_memory_mb": "num"},
+    "clusters": {"enabled": "bool", "min_jaccard": "num", "num_perm": "int", "bands": "int",
+                 "min_cluster_terms": "int", "seed": "int", "stopwords": "list"},
+    "conflicts": {"enabled": "bool", "min_orders": "int", "fold_plurals": "bool", "max_ngram": "int", "samples": "int"},
+    "stages": {"executor": ("serial", "thread", "process"), "workers": "int?", "process_min_rows": "int"},
+    "service": {"url": "str?", "host": "str", "port": "int", "workers": "int?", "executor": ("process", "thread"),
+                "max_upload_mb": "num", "cache_entries": "int", "result_dir": "str?", "poll_seconds": "num"},
+    "diagnostics": {"profile": "bool", "profile_top": "int", "trace_memory": "bool", "json_log": "str?"},
+    "lexicon": {"min_clicks_for_bad": "int", "min_clicks_for_good": "int", "suggest_top_k": "int", "ngram_max": "int",
+                "min_bad_freq": "int", "whitelist": "list", "stopwords": "list"},
+}
+
+# 数值范围（左开右闭）
+_CONFIG_RANGES = {
+    "target_acos": (0, 10), "v11.target_acos": (0, 10), "bayes.credible_level": (0, 1),
+    "clusters.min_jaccard": (0, 1), "bids.min_bid": (0, 1000), "bids.max_bid": (0, 1000),
+}
+
+_TYPE_CHECKS = {
+    "num":  lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "int":  lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "bool": lambda v: isinstance(v, bool),
+    "str":  lambda v: isinstance(v, str),
+    "list": lambda v: isinstance(v, list),
+    "dict": lambda v: isinstance(v, dict),
+    "patterns": lambda v: isinstance(v, dict) and all(isinstance(x, list) or x is None for x in v.values()),
+}
+
+def _validate_section(section: dict, schema: dict, prefix: str, errors: list, warnings: list):
+    for key, val in section.items():
+        path = f"{prefix}{key}"
+        spec = schema.get(key)
+        if spec is None:
+            warnings.append(f"未知配置项 {path}")
+        elif isinstance(spec, dict):
+            if val is None:
+                continue
+            if not isinstance(val, dict):
+                errors.append(f"{path} 应为一段配置（键: 值），实际为 {type(val).__name__}")
+            else:
+                _validate_section(val, spec, path + ".", errors, warnings)
+        elif isinstance(spec, tuple):
+            if str(val).lower() not in spec:
+                errors.append(f"{path} 只能是 {' / '.join(spec)}，实际为 {val!r}")
+        elif val is None:
+            if not spec.endswith("?"):
+                errors.append(f"{path} 不能为空")
+        elif not _TYPE_CHECKS[spec.rstrip("?")](val):
+            errors.append(f"{path} 类型应为 {spec.rstrip('?')}，实际为 {type(val).__name__}（{val!r}）")
+
+def validate_config(cfg: dict) -> tuple:
+    """按 _CONFIG_SCHEMA 检查配置，返回 (errors, warnings) 两个字符串列表。"""
+    errors, warnings = [], []
+    if not isinstance(cfg, dict):
+        return [f"配置顶层应为键: 值，实际为 {type(cfg).__name__}"], []
+    _validate_section(cfg, _CONFIG_SCHEMA, "", errors, warnings)
+    if not errors:
+        for path, (lo, hi) in _CONFIG_RANGES.items():
+            sec, _, key = path.rpartition(".")
+            v = (cfg.get(sec) or {}).get(key) if sec else cfg.get(key)
+            if v is not None and not lo < v <= hi:
+                errors.append(f"{path} 应在 ({lo}, {hi}] 之间，实际为 {v!r}")
+    return errors, warnings
+
+_CONFIG_CACHE = {}
+_config_lock = threading.Lock()
+
 def load_config(path: str = "config.yaml") -> dict:
-    with open(path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+    """
+    读取 config.yaml：重复键报错、按 _CONFIG_SCHEMA 校验（类型不符抛 ValueError，未知键记 warning）、合并默认值。
+    按文件 mtime / 大小缓存（mtime 变了但内容哈希相同也复用），每次返回独立副本，调用方可以随意修改；
+    同时预编译派生结构（见 compile_config），各阶段直接复用。
+    """
+    full = os.path.abspath(path)
+    st = os.stat(full)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _config_lock:
+        hit = _CONFIG_CACHE.get(full)
+        if hit is not None and hit[0] == stamp:
+            return copy.deepcopy(hit[2])
+    with open(full, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha1(raw).hexdigest()
+    if hit is not None and hit[1] == digest:
+        cfg = hit[2]
+    else:
+        cfg = yaml.load(raw.decode("utf-8"), Loader=_UniqueKeyLoader) or {}
+        errors, warnings = validate_config(cfg)
+        if errors:
+            raise ValueError(f"{path} 配置有误：\n- " + "\n- ".join(errors))
+        for w in warnings:
+            _config_log.warning("%s: %s", path, w)
+        cfg = _deep_merge(_CONFIG_DEFAULTS, cfg)
+        compile_config(cfg)
+    with _config_lock:
+        _CONFIG_CACHE[full] = (stamp, digest, cfg)
+    return copy.deepcopy(cfg)
+
+def _deep_merge(base: dict, override: dict) -> dict:
+    """递归合并配置：override 中的字典逐层覆盖 base，其它值整体替换；不修改入参。"""
+    out = dict(base or {})
+    for k, v in (override or {}).items():
+        if isinstance(v, dict) and isinstance(out.get(k), dict):
+            out[k] = _deep_merge(out[k], v)
+        else:
+            out[k] = v
+    return out
 
 # ---------- 工具函数 ----------
 def _safe_num_series(s: pd.Series) -> pd.Series:
     if s is None:
         return pd.Series(dtype="float64")
-    if getattr(s, "dtype", None) == "O":
+    if not is_numeric_dtype(s):
         s = s.replace({",": ""}, regex=True)
     return pd.to_numeric(s, errors="coerce")
 
+def _norm_col(name) -> str:
+    return re.sub(r"[^a-z0-9]+", "", str(name).strip().lower())
+
 def _find_col(cols, candidates):
     if not candidates:
         return None
     if isinstance(candidates, str):
         candidates = [candidates]
-    norm = [re.sub(r"[^a-z0-9]+", "", c.strip().lower()) for c in cols]
+    norm = [_norm_col(c) for c in cols]
     for cand in candidates:
-        key = re.sub(r"[^a-z0-9]+", "", cand.strip().lower())
+        key = _norm_col(cand)
         if key in norm:
             return cols[norm.index(key)]
     return None
 
+def _safe_div_array(a, b) -> np.ndarray:
+    """逐元素 a / b，分母为 0 时取 0（向量化版 _safe_div）。"""
+    a = np.asarray(a, dtype="float64")
+    b = np.asarray(b, dtype="float64")
+    out = np.zeros(len(a), dtype="float64")
+    np.divide(a, b, out=out, where=(b != 0))
+    return out
+
+def _config_hash(obj) -> str:
+    payload = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _frame_nbytes(obj) -> int:
+    """DataFrame / Series / dict / tuple（及带 nbytes 的对象，如 ConflictIndex）的近似内存占用（字节）。"""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(obj, dict):
+        return sum(_frame_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_frame_nbytes(v) for v in obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    return int(getattr(obj, "nbytes", 0))
+
+# ---------- 缓存 ----------
+class FrameCache:
+    """
+    进程内 LRU 缓存（跨 Streamlit rerun 复用解析/标准化结果）。
+    同时受条目数与内存上限约束，超限时淘汰最久未使用的条目。
+    """
+    def __init__(self, max_entries: int = 8, max_bytes: int = 2 * 1024 ** 3):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value, nbytes: int = None) -> bool:
+        size = _frame_nbytes(value) if nbytes is None else int(nbytes)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._data:
+                self._data.pop(key)
+                self._sizes.pop(key, None)
+            self._data[key] = value
+            self._sizes[key] = size
+            while len(self._data) > self.max_entries or self.total_bytes > self.max_bytes:
+                old_key, _ = self._data.popitem(last=False)
+                self._sizes.pop(old_key, None)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+
 # ---------- 标准化 ----------
-def standardize_df(raw_df: pd.DataFrame, cfg: dict) -> pd.DataFrame:
-    m = (cfg.get("columns_map") or {})
-    cols = list(raw_df.columns)
-
-    col_search = _find_col(cols, m.get("search_term", ["Customer Search Term","Search term"]))
-    col_clicks = _find_col(cols, m.get("clicks", ["Clicks"]))
-    col_impr   = _find_col(cols, m.get("impressions", ["Impressions"]))
-    col_spend  = _find_col(cols, m.get("spend", ["Spend","Cost"]))
-    col_sales  = _find_col(cols, m.get("sales", ["7 Day Total Sales","14 Day Total Sales","Total Sales"]))
-    col_orders = _find_col(cols, m.get("orders", ["7 Day Total Orders (#)","7 Day Total Units Ordered","Orders"]))
-    col_camp   = _find_col(cols, m.get("campaign", ["Campaign Name"]))
-    col_adgrp  = _find_col(cols, m.get("ad_group", ["Ad Group Name"]))
+_STD_COLUMN_DEFAULTS = {
+    "search_term": ["Customer Search Term","Search term"],
+    "clicks":      ["Clicks"],
+    "impressions": ["Impressions"],
+    "spend":       ["Spend","Cost"],
+    "sales":       ["7 Day Total Sales","14 Day Total Sales","Total Sales"],
+    "orders":      ["7 Day Total Orders (#)","7 Day Total Units Ordered","Orders"],
+    "campaign":    ["Campaign Name"],
+    "ad_group":    ["Ad Group Name"],
+}
+_STD_NUM_COLS  = ["clicks","impressions","spend","sales","orders"]
+_STD_TEXT_COLS = ["campaign","ad_group","search_term"]
+_STD_KEYS      = ["campaign","ad_group","search_term"]
+
+def _resolve_columns(cols, cfg: dict) -> dict:
+    """按 columns_map（或默认候选）把标准列名解析为报表中的原始列名：{std: raw}；同一表头只解析一次。"""
+    compiled = compile_config(cfg)
+    cols = list(cols)
+    memo = compiled["resolved_columns"]
+    key = tuple(str(c) for c in cols)
+    resolved = memo.get(key)
+    if resolved is None:
+        resolved = {}
+        for std, cands in compiled["column_candidates"].items():
+            col = _find_col(cols, cands)
+            if col:
+                resolved[std] = col
+        if len(memo) >= 64:
+            memo.clear()
+        memo[key] = resolved
+    return dict(resolved)
+
+def _standardize_base(raw_df: pd.DataFrame, cfg: dict, resolved: dict = None) -> pd.DataFrame:
+    """只做列映射与数值清洗（不含比率指标），可逐块调用。"""
+    if resolved is None:
+        resolved = _resolve_columns(raw_df.columns, cfg)
 
     df = pd.DataFrame()
-    if col_search: df["search_term"] = raw_df[col_search].astype(str)
-    if col_clicks: df["clicks"]      = _safe_num_series(raw_df[col_clicks])
-    if col_impr:   df["impressions"] = _safe_num_series(raw_df[col_impr])
-    if col_spend:  df["spend"]       = _safe_num_series(raw_df[col_spend])
-    if col_sales:  df["sales"]       = _safe_num_series(raw_df[col_sales])
-    if col_orders: df["orders"]      = _safe_num_series(raw_df[col_orders])
-    if col_camp:   df["campaign"]    = raw_df[col_camp].astype(str)
-    if col_adgrp:  df["ad_group"]    = raw_df[col_adgrp].astype(str)
-
-    for c in ["clicks","impressions","spend","sales","orders"]:
+    for key, col in resolved.items():
+        if key in _STD_NUM_COLS:
+            df[key] = _safe_num_series(raw_df[col])
+        else:
+            # 空单元格（含 pandas 识别为缺失的 null / n/a 等）统一为 ""，文本键不出现 NaN
+            src = raw_df[col]
+            df[key] = src.where(src.notna(), "").astype(str)
+
+    for c in _STD_NUM_COLS:
         if c not in df.columns:
             df[c] = 0
-    for c in ["campaign","ad_group","search_term"]:
+        elif df[c].hasnans:
+            df[c] = df[c].fillna(0)
+    for c in _STD_TEXT_COLS:
         if c not in df.columns:
             df[c] = ""
+    return df
+
+def _add_rate_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """比率指标（分母为 0 时取 0），float64 列。"""
+    df["ctr"]  = _safe_div_array(df["clicks"], df["impressions"])
+    df["cpc"]  = _safe_div_array(df["spend"],  df["clicks"])
+    df["acos"] = _safe_div_array(df["spend"],  df["sales"])
+    df["cvr"]  = _safe_div_array(df["orders"], df["clicks"])
+    return df
+
+def _bayes_settings(cfg: dict) -> dict:
+    b = cfg.get("bayes", {}) or {}
+    return {
+        "enabled": bool(b.get("enabled", True)),
+        "prior_strength": max(float(b.get("prior_strength", 20)), 1e-6),
+        "aov_prior_orders": max(float(b.get("aov_prior_orders", 2)), 1e-6),
+        "credible_level": min(max(float(b.get("credible_level", 0.90)), 0.5), 0.999),
+        "use_for_rules": bool(b.get("use_for_rules", False)),
+        "negative_max_cvr_hi": float(b.get("negative_max_cvr_hi", 0.10)),
+    }
 
-    df["ctr"]  = df["clicks"] / df["impressions"].replace(0, pd.NA)
-    df["cpc"]  = df["spend"]  / df["clicks"].replace(0, pd.NA)
-    df["acos"] = df["spend"]  / df["sales"].replace(0, pd.NA)
-    df["cvr"]  = df["orders"] / df["clicks"].replace(0, pd.NA)
-    return df.fillna(0)
+def _shrink_to_groups(num: np.ndarray, den: np.ndarray, gid: np.ndarray, prior_row: np.ndarray, k: float):
+    """组内合计向组先验收缩：(Σnum + k·prior) / (Σden + k)，按行展开返回（prior_row 在组内相同）。"""
+    n_groups = int(gid.max()) + 1 if len(gid) else 0
+    prior_g = np.zeros(n_groups)
+    prior_g[gid] = prior_row
+    post_g = (np.bincount(gid, weights=num, minlength=n_groups) + k * prior_g) / \
+             (np.bincount(gid, weights=den, minlength=n_groups) + k)
+    return post_g[gid]
+
+def _add_bayes_metrics(df: pd.DataFrame, cfg: dict) -> pd.DataFrame:
+    """
+    低样本搜索词的贝叶斯平滑（全部列运算，百万行约零点几秒）：
+    - CVR：Beta-Binomial，先验逐级收缩 账户 → 活动 → 广告组，先验强度 = prior_strength 次点击；
+      cvr_post 为后验均值，cvr_lo / cvr_hi 为 credible_level 可信区间（Beta 分布正态近似，截断到 [0, 1]）；
+    - 客单价同样向广告组 / 账户收缩（aov_prior_orders 单），acos_post = CPC / (cvr_post × 客单价)。
+    1 次点击 1 单不再得到 100% CVR，1 次点击 0 单的 cvr_hi 也仍然较高，不足以判定为否定。
+    """
+    b = _bayes_settings(cfg)
+    if not b["enabled"]:
+        return df
+    clicks = df["clicks"].to_numpy(dtype="float64")
+    orders = np.minimum(df["orders"].to_numpy(dtype="float64"), clicks)
+    sales  = df["sales"].to_numpy(dtype="float64")
+    spend  = df["spend"].to_numpy(dtype="float64")
+    k, m = b["prior_strength"], b["aov_prior_orders"]
+
+    # dropna=False：空的活动 / 广告组自成一组，编号不会是 NaN
+    camp = df.groupby("campaign", sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    adg = df.groupby(["campaign", "ad_group"], sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    tot_clicks, tot_orders, tot_sales = clicks.sum(), orders.sum(), sales.sum()
+    p0 = np.full(len(df), tot_orders / tot_clicks if tot_clicks else 0.0)
+    p_camp = _shrink_to_groups(orders, clicks, camp, p0, k)
+    p_adg = _shrink_to_groups(orders, clicks, adg, p_camp, k)
+
+    alpha = orders + k * p_adg
+    beta = (clicks - orders) + k * (1.0 - p_adg)
+    ab = alpha + beta
+    mean = alpha / ab
+    sd = np.sqrt(alpha * beta / (ab * ab * (ab + 1.0)))
+    z = NormalDist().inv_cdf(0.5 + b["credible_level"] / 2)
+    df["cvr_post"] = mean
+    df["cvr_lo"] = np.clip(mean - z * sd, 0.0, 1.0)
+    df["cvr_hi"] = np.clip(mean + z * sd, 0.0, 1.0)
+
+    aov0 = np.full(len(df), tot_sales / tot_orders if tot_orders else 0.0)
+    aov_adg = _shrink_to_groups(sales, orders, adg, aov0, m)
+    aov = (sales + m * aov_adg) / (orders + m)
+    df["acos_post"] = _safe_div_array(spend, clicks * mean * aov)
+    return df
+
+def _compact_std_df(df: pd.DataFrame, categorical: bool = True) -> pd.DataFrame:
+    """
+    压缩标准化数据的内存占用（原地替换列，不复制整表）：
+    - 点击/曝光/订单为整数且不越界时降为 int32；
+    - campaign / ad_group / search_term 转为 category（重复值只存一份）。
+    比率列保持 float64：float32 会让恰好等于阈值的 ACOS（如 0.30）在比较时翻转结果。
+    """
+    for c in ["clicks","impressions","orders"]:
+        s = df[c]
+        if not is_numeric_dtype(s) or len(s) == 0:
+            continue
+        v = s.to_numpy()
+        if np.all(np.mod(v, 1) == 0) and v.min() >= 0 and v.max() <= np.iinfo("int32").max:
+            df[c] = v.astype("int32")
+    if categorical:
+        for c in _STD_TEXT_COLS:
+            if not isinstance(df[c].dtype, pd.CategoricalDtype):
+                df[c] = df[c].astype("category")
+    return df
+
+def _std_compact_enabled(cfg: dict) -> bool:
+    return bool((cfg.get("memory") or {}).get("compact_dtypes", True))
+
+def _map_unique(s: pd.Series, fn) -> np.ndarray:
+    """对 category 列只在去重后的取值上计算 fn，再按编码展开；其它列直接计算。"""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        cats = pd.Series(s.cat.categories.astype(str), dtype=object)
+        codes = s.cat.codes.to_numpy()
+        if (codes < 0).any():   # 缺失值编码为 -1：按 "" 计算，不能取到最后一个类别的结果
+            codes = np.where(codes < 0, len(cats), codes)
+            cats = pd.concat([cats, pd.Series([""], dtype=object)], ignore_index=True)
+        out = np.asarray(fn(cats))
+        return out[codes]
+    return np.asarray(fn(s.astype(str)))
+
+def standardize_df(raw_df: pd.DataFrame, cfg: dict) -> pd.DataFrame:
+    df = _add_rate_metrics(_standardize_base(raw_df, cfg))
+    if _std_compact_enabled(cfg):
+        df = _compact_std_df(df)
+    return _add_bayes_metrics(df, cfg)
+
+# ---------- 流式读取（大文件） ----------
+def _aggregate_std(df: pd.DataFrame) -> pd.DataFrame:
+    # dropna=False：空键的行也参与汇总，与整表读取的合计一致
+    agg = df.groupby(_STD_KEYS, sort=False, as_index=False, observed=True, dropna=False)[_STD_NUM_COLS].sum()
+    return agg[["search_term"] + _STD_NUM_COLS + ["campaign","ad_group"]]
+
+def stream_standardize_csv(src, cfg: dict, chunksize: int = 200_000, progress=None):
+    """
+    分块读取大 CSV：只解析需要的列，逐块标准化后按 (campaign, ad_group, search_term) 增量汇总，
+    峰值内存约为「一个分块 + 汇总结果」，不再整表载入原始报表。
+    src 为文件路径或二进制文件对象；progress(bytes_read, total_bytes, rows_read) 按实际解析的字节数回调。
+    返回 (df_std, 原始行数)。
+    """
+    own = isinstance(src, (str, os.PathLike))
+    fh = open(src, "rb") if own else src
+    try:
+        fh.seek(0, os.SEEK_END)
+        total = fh.tell()
+        fh.seek(0)
+        header = list(pd.read_csv(fh, nrows=0).columns)
+        fh.seek(0)
+        resolved = _resolve_columns(header, cfg)
+        text_cols = {resolved[k] for k in _STD_TEXT_COLS if k in resolved}
+        reader = pd.read_csv(
+            fh,
+            usecols=list(dict.fromkeys(resolved.values())),
+            dtype={c: str for c in text_cols},
+            chunksize=int(chunksize),
+        )
+
+        parts, part_rows, n_rows = [], 0, 0
+        compact_at = 4 * int(chunksize)
+        for chunk in reader:
+            n_rows += len(chunk)
+            part = _aggregate_std(_standardize_base(chunk, cfg, resolved))
+            parts.append(part)
+            part_rows += len(part)
+            # 分块汇总结果过多时合并一次；阈值随合并后规模翻倍，总代价保持近线性
+            if len(parts) > 1 and part_rows > compact_at:
+                parts = [_aggregate_std(pd.concat(parts, ignore_index=True))]
+                part_rows = len(parts[0])
+                compact_at = max(compact_at, 2 * part_rows)
+            if progress is not None:
+                progress(min(fh.tell(), total), total, n_rows)
+    finally:
+        if own:
+            fh.close()
+
+    if parts:
+        df = _aggregate_std(pd.concat(parts, ignore_index=True)) if len(parts) > 1 else parts[0]
+    else:
+        df = _standardize_base(pd.DataFrame(columns=header), cfg, resolved)[["search_term"] + _STD_NUM_COLS + ["campaign","ad_group"]]
+    df = _compact_std_df(_add_rate_metrics(df.reset_index(drop=True)), categorical=_std_compact_enabled(cfg))
+    return _add_bayes_metrics(df, cfg), n_rows
+
+# ---------- 读取报表 ----------
+def _std_candidate_keys(cfg: dict) -> set:
+    """standardize_df 可能用到的全部列名（归一化后），用于读取前裁剪列。"""
+    return set(compile_config(cfg)["candidate_keys"])
+
+def _calamine_available() -> bool:
+    try:
+        import python_calamine  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def read_xlsx_pruned(src, cfg: dict, progress=None, extra_cols=None):
+    """
+    xlsx 快速读取：按 columns_map / 默认候选只读取需要的列。
+    - 装有 python-calamine 时用 calamine 引擎（Rust 实现，通常快数倍）；
+    - 否则用 openpyxl 只读流式模式逐行读取，只保留需要的列。
+    progress(rows_read, total_rows) 每 50,000 行回调一次（total_rows 可能为 None）。
+    extra_cols 为额外需要保留的列名（如日期列）。
+    返回 (raw_df, stats)，stats 含 rows / seconds / rows_per_sec / engine / columns。
+    """
+    keys = _std_candidate_keys(cfg) | {_norm_col(c) for c in (extra_cols or [])}
+    engine = str((cfg.get("ingest", {}) or {}).get("xlsx_engine", "auto")).lower()
+    if engine == "auto":
+        engine = "calamine" if _calamine_available() else "openpyxl"
+    t0 = time.perf_counter()
+
+    if engine == "calamine":
+        df = pd.read_excel(src, engine="calamine", usecols=lambda c: _norm_col(c) in keys)
+    else:
+        import openpyxl
+        wb = openpyxl.load_workbook(src, read_only=True, data_only=True, keep_links=False)
+        try:
+            ws = wb.worksheets[0]
+            total = ws.max_row - 1 if ws.max_row else None
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            keep = [i for i, h in enumerate(header) if h is not None and _norm_col(h) in keys]
+            cols = [[] for _ in keep]
+            n = 0
+            for row in rows:
+                width = len(row)
+                for j, i in enumerate(keep):
+                    cols[j].append(row[i] if i < width else None)
+                n += 1
+                if progress is not None and n % 50_000 == 0:
+                    progress(n, total)
+        finally:
+            wb.close()
+        df = pd.DataFrame({str(header[i]): c for i, c in zip(keep, cols)})
+        # 与 pd.read_excel 一致：去掉末尾的全空行（只有格式没有内容的行）
+        if len(df):
+            filled = df.notna().any(axis=1).to_numpy()
+            last = int(np.flatnonzero(filled)[-1]) + 1 if filled.any() else 0
+            df = df.iloc[:last]
+
+    sec = time.perf_counter() - t0
+    stats = {
+        "engine": engine,
+        "rows": int(len(df)),
+        "columns": list(df.columns),
+        "seconds": round(sec, 3),
+        "rows_per_sec": round(len(df) / sec, 1) if sec > 0 else float(len(df)),
+    }
+    if progress is not None:
+        progress(len(df), len(df))
+    return df, stats
+
+def read_report(src, name: str = None, cfg: dict = None) -> pd.DataFrame:
+    """
+    读取原始报表：src 为路径或二进制文件对象；按 name（或路径）的扩展名区分 CSV / XLSX。
+    传入 cfg 时 xlsx 走 read_xlsx_pruned（只读需要的列）。
+    """
+    name = str(name or src)
+    if name.lower().endswith(".csv"):
+        return pd.read_csv(src)
+    if cfg is not None:
+        return read_xlsx_pruned(src, cfg)[0]
+    return pd.read_excel(src)
+
+def _should_stream(src, cfg: dict, name: str = None) -> bool:
+    """CSV 且大于 ingest.stream_threshold_mb 时走流式读取。"""
+    if not str(name or src).lower().endswith(".csv"):
+        return False
+    if isinstance(src, (str, os.PathLike)):
+        size = os.path.getsize(src)
+    else:
+        pos = src.tell()
+        size = src.seek(0, os.SEEK_END)
+        src.seek(pos)
+    ingest = cfg.get("ingest", {}) or {}
+    return size >= float(ingest.get("stream_threshold_mb", 100)) * 1024 * 1024
+
+def load_report_std(src, cfg: dict, name: str = None, progress=None) -> pd.DataFrame:
+    """
+    读取并标准化一份报表。CSV 大于 ingest.stream_threshold_mb 时走流式读取（分块 + 增量汇总），
+    否则整表读取后 standardize_df。
+    """
+    if _should_stream(src, cfg, name):
+        chunk_rows = int((cfg.get("ingest", {}) or {}).get("chunk_rows", 200_000))
+        df, _ = stream_standardize_csv(src, cfg, chunksize=chunk_rows, progress=progress)
+        return df
+    return standardize_df(read_report(src, name, cfg), cfg)
 
 # ---------- 早期否定词扫描 ----------
+_GENERIC_HEURISTIC_ROOTS = ["pad","belt","starter","bundle"]
+_MATCHER_CACHE = {}
+_MATCHER_CACHE_MAX = 32
+
+def _compile_pattern_matcher(patterns: dict, word_boundary: bool = False) -> dict:
+    """
+    每个标签编译成一条交替正则（tag -> regex），整列一次向量化匹配。
+    默认子串语义（与 `p in term` 一致）；word_boundary=True 时只匹配完整单词/短语。
+    """
+    compiled = {}
+    for tag, plist in (patterns or {}).items():
+        roots = sorted({str(p).lower() for p in (plist or [])}, key=len, reverse=True)
+        if not roots:
+            continue
+        alt = "|".join(re.escape(p) for p in roots)
+        if word_boundary:
+            alt = rf"(?<!\w)(?:{alt})(?!\w)"
+        compiled[str(tag)] = re.compile(alt)
+    return compiled
+
+def _get_pattern_matcher(patterns: dict, word_boundary: bool = False) -> dict:
+    key = _config_hash({"patterns": patterns, "word_boundary": bool(word_boundary)})
+    matcher = _MATCHER_CACHE.get(key)
+    if matcher is None:
+        if len(_MATCHER_CACHE) >= _MATCHER_CACHE_MAX:
+            _MATCHER_CACHE.clear()
+        matcher = _compile_pattern_matcher(patterns, word_boundary)
+        _MATCHER_CACHE[key] = matcher
+    return matcher
+
+_COMPILED_CACHE = OrderedDict()
+_COMPILED_CACHE_MAX = 16
+
+def compile_config(cfg: dict) -> dict:
+    """
+    配置的派生结构，按配置内容哈希缓存（同一份配置只编译一次，批量模式下每个账户的覆盖配置各一份）：
+    patterns（标签 → 小写词根集合）、pattern_roots（全部词根）、matcher / generic_matcher（否定词正则）、
+    phrase_roots、stopwords / whitelist（小写集合）、column_candidates / candidate_keys（列名候选），
+    resolved_columns（按报表表头记忆的列解析结果）。
+    """
+    cfg = cfg or {}
+    key = _config_hash(cfg)
+    with _config_lock:
+        hit = _COMPILED_CACHE.get(key)
+        if hit is not None:
+            _COMPILED_CACHE.move_to_end(key)
+            return hit
+    scan = cfg.get("negatives_scan", {}) or {}
+    lx = cfg.get("lexicon", {}) or {}
+    patterns = scan.get("patterns", {}) or {}
+    lowered = {str(t): frozenset(str(p).lower() for p in (pl or [])) for t, pl in patterns.items()}
+    m = cfg.get("columns_map") or {}
+    candidates = {}
+    for std, default in _STD_COLUMN_DEFAULTS.items():
+        cands = m.get(std, default) or []
+        candidates[std] = [cands] if isinstance(cands, str) else list(cands)
+    compiled = {
+        "hash": key,
+        "patterns": lowered,
+        "pattern_roots": frozenset().union(*lowered.values()),
+        "matcher": _get_pattern_matcher(patterns, str(scan.get("match_mode", "substring")).lower() == "word"),
+        "generic_matcher": _get_pattern_matcher({"GENERIC_HEURISTIC": _GENERIC_HEURISTIC_ROOTS}),
+        "phrase_roots": [str(p) for p in (scan.get("phrase_roots") or [])],
+        "stopwords": frozenset(str(w).lower() for w in (lx.get("stopwords") or [])),
+        "whitelist": frozenset(str(w).lower() for w in (lx.get("whitelist") or [])),
+        "column_candidates": candidates,
+        "candidate_keys": frozenset(_norm_col(c) for cands in candidates.values() for c in cands),
+        "resolved_columns": {},
+    }
+    with _config_lock:
+        _COMPILED_CACHE[key] = compiled
+        while len(_COMPILED_CACHE) > _COMPILED_CACHE_MAX:
+            _COMPILED_CACHE.popitem(last=False)
+    return compiled
+
+def _match_reason_tags(terms: pd.Series, matcher: dict) -> pd.Series:
+    """返回每行命中的标签（按字母序以 ; 拼接，未命中为空串）。"""
+    reason = pd.Series("", index=terms.index, dtype=object)
+    for tag in sorted(matcher):
+        hit = terms.str.contains(matcher[tag], regex=True).to_numpy(dtype=bool)
+        reason = reason.where(~hit, reason + ";" + tag)
+    return reason.str.lstrip(";")
+
 def scan_potential_negatives(df_std: pd.DataFrame, cfg: dict):
     scan = cfg.get("negatives_scan", {}) or {}
     mode       = str(scan.get("mode", "conservative")).lower()
     min_clk    = int(scan.get("min_clicks_no_order", 1))
     min_ctr    = float(scan.get("min_ctr", 0.0))
     match_type = str(scan.get("match_type", "negative exact"))
-    patterns   = scan.get("patterns", {}) or {}
 
-    df = df_std.copy()
-    base = df[(df["clicks"] >= min_clk) & (df["orders"] == 0)]
+    base = df_std[(df_std["clicks"] >= min_clk) & (df_std["orders"] == 0)]
     if min_ctr > 0:
         base = base[(base["ctr"].fillna(0) >= min_ctr)]
+    bayes = _bayes_settings(cfg)
+    if bayes["use_for_rules"] and "cvr_hi" in base.columns:
+        # 只否定「有把握 CVR 低」的词：可信区间上界也低于阈值
+        base = base[base["cvr_hi"] <= bayes["negative_max_cvr_hi"]]
 
-    rows = []
-    for _, r in base.iterrows():
-        term = str(r["search_term"]).lower()
-        reasons = []
-        for tag, plist in patterns.items():
-            for p in plist:
-                if p.lower() in term:
-                    reasons.append(tag)
-                    break
-        if mode == "aggressive" and not reasons:
-            for g in ["pad","belt","starter","bundle"]:
-                if g in term:
-                    reasons.append("GENERIC_HEURISTIC")
-                    break
-        if reasons:
-            rows.append({
-                "Campaign Name": r["campaign"],
-                "Ad Group Name": r["ad_group"],
-                "Customer Search Term": r["search_term"],
-                "Clicks": int(r["clicks"]),
-                "Orders": int(r["orders"]),
-                "CTR": float(r["ctr"] or 0),
-                "Reason": ";".join(sorted(set(reasons)))
-            })
-    neg_source = pd.DataFrame(rows)
+    compiled = compile_config(cfg)
+    matcher = compiled["matcher"]
+    generic = compiled["generic_matcher"] if mode == "aggressive" else None
+
+    def _reasons(terms: pd.Series) -> pd.Series:
+        terms = terms.str.lower()
+        out = _match_reason_tags(terms, matcher)
+        if generic is not None:
+            out = out.where(out != "", _match_reason_tags(terms, generic))
+        return out
+
+    reasons = _map_unique(base["search_term"], _reasons)
+    hit = reasons != ""
+    if hit.any():
+        sel = base[hit]
+        neg_source = pd.DataFrame({
+            "Campaign Name": sel["campaign"].to_numpy(),
+            "Ad Group Name": sel["ad_group"].to_numpy(),
+            "Customer Search Term": sel["search_term"].to_numpy(),
+            "Clicks": sel["clicks"].astype("int64").to_numpy(),
+            "Orders": sel["orders"].astype("int64").to_numpy(),
+            "CTR": sel["ctr"].fillna(0).astype("float64").to_numpy(),
+            "Reason": reasons[hit],
+        })
+    else:
+        neg_source = pd.DataFrame()
 
     if not neg_source.empty:
         neg_upload = pd.DataFrame({
@@ -126,10 +755,37 @@ def _norm_tokenize(text: str):
     return [w for w in t.split() if w]
 
 def _yield_ngrams(tokens, nmax=2):
-    for t in tokens:
-        yield t
-    for i in range(len(tokens)-1):
-        yield tokens[i] + " " + tokens[i+1]
+    for n in range(1, max(1, int(nmax)) + 1):
+        for i in range(len(tokens) - n + 1):
+            yield " ".join(tokens[i:i+n])
+
+def _build_ngram_index(terms, nmax, stopwords, max_postings=3):
+    """
+    词频 + 倒排索引，一次构建：每个（去重后的）搜索词只分词一次。
+    返回 (counter, postings, uniq)：
+    - counter：n-gram → 出现次数（按原始行数计，重复行重复计数）；
+    - postings：n-gram → 包含它的搜索词编号（uniq 下标，按首次出现顺序，最多 max_postings 个）。
+    """
+    term_counts = Counter(terms)
+    uniq = list(term_counts)
+    text = pd.Series(uniq, dtype=object)
+    text = text.where(text.notna(), "")   # 空搜索词（NaN / 读入时识别为缺失的 null 等）按 "" 处理
+    toks = text.str.lower().str.replace(r"[\W_]+", " ", regex=True).str.split()
+
+    counter, postings = Counter(), {}
+    for tid, (term, tokens) in enumerate(zip(uniq, toks)):
+        if not isinstance(tokens, list):
+            continue
+        mult = term_counts[term]
+        for g in _yield_ngrams(tokens, nmax=nmax):
+            if g in stopwords or len(g) <= 2:
+                continue
+            counter[g] += mult
+            if max_postings:
+                p = postings.setdefault(g, [])
+                if len(p) < max_postings and (not p or p[-1] != tid):
+                    p.append(tid)
+    return counter, postings, uniq
 
 def suggest_lexicon_updates(df_std: pd.DataFrame, cfg: dict) -> pd.DataFrame:
     lx = cfg.get("lexicon", {}) or {}
@@ -138,38 +794,23 @@ def suggest_lexicon_updates(df_std: pd.DataFrame, cfg: dict) -> pd.DataFrame:
     top_k     = int(lx.get("suggest_top_k", 50))
     ngram_max = int(lx.get("ngram_max", 2))
     min_bad_f = int(lx.get("min_bad_freq", 2))
-    whitelist = set(w.lower() for w in lx.get("whitelist", []))
-    stopwords = set(w.lower() for w in lx.get("stopwords", []))
+    compiled  = compile_config(cfg)
+    whitelist = compiled["whitelist"]
+    stopwords = compiled["stopwords"]
+    existing  = compiled["pattern_roots"]   # 已有词库，避免重复建议
 
-    # 已有词库，避免重复建议
-    existing = set()
-    pat_cfg = (cfg.get("negatives_scan") or {}).get("patterns", {}) or {}
-    for lst in pat_cfg.values():
-        for w in lst:
-            existing.add(w.lower())
-
-    df = df_std.copy()
+    # 直接读取标准化列（不复制整表）；仅当列不是干净的数值时才清洗
+    num = {}
     for c in ["clicks","orders"]:
-        if c in df.columns and df[c].dtype == "O":
-            df[c] = df[c].replace({",":""}, regex=True)
-        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0)
-
-    bad_terms  = df[(df["clicks"] >= min_bad) & (df["orders"] == 0)]["search_term"].astype(str).tolist()
-    good_terms = df[(df["clicks"] >= min_good) & (df["orders"] > 0)]["search_term"].astype(str).tolist()
+        s = df_std[c]
+        num[c] = s if is_numeric_dtype(s) and not s.hasnans else _safe_num_series(s).fillna(0)
 
-    bad_cnt, good_cnt = Counter(), Counter()
+    bad_terms  = df_std.loc[(num["clicks"] >= min_bad) & (num["orders"] == 0), "search_term"].astype(str).tolist()
+    good_terms = df_std.loc[(num["clicks"] >= min_good) & (num["orders"] > 0), "search_term"].astype(str).tolist()
 
-    def feed(terms, counter):
-        for s in terms:
-            toks = _norm_tokenize(s)
-            grams = list(_yield_ngrams(toks, nmax=ngram_max))
-            for g in grams:
-                if g in stopwords or len(g) <= 2:
-                    continue
-                counter[g] += 1
-
-    feed(bad_terms, bad_cnt)
-    feed(good_terms, good_cnt)
+    # 样例词直接取自倒排索引（包含该 n-gram 的前 3 个无单搜索词），不再逐词重扫
+    bad_cnt, bad_postings, bad_uniq = _build_ngram_index(bad_terms, ngram_max, stopwords)
+    good_cnt, _, _ = _build_ngram_index(good_terms, ngram_max, stopwords, max_postings=0)
 
     rows = []
     alpha = 0.5
@@ -180,12 +821,7 @@ def suggest_lexicon_updates(df_std: pd.DataFrame, cfg: dict) -> pd.DataFrame:
             continue
         gf = good_cnt.get(tok, 0)
         score = bf - alpha * gf
-        samples = []
-        for s in bad_terms:
-            if tok in " ".join(_norm_tokenize(s)):
-                samples.append(s)
-            if len(samples) >= 3:
-                break
+        samples = [bad_uniq[i] for i in bad_postings.get(tok, [])]
         rows.append({
             "Token": tok,
             "BadFreq": int(bf),
@@ -200,29 +836,544 @@ def suggest_lexicon_updates(df_std: pd.DataFrame, cfg: dict) -> pd.DataFrame:
     return pd.DataFrame(rows).sort_values(["Score","BadFreq"], ascending=[False,False]).head(top_k).reset_index(drop=True)
 
 # ---------- 主分析 ----------
-def calculate_metrics(raw_df: pd.DataFrame, cfg: dict) -> dict:
-    df = standardize_df(raw_df, cfg)
+def calculate_metrics(raw_df: pd.DataFrame, cfg: dict, timings=None) -> dict:
+    with _stage(timings, "standardize", rows=len(raw_df)) as rec:
+        df = standardize_df(raw_df, cfg)
+        rec["rows_out"] = len(df)
+    return calculate_metrics_from_std(df, cfg, timings=timings)
+
+# calculate_metrics_from_std 的子阶段（顺序即执行顺序；界面进度条按它估算百分比）
+ANALYZE_STAGES = ["clusters", "rules", "bids", "scan_negatives", "lexicon", "rollup", "conflicts"]
 
+def calculate_metrics_from_std(df: pd.DataFrame, cfg: dict, timings=None) -> dict:
+    """
+    在已标准化的数据（standardize_df / stream_standardize_csv 的输出）上执行规则分类与扫描。
+    各子阶段（ANALYZE_STAGES）由 ppc_stages 调度：clusters → rules → bids 依次依赖，scan_negatives /
+    lexicon / rollup 只读标准化数据，与前者并发（stages.executor；serial 为逐个执行），结果与串行一致；
+    conflicts 在 scan_negatives / lexicon 之后检查拟否定项会挡住的转化词（ppc_conflicts）。
+    timings（dict 或 ppc_instrument.Instrument）记录各子阶段。
+    """
+    from ppc_stages import stage_settings, run_stage_graph, SharedColumns, run_in_process, _lexicon_job, _cluster_job
+    st = stage_settings(cfg)
     target_acos     = float(cfg.get("target_acos", 0.50))
     min_clicks      = int(cfg.get("min_clicks", 5))
     min_conversions = int(cfg.get("min_conversions", 1))
     harvest_th      = float(cfg.get("harvest_threshold", 0.05))
+    use_clusters    = (cfg.get("clusters", {}) or {}).get("enabled", True) and len(df) > 0
+    use_bids        = _bid_settings(cfg)["enabled"]
 
-    scale_up  = df[(df["acos"] < target_acos) & (df["orders"] >= min_conversions)]
-    bid_down  = df[(df["acos"] > target_acos) & (df["clicks"] >= min_clicks)]
-    negatives = df[(df["clicks"] >= max(30, min_clicks)) & (df["orders"] == 0)]
-    harvest   = df[(df["cvr"] >= harvest_th)]
+    # process：纯 Python 分词（词库建议、变体聚类）交给子进程，标准化列经共享内存传递
+    shared = None
+    if st["executor"] == "process" and len(df) >= st["process_min_rows"] and not getattr(timings, "requires_serial", False):
+        shared = SharedColumns(df)
 
-    early_src, early_upload = scan_potential_negatives(df, cfg)
-    lex_sugg = suggest_lexicon_updates(df, cfg)
+    def _clusters(done):
+        # 变体聚类：每行加 cluster_id，另出簇级汇总 Term_Clusters
+        from ppc_clusters import assign_clusters, cluster_table, cluster_keys, cluster_terms
+        if not use_clusters:
+            return df, None
+        clustered = None
+        if shared is not None:
+            clustered = run_in_process(_cluster_job, shared, cfg, st["workers"],
+                                       lambda: cluster_terms(cluster_keys(df["search_term"])[1], cfg))
+        df_c, labels = assign_clusters(df, cfg, clustered)
+        return df_c, cluster_table(df_c, labels, cfg)
 
-    return {
-        "All_Terms": df,
+    def _rules(done):
+        d = done["clusters"][0]
+        # bayes.use_for_rules：ACOS 用平滑后的 acos_post，Harvest 要求 CVR 可信区间下界达标
+        use_bayes = _bayes_settings(cfg)["use_for_rules"] and "acos_post" in d.columns
+        acos      = d["acos_post"] if use_bayes else d["acos"]
+        up_mask   = (acos < target_acos) & (d["orders"] >= min_conversions)
+        down_mask = (acos > target_acos) & (d["clicks"] >= min_clicks)
+        # 趋势列（ppc_trends.attach_trends 并入）存在时：ACOS 近期恶化的词不提价，并进入降价
+        trend_alerts = None
+        if "acos_worsening" in d.columns:
+            t = cfg.get("trends", {}) or {}
+            worsening = d["acos_worsening"].astype(bool)
+            if t.get("block_scale_up_when_worsening", True):
+                up_mask &= ~worsening
+            if t.get("bid_down_when_worsening", True):
+                down_mask |= worsening & (d["clicks"] >= min_clicks)
+            trend_alerts = d[worsening]
+        return {
+            "up_mask": up_mask, "down_mask": down_mask, "trend_alerts": trend_alerts,
+            "Scale_Up": d[up_mask], "Bid_Down": d[down_mask],
+            "Negatives": d[(d["clicks"] >= max(30, min_clicks)) & (d["orders"] == 0)],
+            "Harvest": d[(d["cvr_lo"] if use_bayes else d["cvr"]) >= harvest_th],
+        }
+
+    def _bids(done):
+        # 一次为全部行算出价，再按规则取子集（Scale_Up / Bid_Down 附带出价列）
+        r = done["rules"]
+        if not use_bids:
+            return r["Scale_Up"], r["Bid_Down"], None
+        bids = recommend_bids(done["clusters"][0], cfg, target_acos)
+        scale_up = pd.concat([r["Scale_Up"], bids[r["up_mask"].to_numpy()]], axis=1)
+        bid_down = pd.concat([r["Bid_Down"], bids[r["down_mask"].to_numpy()]], axis=1)
+        return scale_up, bid_down, _bid_sheet({"Scale_Up": scale_up, "Bid_Down": bid_down})
+
+    def _lexicon(done):
+        if shared is not None:
+            return run_in_process(_lexicon_job, shared, cfg, st["workers"], lambda: suggest_lexicon_updates(df, cfg))
+        return suggest_lexicon_updates(df, cfg)
+
+    def _conflicts(done):
+        # 转化词索引只在这里建一次，随结果缓存；v1.1 行动表（调阈值重算）直接复用
+        from ppc_conflicts import ConflictIndex, negative_conflicts
+        index = ConflictIndex(df, cfg)
+        return negative_conflicts(df, cfg, early_upload=done["scan_negatives"][1], lexicon=done["lexicon"], index=index), index
+
+    stages = [
+        ("clusters",       _clusters, [], lambda r: None if r[1] is None else len(r[1])),
+        ("rules",          _rules, ["clusters"], None),
+        ("bids",           _bids, ["rules"], lambda r: None if r[2] is None else len(r[2])),
+        ("scan_negatives", lambda done: scan_potential_negatives(df, cfg), [], lambda r: len(r[0])),
+        ("lexicon",        _lexicon, [], len),
+        ("rollup",         lambda done: build_rollup(df), [], len),
+        ("conflicts",      _conflicts, ["scan_negatives", "lexicon"], lambda r: len(r[0])),
+    ]
+    try:
+        out = run_stage_graph(stages, timings, st["executor"], st["workers"], rows=len(df))
+    finally:
+        if shared is not None:
+            shared.close()
+
+    df_c, term_clusters = out["clusters"]
+    rules = out["rules"]
+    scale_up, bid_down, bid_sheet = out["bids"]
+    early_src, early_upload = out["scan_negatives"]
+    results = {
+        "All_Terms": df_c,
         "Scale_Up": scale_up.reset_index(drop=True),
         "Bid_Down": bid_down.reset_index(drop=True),
-        "Negatives": negatives.reset_index(drop=True),
-        "Harvest": harvest.reset_index(drop=True),
+        "Negatives": rules["Negatives"].reset_index(drop=True),
+        "Harvest": rules["Harvest"].reset_index(drop=True),
         "Early_Negatives_Source": early_src.reset_index(drop=True),
         "Early_Negatives_Upload": early_upload.reset_index(drop=True),
-        "Lexicon_Suggestions": lex_sugg.reset_index(drop=True),
+        "Lexicon_Suggestions": out["lexicon"].reset_index(drop=True),
     }
+    results["Rollup"] = out["rollup"]
+    conflicts, results["Conflict_Index"] = out["conflicts"]
+    if len(conflicts):
+        results["Negative_Conflicts"] = conflicts
+    if bid_sheet is not None:
+        results["Bid_Sheet"] = bid_sheet
+    if term_clusters is not None:
+        results["Term_Clusters"] = term_clusters
+    if rules["trend_alerts"] is not None:
+        results["Trend_Alerts"] = rules["trend_alerts"].reset_index(drop=True)
+    return results
+
+# ---------- 出价建议 ----------
+def _bid_settings(cfg: dict) -> dict:
+    b = cfg.get("bids", {}) or {}
+    return {
+        "enabled": bool(b.get("enabled", True)),
+        "target_acos": b.get("target_acos"),
+        "min_bid": float(b.get("min_bid", 0.05)),
+        "max_bid": float(b.get("max_bid", 5.00)),
+        "max_step_up": float(b.get("max_step_up", 0.30)),
+        "max_step_down": float(b.get("max_step_down", 0.40)),
+        "default_cpc": float(b.get("default_cpc", 0.30)),
+        "use_smoothed": bool(b.get("use_smoothed", True)),
+    }
+
+def recommend_bids(df: pd.DataFrame, cfg: dict, target_acos: float = None) -> pd.DataFrame:
+    """
+    每行一个建议出价（整列计算，百万行约零点几秒），与 df 同索引：
+    - target_bid = 目标 ACOS × CVR × 客单价：让该词 ACOS 恰好等于目标的最高 CPC；
+      CVR 优先用贝叶斯平滑的 cvr_post（bids.use_smoothed），客单价 = 销售额/订单，
+      无订单时依次退回广告组、账户的客单价；
+    - 当前出价取实际平均 CPC（无点击时为 default_cpc）；
+    - recommended_bid = target_bid 限制在当前出价的 [1 - max_step_down, 1 + max_step_up] 倍以内，
+      再截断到 [min_bid, max_bid]；无点击的词保持当前出价。
+    """
+    b = _bid_settings(cfg)
+    ta = float(target_acos if target_acos is not None else
+               (b["target_acos"] if b["target_acos"] is not None else cfg.get("target_acos", 0.50)))
+    clicks = df["clicks"].to_numpy(dtype="float64")
+    orders = df["orders"].to_numpy(dtype="float64")
+    sales  = df["sales"].to_numpy(dtype="float64")
+    spend  = df["spend"].to_numpy(dtype="float64")
+
+    cpc = _safe_div_array(spend, clicks)
+    current = np.where(cpc > 0, cpc, b["default_cpc"])
+    if b["use_smoothed"] and "cvr_post" in df.columns:
+        cvr = df["cvr_post"].to_numpy(dtype="float64")
+    else:
+        cvr = _safe_div_array(orders, clicks)
+
+    if len(df):
+        adg = df.groupby(["campaign", "ad_group"], sort=False, observed=True, dropna=False).ngroup().to_numpy()
+        aov_adg = _safe_div_array(np.bincount(adg, weights=sales), np.bincount(adg, weights=orders))[adg]
+    else:
+        aov_adg = np.zeros(0)
+    aov0 = sales.sum() / orders.sum() if orders.sum() else 0.0
+    aov = np.where(orders > 0, _safe_div_array(sales, orders), np.where(aov_adg > 0, aov_adg, aov0))
+
+    target = ta * cvr * aov
+    # 步长上下限取整到分（向内取整），保证取整后的调价幅度不超过 max_step_up / max_step_down
+    current = np.round(current, 2)
+    hi = np.floor(np.round(current * (1 + b["max_step_up"]) * 100, 6)) / 100
+    lo = np.ceil(np.round(current * (1 - b["max_step_down"]) * 100, 6)) / 100
+    rec = np.clip(np.round(target, 2), lo, hi)
+    rec = np.where(clicks > 0, rec, current)
+    rec = np.clip(rec, b["min_bid"], b["max_bid"])
+    return pd.DataFrame({
+        "current_bid": current,
+        "target_bid": np.round(target, 2),
+        "recommended_bid": rec,
+        "bid_change": _safe_div_array(rec - current, current),
+    }, index=df.index)
+
+def _bid_sheet(parts: dict) -> pd.DataFrame:
+    """
+    {来源表名: 带出价列的数据} → 出价调整表（只保留需要改价的词）。报表没有投放 / 匹配方式，行是搜索词级的
+    「建议精确出价」（Suggested Exact Bid）：只有当同一广告组已有同词的精确关键词时，bulksheet 才会转成关键词改价。
+    """
+    frames = []
+    for source, part in parts.items():
+        part = part[part["recommended_bid"] != part["current_bid"]]
+        frames.append(pd.DataFrame({
+            "Campaign Name": part["campaign"].astype(str).to_numpy(),
+            "Ad Group Name": part["ad_group"].astype(str).to_numpy(),
+            "Search Term": part["search_term"].astype(str).to_numpy(),
+            "Bid Type": "Suggested Exact Bid",
+            "Current Bid": part["current_bid"].to_numpy(),
+            "Target Bid": part["target_bid"].to_numpy(),
+            "Recommended Bid": part["recommended_bid"].to_numpy(),
+            "Change %": np.round(part["bid_change"].to_numpy() * 100, 1),
+            "Action": np.where(part["recommended_bid"].to_numpy() > part["current_bid"].to_numpy(), "Increase", "Decrease"),
+            "Source": source,
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+# ---------- 汇总立方体（搜索词 → 广告组 → 活动 → 账户） ----------
+ROLLUP_LEVELS = ["account", "campaign", "ad_group"]
+
+def _rollup_rates(df: pd.DataFrame) -> pd.DataFrame:
+    df["ctr"]  = _safe_div_array(df["clicks"], df["impressions"])
+    df["cpc"]  = _safe_div_array(df["spend"],  df["clicks"])
+    df["acos"] = _safe_div_array(df["spend"],  df["sales"])
+    df["cvr"]  = _safe_div_array(df["orders"], df["clicks"])
+    return df
+
+def _text_keys(s: pd.Series) -> pd.Series:
+    """文本键列（含 category）→ 字符串，缺失值为 ""。"""
+    s = s.astype(object)
+    return s.where(s.notna(), "").astype(str)
+
+def build_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    逐级汇总表：只对全量数据做一次 (campaign, ad_group) groupby，活动 / 账户层在这份小表上再相加。
+    列：level（account / campaign / ad_group）、campaign、ad_group、terms（搜索词行数）、各计数指标与比率；
+    同一层内按花费降序。上层行的 campaign / ad_group 为空字符串。
+    """
+    num = ["impressions", "clicks", "spend", "sales", "orders"]
+    adg = df.groupby(["campaign", "ad_group"], sort=False, observed=True, dropna=False)   # 空键的行也计入合计
+    adg = adg[num].sum().join(adg.size().rename("terms")).reset_index()
+    for c in ["campaign", "ad_group"]:
+        adg[c] = _text_keys(adg[c])
+    cols = ["terms"] + num
+    camp = adg.groupby("campaign", sort=False)[cols].sum().reset_index().assign(ad_group="")
+    acct = pd.DataFrame([adg[cols].sum()]).assign(campaign="", ad_group="")
+    parts = []
+    for level, part in zip(ROLLUP_LEVELS, [acct, camp, adg]):
+        part = part.assign(level=level).sort_values("spend", ascending=False, kind="stable")
+        parts.append(part[["level", "campaign", "ad_group"] + cols])
+    out = pd.concat(parts, ignore_index=True)
+    for c in ["terms", "impressions", "clicks", "orders"]:
+        out[c] = out[c].astype("int64")
+    return _rollup_rates(out)
+
+class RollupCube:
+    """
+    build_rollup 结果的查询索引：节点、下级列表、某个广告组的搜索词都是字典查找 + 切片，
+    下钻时不再对 All_Terms 做 groupby / 布尔筛选。
+    """
+    def __init__(self, rollup: pd.DataFrame, terms: pd.DataFrame = None):
+        self.table = rollup.reset_index(drop=True)
+        level = self.table["level"].to_numpy()
+        camp = self.table["campaign"].to_numpy()
+        adg = self.table["ad_group"].to_numpy()
+        self._pos = {}
+        for i, key in enumerate(zip(camp, adg)):
+            self._pos.setdefault(key, i)   # 空活动名的汇总行不覆盖账户行 ("", "")
+        self._children = {None: np.flatnonzero(level == "campaign")}
+        is_adg = np.flatnonzero(level == "ad_group")
+        for c, rel in pd.Series(camp[is_adg]).groupby(camp[is_adg], sort=False).indices.items():
+            self._children[c] = is_adg[rel]
+
+        self.terms_df = terms
+        self._term_slices = {}
+        if terms is not None and len(terms):
+            codes = terms.groupby(["campaign", "ad_group"], sort=False, observed=True, dropna=False).ngroup().to_numpy()
+            self._term_order = np.argsort(codes, kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(codes))])
+            _, first = np.unique(codes, return_index=True)
+            keys = zip(_text_keys(terms["campaign"].iloc[first]), _text_keys(terms["ad_group"].iloc[first]))
+            for code, key in enumerate(keys):
+                self._term_slices[key] = (bounds[code], bounds[code + 1])
+
+    def node(self, campaign: str = None, ad_group: str = None) -> pd.Series:
+        """账户（不传参数）/ 活动 / 广告组的汇总行；不存在时返回 None。"""
+        i = self._pos.get((campaign or "", ad_group or ""))
+        return None if i is None else self.table.iloc[i]
+
+    def children(self, campaign: str = None) -> pd.DataFrame:
+        """不传 campaign：全部活动；传 campaign：该活动下的广告组（按花费降序）。"""
+        return self.table.iloc[self._children.get(campaign, np.array([], dtype=int))]
+
+    def terms(self, campaign: str, ad_group: str) -> pd.DataFrame:
+        """某个广告组下的全部搜索词行（All_Terms 中的原始行）。"""
+        if self.terms_df is None or (campaign, ad_group) not in self._term_slices:
+            return pd.DataFrame()
+        lo, hi = self._term_slices[(campaign, ad_group)]
+        return self.terms_df.iloc[self._term_order[lo:hi]]
+
+
+# ---------- v1.1 行动表（提价 ➝ 拆词 / SKAG / 否定） ----------
+V11_SHEETS = ["All_Analyzed","To_Exact_Split","Keep_Testing","BidDown_or_Neg","SKAG_Plan","Neg_Exact","Neg_Phrase_Roots"]
+_V11_RENAME_MAP = {
+    # 搜索词
+    "Customer Search Term": "search_term",
+    "customer_search_term": "search_term",
+    "Search Term": "search_term",
+    "Query": "search_term",
+    # 指标
+    "Clicks": "clicks",
+    "Impressions": "impressions",
+    "Spend": "spend",
+    "Cost": "spend",
+    "7 Day Total Sales": "sales",
+    "Sales": "sales",
+    "7 Day Total Orders (#)": "orders",
+    "Orders": "orders",
+    # 结构
+    "Campaign Name": "campaign",
+    "Ad Group Name": "ad_group",
+}
+
+def _standardize_columns(df):
+    """
+    将常见的列名映射成标准列，便于统一计算。
+    有则映射，无则忽略（保持鲁棒）。
+    """
+    present = set(df.columns)
+    rename = {}
+    for k, v in _V11_RENAME_MAP.items():
+        if k in present and v not in present:
+            rename[k] = v
+            present.discard(k)
+            present.add(v)
+    return df.rename(columns=rename) if rename else df
+
+def _ensure_metrics(df):
+    """
+    确保 df 具备 ctr / cpc / acos / cvr 指标；若缺失则计算。
+    全部为列运算；输入已是标准化数值列时不复制数据。
+    """
+    df = _standardize_columns(df).copy(deep=False)
+    for col in ["clicks", "impressions", "spend", "sales", "orders"]:
+        if col in df.columns:
+            s = df[col]
+            if not is_numeric_dtype(s) or s.isna().any():
+                df[col] = pd.to_numeric(s, errors="coerce").fillna(0)
+    if "ctr" not in df.columns and {"clicks","impressions"}.issubset(df.columns):
+        df["ctr"] = _safe_div_array(df["clicks"], df["impressions"])
+    if "cpc" not in df.columns and {"spend","clicks"}.issubset(df.columns):
+        df["cpc"] = _safe_div_array(df["spend"], df["clicks"])
+    if "acos" not in df.columns and {"spend","sales"}.issubset(df.columns):
+        df["acos"] = _safe_div_array(df["spend"], df["sales"])
+    if "cvr" not in df.columns and {"orders","clicks"}.issubset(df.columns):
+        df["cvr"] = _safe_div_array(df["orders"], df["clicks"])
+    return df
+
+def _skag_plan(df_pass: pd.DataFrame, bids: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    SKAG 建组建议表（Exact 单词组），整列生成。
+    传入 bids（recommend_bids 的结果，与 df_pass 同索引）时：Start Bid = 建议出价，
+    Top of Search Adj 按目标出价相对建议出价的余量取整到 10%（0%~100%）；否则沿用 CPC × 1.0 与固定 30%~50%。
+    """
+    n = len(df_pass)
+    if "search_term" in df_pass.columns:
+        kw = df_pass["search_term"].astype(str).str.strip()
+    else:
+        kw = pd.Series([""] * n, index=df_pass.index, dtype=object)
+    if "cpc" in df_pass.columns:
+        cpc = df_pass["cpc"].to_numpy(dtype="float64")
+        base_cpc = np.where(cpc == 0, 0.3, cpc)
+    else:
+        base_cpc = np.full(n, 0.3)
+    # 初始出价 = 最近期平均CPC * 1.0，最低 0.05
+    start_bid = np.round(base_cpc * 1.00, 2)
+    start_bid = np.where(np.isnan(start_bid), 0.05, np.maximum(0.05, start_bid))
+    tos = "30%~50%"   # 增长型·中等档
+    if bids is not None:
+        start_bid = bids["recommended_bid"].to_numpy(dtype="float64")
+        headroom = _safe_div_array(bids["target_bid"].to_numpy(dtype="float64"), start_bid) - 1.0
+        tos = pd.Series(np.clip(np.round(headroom * 10), 0, 10).astype(int) * 10).astype(str).add("%").to_numpy()
+    return pd.DataFrame({
+        "Campaign Name": "Exact - SKAG - Core",
+        "Ad Group Name": ("Exact - " + kw.str[:70]).to_numpy(),
+        "Match Type": "Exact",
+        "Keyword": kw.to_numpy(),
+        "Start Bid": start_bid,
+        "Top of Search Adj": tos,
+        "Reason": "黄金词拆分，独立冲量",
+    }, index=pd.RangeIndex(n))
+
+def _build_v11_decision_tables(df_all_terms, cfg, target_acos=0.30, min_clicks=20, min_orders=2, conflict_index=None):
+    """
+    依据规则生成：黄金词（拆词建Exact）、继续测试、降价/否定，
+    并产出 SKAG 建组建议、否定清单（Exact / Phrase Roots 从 config.yaml）
+    conflict_index 为 calculate_metrics 结果里的 Conflict_Index 时复用，不再重建转化词索引。
+    """
+    df = _ensure_metrics(df_all_terms)
+
+    # 决策标签（同时命中时优先级：降价/否定 > 继续测试 > 拆词建Exact）
+    enough    = (df["clicks"] >= min_clicks).to_numpy()
+    few_ord   = (df["orders"] < min_orders).to_numpy()
+    acos      = df["acos"].to_numpy()
+    cond_pass = enough & ~few_ord & (acos <= target_acos)
+    cond_test = enough & (few_ord | ((acos > target_acos) & (acos <= target_acos + 0.10)))
+    if "acos_worsening" in df.columns and (cfg.get("trends", {}) or {}).get("block_scale_up_when_worsening", True):
+        worsening = df["acos_worsening"].to_numpy(dtype=bool)   # 近期 ACOS 恶化：先继续测试，不拆词
+        cond_test |= cond_pass & worsening
+        cond_pass &= ~worsening
+    cond_fail = enough & few_ord & (acos > target_acos + 0.10)
+
+    decision = np.select([cond_fail, cond_test, cond_pass], ["降价/否定", "继续测试", "拆词建Exact"], default="样本不足")
+    df_dec = df.assign(decision=decision)
+
+    df_pass = df_dec[decision == "拆词建Exact"].sort_values(["acos","clicks"], ascending=[True, False])
+    df_test = df_dec[decision == "继续测试"].sort_values(["clicks"], ascending=False)
+    df_fail = df_dec[decision == "降价/否定"].sort_values(["acos","clicks"], ascending=[False, False])
+
+    bids = None
+    if _bid_settings(cfg)["enabled"] and {"campaign", "ad_group", "clicks", "orders", "sales", "spend"}.issubset(df.columns):
+        # 出价按 v1.1 目标 ACOS 计算；客单价的广告组 / 账户兜底需要全量数据
+        bids = recommend_bids(df, cfg, target_acos).loc[df_pass.index]
+    df_skag = _skag_plan(df_pass, bids)
+
+    # 否定：点击≥min_clicks 且 无单 或 ACOS>50%
+    neg_mask = enough & ((df["orders"] == 0).to_numpy() | (acos > 0.50))
+    neg_exact = df_dec.loc[neg_mask, ["search_term","clicks","orders","spend","sales","acos"]]
+    neg_exact = neg_exact.rename(columns={"search_term":"Negative Term"}).assign(**{"Match Type": "Negative Exact"})
+    if {"campaign", "ad_group"}.issubset(df.columns):
+        # 该否定在所在广告组会挡住的订单（含单复数变体）与同词在其它广告组的订单
+        from ppc_conflicts import annotate_exact_negatives
+        neg_exact = annotate_exact_negatives(neg_exact, df_dec.loc[neg_mask, ["campaign", "ad_group"]], df, cfg,
+                                             index=conflict_index)
+
+    # ⬇️ 从 config.yaml 读取否定词根（negatives_scan.phrase_roots）
+    df_neg_phrase_roots = pd.DataFrame({"Negative Phrase Root": compile_config(cfg)["phrase_roots"]})
+
+    return df_dec, df_pass, df_test, df_fail, df_skag, neg_exact, df_neg_phrase_roots
+
+def _export_v11_excel(df_all, df_pass, df_test, df_fail, df_skag, df_neg_exact, df_neg_phrase):
+    from ppc_export import export_tables  # xlsxwriter constant_memory 流式写入
+    tables = dict(zip(V11_SHEETS, [df_all, df_pass, df_test, df_fail, df_skag, df_neg_exact, df_neg_phrase]))
+    return io.BytesIO(export_tables(tables, "xlsx"))
+
+# ---------- 端到端流程（无界面，供命令行 / 批量 / 定时任务复用） ----------
+_stage_local = threading.local()
+
+def _stage_path(timings) -> list:
+    """当前线程所在的阶段路径（如 ["analyze"]），供 ppc_stages 带到工作线程。"""
+    if hasattr(timings, "current_path"):
+        return timings.current_path()
+    return list(_stage_local.__dict__.get("stack", []))
+
+@contextmanager
+def _adopt_stage_path(timings, path):
+    """工作线程沿用调用线程的阶段路径，子阶段仍记为 父/子；path 为 None 时不做处理。"""
+    if path is None:
+        yield
+        return
+    if hasattr(timings, "adopt"):
+        with timings.adopt(path):
+            yield
+        return
+    old = _stage_local.__dict__.get("stack")
+    _stage_local.stack = list(path)
+    try:
+        yield
+    finally:
+        _stage_local.stack = old if old is not None else []
+
+@contextmanager
+def _stage(timings, name: str, rows: int = None, nbytes: int = None):
+    """
+    记录阶段耗时。timings 为 ppc_instrument.Instrument 时交给它（计时 + 行数 / 字节 / 内存）；
+    为 dict 时记 {阶段名: 秒}，嵌套阶段记为 "父/子"；为 None 时不计时。yield 的字典可写入 rows_out 等计数。
+    """
+    if hasattr(timings, "stage"):
+        with timings.stage(name, rows=rows, nbytes=nbytes) as rec:
+            yield rec
+        return
+    stack = _stage_local.__dict__.setdefault("stack", [])
+    key = "/".join(stack + [name])
+    stack.append(name)
+    t0 = time.perf_counter()
+    try:
+        yield {}
+    finally:
+        stack.pop()
+        if timings is not None:
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - t0
+
+def _src_nbytes(src):
+    """输入文件大小（路径或 BytesIO / 上传文件）；取不到时为 None。"""
+    if isinstance(src, (str, os.PathLike)):
+        return os.path.getsize(src) if os.path.exists(src) else None
+    if hasattr(src, "getbuffer"):
+        return src.getbuffer().nbytes
+    return getattr(src, "size", None)
+
+def v11_thresholds(cfg: dict, target_acos=None, min_clicks=None, min_orders=None) -> dict:
+    """v1.1 判定阈值：显式参数 > config.yaml 的 v11 段 > 页面滑块默认值。"""
+    v = cfg.get("v11", {}) or {}
+    return {
+        "target_acos": float(target_acos if target_acos is not None else v.get("target_acos", 0.30)),
+        "min_clicks":  int(min_clicks if min_clicks is not None else v.get("min_clicks", 20)),
+        "min_orders":  int(min_orders if min_orders is not None else v.get("min_orders", 2)),
+    }
+
+def run_pipeline(src, cfg: dict, name: str = None, timings: dict = None, **thresholds):
+    """
+    解析 → 标准化 → calculate_metrics → v1.1 行动表。
+    返回 (results, v11)：results 同 calculate_metrics；v11 为 {V11_SHEETS 名: DataFrame}。
+    """
+    if _should_stream(src, cfg, name):
+        with _stage(timings, "parse+standardize", nbytes=_src_nbytes(src)) as rec:
+            df = load_report_std(src, cfg, name=name)
+            rec["rows_out"] = len(df)
+    else:
+        with _stage(timings, "parse", nbytes=_src_nbytes(src)) as rec:
+            raw = read_report(src, name, cfg)
+            rec["rows_out"] = len(raw)
+        with _stage(timings, "standardize", rows=len(raw)) as rec:
+            df = standardize_df(raw, cfg)
+            rec["rows_out"] = len(df)
+            del raw
+    return run_pipeline_std(df, cfg, timings=timings, **thresholds)
+
+def run_pipeline_std(df: pd.DataFrame, cfg: dict, timings: dict = None, trends: pd.DataFrame = None, **thresholds):
+    """
+    已标准化数据（如历史库时间窗汇总）→ calculate_metrics → v1.1 行动表。
+    trends 为 ppc_trends.trend_snapshot 的输出时，先并入趋势列，规则会参考 acos_worsening。
+    """
+    if trends is not None:
+        from ppc_trends import attach_trends
+        with _stage(timings, "trends"):
+            df = attach_trends(df, trends)
+    with _stage(timings, "analyze", rows=len(df), nbytes=_frame_nbytes(df)):
+        results = calculate_metrics_from_std(df, cfg, timings=timings)
+    with _stage(timings, "v11_tables", rows=len(df)) as rec:
+        tables = _build_v11_decision_tables(results["All_Terms"], cfg, conflict_index=results.get("Conflict_Index"),
+                                            **v11_thresholds(cfg, **thresholds))
+        v11 = dict(zip(V11_SHEETS, tables))
+        rec["rows_out"] = len(v11["To_Exact_Split"])
+    return results, v11
@@ -0,0 +1,411 @@
+# ppc_service.py — 本地分析服务：HTTP 接口 + 工作进程池，上传报表后在后台跑 calculate_metrics 与 v1.1 行动表
+# 用法：python ppc_service.py [--config config.yaml] [--host 127.0.0.1] [--port 8765] [--workers 2]
+# 接口：
+#   POST   /jobs?name=report.csv[&target_acos=&min_clicks=&min_orders=]   请求体为报表原始字节；
+#          可选请求头 X-PPC-Config：base64(JSON) 配置，覆盖服务端 config.yaml（网页版会传完整配置）
+#          → 202 {"id", "status", "cached"}；相同 报表内容 + 配置 + 阈值 直接返回已有任务（结果缓存）
+#   GET    /jobs/<id>           状态：queued / running / done / error，含当前阶段与进度百分比、结果摘要
+#   GET    /jobs/<id>/result    结果 CSV 压缩包（calculate_metrics 各表 + V11_SHEETS）
+#   DELETE /jobs/<id>           取消排队中的任务 / 删除已完成任务的结果
+#   GET    /health
+# 不依赖外部组件（标准库 http.server + concurrent.futures）；网页版配置 service.url 后改为提交到这里并轮询。
+import argparse
+import base64
+import hashlib
+import io
+import json
+import logging
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+
+from ppc_optimizer_lib import load_config, validate_config, _config_hash, _deep_merge, V11_SHEETS, ANALYZE_STAGES
+
+logger = logging.getLogger("ppc.service")
+
+THRESHOLD_KEYS = ("target_acos", "min_clicks", "min_orders")
+
+def service_settings(cfg: dict) -> dict:
+    s = (cfg or {}).get("service", {}) or {}
+    return {
+        "url": (s.get("url") or "").rstrip("/") or None,
+        "host": str(s.get("host", "127.0.0.1")),
+        "port": int(s.get("port", 8765)),
+        "workers": max(1, int(s.get("workers") or 2)),
+        "executor": "thread" if str(s.get("executor", "process")).lower() == "thread" else "process",
+        "max_upload_mb": float(s.get("max_upload_mb", 500)),
+        "cache_entries": max(1, int(s.get("cache_entries", 16))),
+        "result_dir": s.get("result_dir") or None,
+        "poll_seconds": float(s.get("poll_seconds", 1.0)),
+    }
+
+# ---------- 工作进程：执行一个任务 ----------
+def _stage_progress(name: str) -> int:
+    """阶段名 → 大致进度百分比（解析 0–20，分析子阶段 20–80，行动表 85，写结果 90）。"""
+    if name in ("parse", "parse+standardize"):
+        return 5
+    if name == "standardize":
+        return 15
+    if name.startswith("analyze"):
+        sub = name.rsplit("/", 1)[-1]
+        return 20 + (int(60 * ANALYZE_STAGES.index(sub) / len(ANALYZE_STAGES)) if sub in ANALYZE_STAGES else 0)
+    if name == "v11_tables":
+        return 85
+    return 90
+
+def _write_json(path: str, obj: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)   # 原子替换，读取方不会读到半个文件
+
+def run_job(job: dict) -> dict:
+    """
+    在工作进程（或线程）中执行：读取 job["upload"] → run_pipeline → 结果表写成 CSV 压缩包 job["result"]。
+    进度写到 job["progress"]（JSON），服务端轮询读取；返回结果摘要（不回传 DataFrame）。
+    """
+    from ppc_optimizer_lib import run_pipeline
+    from ppc_instrument import Instrument
+    from ppc_export import export_tables
+
+    def _on_stage(name, depth):
+        _write_json(job["progress"], {"stage": name, "progress": _stage_progress(name)})
+
+    inst = Instrument(label=job["name"], listener=_on_stage)
+    try:
+        results, v11 = run_pipeline(job["upload"], job["cfg"], name=job["name"], timings=inst, **job["thresholds"])
+        tables = {k: v for k, v in list(results.items()) + list(v11.items()) if isinstance(v, pd.DataFrame)}
+        with inst.stage("export"):
+            export_tables(tables, "csv_zip", dest=job["result"] + ".tmp")
+            os.replace(job["result"] + ".tmp", job["result"])
+    finally:
+        if os.path.exists(job["upload"]):
+            os.remove(job["upload"])
+    df = results["All_Terms"]
+    return {
+        "rows": int(len(df)),
+        "tables": {k: int(len(v)) for k, v in tables.items()},
+        "spend": round(float(df["spend"].sum()), 2),
+        "sales": round(float(df["sales"].sum()), 2),
+        "seconds": round(inst.total_seconds, 3),
+        "timings": {k: round(v, 4) for k, v in inst.timings.items()},
+    }
+
+# ---------- 任务队列 ----------
+class JobQueue:
+    """
+    任务表 + 工作池。任务编号取 sha1(报表内容 + 配置哈希 + 阈值) 的前 16 位：相同输入直接复用已有任务与结果文件。
+    已结束的任务最多保留 cache_entries 个（按结束先后淘汰，同时删除结果文件）。
+    """
+    def __init__(self, cfg: dict, settings: dict = None):
+        self.cfg = cfg
+        self.st = settings or service_settings(cfg)
+        self.result_dir = self.st["result_dir"] or tempfile.mkdtemp(prefix="ppc_service_")
+        os.makedirs(self.result_dir, exist_ok=True)
+        self.pool = self._make_pool()
+        self.jobs = OrderedDict()
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _make_pool(self):
+        if self.st["executor"] == "process":
+            # spawn：服务本身是多线程的，fork 不安全
+            return ProcessPoolExecutor(max_workers=self.st["workers"], mp_context=mp.get_context("spawn"))
+        return ThreadPoolExecutor(max_workers=self.st["workers"], thread_name_prefix="ppc-job")
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.result_dir, f"{job_id}{suffix}")
+
+    def submit(self, data: bytes, name: str, overrides: dict = None, thresholds: dict = None) -> tuple:
+        """→ (任务状态 dict, 是否命中已有任务)。配置校验不通过时抛 ValueError。"""
+        cfg = _deep_merge(self.cfg, overrides) if overrides else self.cfg
+        errors, _ = validate_config(cfg)
+        if errors:
+            raise ValueError("配置校验失败：" + "；".join(errors))
+        thresholds = {k: v for k, v in (thresholds or {}).items() if v is not None}
+        h = hashlib.sha1(data)
+        h.update(_config_hash(cfg).encode())
+        h.update(json.dumps(thresholds, sort_keys=True).encode())
+        job_id = h.hexdigest()[:16]
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job["status"] != "error":
+                return self._status(job), True
+            job = {"id": job_id, "name": name, "status": "queued", "stage": None, "progress": 0,
+                   "created": time.time(), "finished": None, "error": None, "summary": None}
+            self.jobs[job_id] = job
+        with open(self._path(job_id, ".upload"), "wb") as f:
+            f.write(data)
+        spec = {"name": name, "cfg": cfg, "thresholds": thresholds,
+                "upload": self._path(job_id, ".upload"), "result": self._path(job_id, ".zip"),
+                "progress": self._path(job_id, ".progress.json")}
+        try:
+            fut = self.pool.submit(run_job, spec)
+        except BrokenProcessPool:   # 之前有工作进程异常退出（如内存不足被杀）：重建进程池
+            self.pool = self._make_pool()
+            fut = self.pool.submit(run_job, spec)
+        with self._lock:
+            self._futures[job_id] = fut
+        fut.add_done_callback(lambda f, job_id=job_id: self._finish(job_id, f))
+        logger.info("job %s queued (%s, %d bytes)", job_id, name, len(data))
+        return self._status(job), False
+
+    def _finish(self, job_id: str, fut):
+        with self._lock:
+            self._futures.pop(job_id, None)
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job["finished"] = time.time()
+            if fut.cancelled():
+                job.update(status="error", error="cancelled")
+            elif fut.exception() is not None:
+                job.update(status="error", error=f"{type(fut.exception()).__name__}: {fut.exception()}")
+            else:
+                job.update(status="done", stage=None, progress=100, summary=fut.result())
+            self._remove_file(job_id, ".progress.json")
+            self.jobs.move_to_end(job_id)
+            finished = [j for j, v in self.jobs.items() if v["status"] in ("done", "error")]
+            for old in finished[:max(0, len(finished) - self.st["cache_entries"])]:
+                self.jobs.pop(old)
+                self._remove_file(old, ".zip")
+        logger.info("job %s %s", job_id, job["status"] if job["error"] is None else f"failed: {job['error']}")
+
+    def _remove_file(self, job_id: str, suffix: str):
+        try:
+            os.remove(self._path(job_id, suffix))
+        except FileNotFoundError:
+            pass
+
+    def _status(self, job: dict) -> dict:
+        out = dict(job)
+        if out["status"] == "queued":
+            try:   # 工作进程开始执行后才会写进度文件
+                with open(self._path(job["id"], ".progress.json"), encoding="utf-8") as f:
+                    out.update(json.load(f), status="running")
+            except (FileNotFoundError, ValueError):
+                pass
+        return out
+
+    def status(self, job_id: str):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else self._status(job)
+
+    def result_path(self, job_id: str):
+        job = self.status(job_id)
+        return self._path(job_id, ".zip") if job and job["status"] == "done" else None
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            fut = self._futures.get(job_id)
+            if fut is not None and not fut.cancel():
+                return False   # 已在执行，无法中断
+            self.jobs.pop(job_id)
+            self._futures.pop(job_id, None)
+        for suffix in (".zip", ".upload", ".progress.json"):
+            self._remove_file(job_id, suffix)
+        return True
+
+    def health(self) -> dict:
+        with self._lock:
+            counts = {}
+            for j in self.jobs.values():
+                s = self._status(j)["status"]
+                counts[s] = counts.get(s, 0) + 1
+        return {"status": "ok", "workers": self.st["workers"], "executor": self.st["executor"], "jobs": counts}
+
+    def shutdown(self, wait: bool = True):
+        """取消排队中的任务；wait=True 时等正在执行的任务结束。"""
+        self.pool.shutdown(wait=wait, cancel_futures=True)
+
+# ---------- HTTP ----------
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ppc-service/1.0"
+
+    def _json(self, code: int, obj: dict):
+        body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        return parts, urllib.parse.parse_qs(url.query)
+
+    def do_GET(self):
+        queue, (parts, _) = self.server.queue, self._route()
+        if parts == ["health"]:
+            return self._json(200, queue.health())
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = queue.status(parts[1])
+            return self._json(200, job) if job else self._json(404, {"error": "job not found"})
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            path = queue.result_path(parts[1])
+            if path is None or not os.path.exists(path):
+                return self._json(404, {"error": "result not ready"})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Content-Disposition", f'attachment; filename="ppc_{parts[1]}.zip"')
+            self.end_headers()
+            with open(path, "rb") as f:
+                while chunk := f.read(1 << 20):
+                    self.wfile.write(chunk)
+            return
+        self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        queue, (parts, query) = self.server.queue, self._route()
+        if parts != ["jobs"]:
+            return self._json(404, {"error": "not found"})
+        size = int(self.headers.get("Content-Length") or 0)
+        if size <= 0:
+            return self._json(400, {"error": "empty report"})
+        if size > queue.st["max_upload_mb"] * 1024 * 1024:
+            return self._json(413, {"error": f"report larger than {queue.st['max_upload_mb']:.0f} MB"})
+        data = self.rfile.read(size)
+        name = (query.get("name") or ["report.csv"])[0]
+        try:
+            thresholds = {k: (float if k == "target_acos" else int)(query[k][0]) for k in THRESHOLD_KEYS if k in query}
+            raw_cfg = self.headers.get("X-PPC-Config")
+            overrides = json.loads(base64.b64decode(raw_cfg)) if raw_cfg else None
+            job, cached = queue.submit(data, name, overrides, thresholds)
+        except (ValueError, TypeError) as e:
+            return self._json(400, {"error": str(e)})
+        self._json(200 if cached else 202, dict(job, cached=cached))
+
+    def do_DELETE(self):
+        queue, (parts, _) = self.server.queue, self._route()
+        if len(parts) == 2 and parts[0] == "jobs":
+            if queue.delete(parts[1]):
+                return self._json(200, {"id": parts[1], "deleted": True})
+            return self._json(409 if queue.status(parts[1]) else 404, {"error": "job running or not found"})
+        self._json(404, {"error": "not found"})
+
+    def log_message(self, fmt, *args):
+        logger.debug("%s - %s", self.address_string(), fmt % args)
+
+def make_server(cfg: dict, host: str = None, port: int = None, workers: int = None) -> ThreadingHTTPServer:
+    """创建服务（未启动）；server.queue 为 JobQueue。调用 serve_forever() 运行，shutdown() + queue.shutdown() 停止。"""
+    st = service_settings(cfg)
+    if workers:
+        st["workers"] = int(workers)
+    server = ThreadingHTTPServer((host or st["host"], st["port"] if port is None else int(port)), _Handler)
+    server.daemon_threads = True
+    server.queue = JobQueue(cfg, st)
+    return server
+
+# ---------- 客户端（网页版 / 脚本调用） ----------
+def _request(req, timeout: float) -> dict:
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        try:
+            msg = json.loads(e.read().decode("utf-8")).get("error")
+        except ValueError:
+            msg = e.reason
+        raise RuntimeError(f"分析服务返回 {e.code}：{msg}") from None
+
+def submit_job(url: str, data: bytes, name: str, cfg: dict = None, timeout: float = 60, **thresholds) -> dict:
+    """提交报表；cfg 给出时随请求发送（服务端以此为准）。返回任务状态（含 cached）。"""
+    query = {"name": name, **{k: v for k, v in thresholds.items() if v is not None}}
+    headers = {"Content-Type": "application/octet-stream"}
+    if cfg is not None:
+        headers["X-PPC-Config"] = base64.b64encode(json.dumps(cfg, default=str).encode("utf-8")).decode("ascii")
+    req = urllib.request.Request(f"{url.rstrip('/')}/jobs?{urllib.parse.urlencode(query)}", data=bytes(data),
+                                 headers=headers, method="POST")
+    return _request(req, timeout)
+
+def job_status(url: str, job_id: str, timeout: float = 10) -> dict:
+    return _request(urllib.request.Request(f"{url.rstrip('/')}/jobs/{job_id}"), timeout)
+
+def wait_for_job(url: str, job_id: str, poll: float = 1.0, timeout: float = None, progress=None) -> dict:
+    """轮询到任务结束；progress(stage, pct) 每次轮询回调。失败时抛 RuntimeError。"""
+    t0 = time.monotonic()
+    while True:
+        job = job_status(url, job_id)
+        if progress is not None:
+            progress(job.get("stage"), int(job.get("progress") or 0))
+        if job["status"] == "done":
+            return job
+        if job["status"] == "error":
+            raise RuntimeError(f"分析任务失败：{job['error']}")
+        if timeout is not None and time.monotonic() - t0 > timeout:
+            raise TimeoutError(f"分析任务 {job_id} 超时（{timeout:.0f}s）")
+        time.sleep(poll)
+
+# 结果表里的文本列：CSV 往返时一律按字符串读，纯数字的活动 / 广告组名不变成整数
+_TEXT_COLUMNS = dict.fromkeys([
+    "campaign", "ad_group", "search_term", "level", "decision",
+    "Search Term", "Customer Search Term", "Negative Term", "Negative Keyword", "Negative Phrase Root", "Keyword",
+    "Campaign Name", "Ad Group Name", "Match Type", "Match", "Bid Type", "Action", "Reason", "Source", "Negative", "Sample Terms",
+    "Token", "SampleTerms", "Recommendation", "Cluster", "Representative", "Samples", "Cluster Action", "Top of Search Adj",
+], str)
+
+def fetch_results(url: str, job_id: str, timeout: float = 300) -> tuple:
+    """下载结果压缩包 → (results, v11)，与 run_pipeline 的返回结构一致（表经 CSV 往返，分类列变为普通字符串列）。"""
+    with urllib.request.urlopen(f"{url.rstrip('/')}/jobs/{job_id}/result", timeout=timeout) as resp:
+        payload = resp.read()
+    results, v11 = {}, {}
+    with zipfile.ZipFile(io.BytesIO(payload)) as zf:
+        for info in zf.infolist():
+            table = info.filename.rsplit(".", 1)[0]
+            with zf.open(info) as fh:
+                # 只有空单元格算缺失：搜索词 "null" / "n/a" / "None" 原样保留
+                df = pd.read_csv(fh, encoding="utf-8-sig", dtype=_TEXT_COLUMNS, keep_default_na=False, na_values=[""])
+            for c in df.columns.intersection(list(_TEXT_COLUMNS)):
+                df[c] = df[c].fillna("")   # 汇总行的空 campaign / ad_group 不变成 NaN
+            (v11 if table in V11_SHEETS else results)[table] = df
+    return results, v11
+
+def service_available(url: str, timeout: float = 2) -> bool:
+    try:
+        return _request(urllib.request.Request(f"{url.rstrip('/')}/health"), timeout).get("status") == "ok"
+    except (OSError, RuntimeError, ValueError):
+        return False
+
+# ---------- 命令行 ----------
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="ppc-service", description="本地分析服务（HTTP 接口 + 工作进程池）")
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--host", default=None, help="默认取 service.host（127.0.0.1）")
+    ap.add_argument("--port", type=int, default=None, help="默认取 service.port（8765）")
+    ap.add_argument("--workers", type=int, default=None, help="并行任务数，默认取 service.workers")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    server = make_server(load_config(args.config), args.host, args.port, args.workers)
+    host, port = server.server_address[:2]
+    st = server.queue.st
+    print(f"🛰️  ppc-service 运行于 http://{host}:{port}（{st['executor']} × {st['workers']}，结果目录 {server.queue.result_dir}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.queue.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,169 @@
+# ppc_stages.py — calculate_metrics_from_std 的阶段调度：互不依赖的分支并发执行，结果按声明顺序汇总（与串行完全一致）
+# executor：serial（逐个执行）/ thread（线程池，NumPy / pandas 部分释放 GIL）/
+#           process（在 thread 基础上，把纯 Python 分词的词库建议与变体聚类放到子进程，标准化列经共享内存传递）
+import atexit
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from ppc_optimizer_lib import _stage, _stage_path, _adopt_stage_path
+from ppc_clusters import cluster_keys
+
+EXECUTORS = ("serial", "thread", "process")
+
+def stage_settings(cfg: dict) -> dict:
+    s = (cfg or {}).get("stages", {}) or {}
+    executor = str(s.get("executor", "thread")).lower()
+    workers = int(s.get("workers") or 0) or min(4, os.cpu_count() or 1)
+    return {
+        "executor": executor if executor in EXECUTORS else "thread",
+        "workers": max(1, workers),
+        "process_min_rows": int(s.get("process_min_rows", 200_000)),
+    }
+
+# ---------- 调度 ----------
+def run_stage_graph(stages: list, timings=None, executor: str = "thread", workers: int = 4, rows: int = None) -> dict:
+    """
+    stages：[(名称, fn(已完成结果 dict) → 结果, 依赖的阶段名列表, 计数 fn(结果) → 行数 或 None)]。
+    依赖满足即提交到线程池；返回 {名称: 结果}，顺序同 stages，与完成先后无关。
+    timings 在调用线程中的阶段路径（如 analyze）会带到工作线程，子阶段仍记为 analyze/<名称>。
+    开启 cProfile / tracemalloc 时强制串行（两者按线程 / 全局计量，并发下数据不可信）。
+    """
+    if getattr(timings, "requires_serial", False) or workers <= 1:
+        executor = "serial"
+    done = {}
+
+    def _run(name, fn, count, path=None):
+        with _adopt_stage_path(timings, path):
+            with _stage(timings, name, rows=rows) as rec:
+                out = fn(done)
+                if count is not None:
+                    rec["rows_out"] = count(out)
+        return out
+
+    if executor == "serial":
+        for name, fn, deps, count in stages:
+            done[name] = _run(name, fn, count)
+        return {name: done[name] for name, *_ in stages}
+
+    path = _stage_path(timings)
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ppc-stage") as pool:
+        try:
+            while pending or running:
+                for st in [s for s in pending if all(d in done for d in s[2])]:
+                    pending.remove(st)
+                    name, fn, _, count = st
+                    running[pool.submit(_run, name, fn, count, path)] = name
+                if not running:
+                    raise ValueError(f"阶段依赖无法满足：{[s[0] for s in pending]}")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    done[running.pop(fut)] = fut.result()
+        except BaseException:
+            for fut in running:
+                fut.cancel()
+            raise
+    return {name: done[name] for name, *_ in stages}
+
+# ---------- 共享内存：标准化列交给子进程 ----------
+class SharedColumns:
+    """
+    把 search_term（分类编码 + UTF-8 词表）与 clicks / orders 放进一块共享内存；spec 可 pickle，
+    子进程用 attach_frame / attach_terms 重建，不再序列化整列字符串。用完调用 close()。
+    """
+    def __init__(self, df: pd.DataFrame):
+        codes, cats = cluster_keys(df["search_term"])   # 与 assign_clusters 的去重口径一致
+        encoded = [c.encode("utf-8") for c in cats]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        arrays = {
+            "codes": np.asarray(codes, dtype=np.int32),
+            "offsets": offsets,
+            "blob": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "clicks": df["clicks"].to_numpy(),
+            "orders": df["orders"].to_numpy(),
+        }
+        layout, size = {}, 0
+        for key, a in arrays.items():
+            layout[key] = (a.dtype.str, a.shape, size)
+            size += (a.nbytes + 7) // 8 * 8
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 8))
+        for key, a in arrays.items():
+            dt, shape, off = layout[key]
+            np.ndarray(shape, dtype=dt, buffer=self.shm.buf, offset=off)[...] = a
+        self.spec = {"name": self.shm.name, "layout": layout}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def _attach(spec: dict) -> dict:
+    try:
+        shm = shared_memory.SharedMemory(name=spec["name"], track=False)
+    except TypeError:   # Python < 3.13 没有 track 参数
+        shm = shared_memory.SharedMemory(name=spec["name"])
+    try:
+        return {key: np.ndarray(shape, dtype=dt, buffer=shm.buf, offset=off).copy()
+                for key, (dt, shape, off) in spec["layout"].items()}
+    finally:
+        shm.close()
+
+def _decode_terms(a: dict) -> list:
+    blob, offsets = a["blob"].tobytes(), a["offsets"]
+    return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+def attach_terms(spec: dict) -> pd.Series:
+    return pd.Series(_decode_terms(_attach(spec)), dtype=object)
+
+def attach_frame(spec: dict) -> pd.DataFrame:
+    a = _attach(spec)
+    return pd.DataFrame({
+        "search_term": pd.Categorical.from_codes(a["codes"], _decode_terms(a)),
+        "clicks": a["clicks"],
+        "orders": a["orders"],
+    })
+
+# 子进程入口（模块级函数，spawn 方式可 pickle）
+def _lexicon_job(spec: dict, cfg: dict) -> pd.DataFrame:
+    from ppc_optimizer_lib import suggest_lexicon_updates
+    return suggest_lexicon_updates(attach_frame(spec), cfg)
+
+def _cluster_job(spec: dict, cfg: dict):
+    from ppc_clusters import cluster_terms
+    return cluster_terms(attach_terms(spec), cfg)
+
+_PROCESS_POOL = None
+_pool_lock = threading.Lock()
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """进程池单例（spawn：Streamlit 等多线程宿主里 fork 不安全），首次使用时创建，后续调用复用。"""
+    global _PROCESS_POOL
+    with _pool_lock:
+        if _PROCESS_POOL is None:
+            _PROCESS_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+        return _PROCESS_POOL
+
+def _reset_pool():
+    global _PROCESS_POOL
+    with _pool_lock:
+        if _PROCESS_POOL is not None:
+            _PROCESS_POOL.shutdown(wait=False, cancel_futures=True)
+            _PROCESS_POOL = None
+
+atexit.register(_reset_pool)
+
+def run_in_process(fn, shared: SharedColumns, cfg: dict, workers: int, fallback):
+    """在进程池里执行 fn(shared.spec, cfg)；进程池不可用时退回 fallback()（本线程内计算）。"""
+    try:
+        return process_pool(workers).submit(fn, shared.spec, cfg).result()
+    except (BrokenProcessPool, OSError):
+        _reset_pool()
+        return fallback()
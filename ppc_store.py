@@ -0,0 +1,361 @@
+# ppc_store.py — 历史数据库：按 日期/活动/广告组/搜索词 增量写入每日报表，任意时间窗一次索引查询汇总
+# 用法：
+#   python ppc_store.py ingest report.csv [more.csv …] --db history.sqlite [--date 2026-01-31] [--on-overlap replace|upsert]
+#   python ppc_store.py window --db history.sqlite --days 60 [--end 2026-01-31] --out out/
+#   python ppc_store.py info --db history.sqlite
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from ppc_optimizer_lib import (
+    load_config, _find_col, _resolve_columns, _standardize_base, _add_rate_metrics,
+    _compact_std_df, _std_compact_enabled, _add_bayes_metrics, read_xlsx_pruned, _STD_KEYS, _STD_NUM_COLS, _STD_TEXT_COLS,
+)
+
+_DATE_DEFAULTS = ["Date", "Start Date", "Day", "日期"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS term_daily (
+    date        TEXT    NOT NULL,           -- YYYY-MM-DD
+    campaign    TEXT    NOT NULL,
+    ad_group    TEXT    NOT NULL,
+    search_term TEXT    NOT NULL,
+    impressions INTEGER NOT NULL DEFAULT 0,
+    clicks      INTEGER NOT NULL DEFAULT 0,
+    spend       REAL    NOT NULL DEFAULT 0,
+    sales       REAL    NOT NULL DEFAULT 0,
+    orders      INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, campaign, ad_group, search_term)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ingest_log (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    source      TEXT,
+    ingested_at TEXT,
+    date_min    TEXT,
+    date_max    TEXT,
+    days        INTEGER,
+    rows_in     INTEGER,
+    rows_stored INTEGER,
+    rows_replaced INTEGER,
+    on_overlap  TEXT
+);
+"""
+_ROW_COLS = ["date"] + _STD_KEYS + _STD_NUM_COLS
+_STAGING_INSERT = f"INSERT INTO staging ({', '.join(_ROW_COLS)}) VALUES ({', '.join('?' * len(_ROW_COLS))})"
+
+def history_settings(cfg: dict) -> dict:
+    h = cfg.get("history", {}) or {}
+    return {
+        "db_path": h.get("db_path", "history.sqlite"),
+        "on_overlap": str(h.get("on_overlap", "replace")).lower(),
+        "window_days": int(h.get("window_days", 60)),
+    }
+
+# ---------- 日期列 ----------
+def _resolve_date_col(cols, cfg: dict):
+    m = (cfg.get("columns_map") or {})
+    return _find_col(list(cols), m.get("date", _DATE_DEFAULTS))
+
+def _parse_dates(s: pd.Series) -> np.ndarray:
+    """报表日期（2026-01-31 / Jan 31, 2026 / 01/31/2026 …）→ 'YYYY-MM-DD' 字符串；无法解析的为 None。"""
+    d = pd.to_datetime(s, errors="coerce")
+    out = d.dt.strftime("%Y-%m-%d").to_numpy(dtype=object)
+    out[d.isna().to_numpy()] = None
+    return out
+
+def _iter_std_chunks(src, cfg: dict, name: str = None, date: str = None, chunksize: int = 200_000):
+    """
+    逐块产出带 date 列、已按 (date, campaign, ad_group, search_term) 汇总的标准化数据。
+    报表没有日期列时必须传入 date（单日报表）。
+    """
+    name = str(name or src)
+    fixed = str(pd.Timestamp(date).date()) if date else None
+    if name.lower().endswith(".csv"):
+        own = isinstance(src, (str, os.PathLike))
+        fh = open(src, "rb") if own else src
+        try:
+            header = list(pd.read_csv(fh, nrows=0).columns)
+            fh.seek(0)
+            resolved = _resolve_columns(header, cfg)
+            date_col = None if fixed else _resolve_date_col(header, cfg)
+            if not fixed and not date_col:
+                raise ValueError(f"{name} 没有日期列（可在 columns_map.date 指定，或用 --date 指定报表日期）")
+            text_cols = {resolved[k] for k in _STD_TEXT_COLS if k in resolved}
+            usecols = list(dict.fromkeys(list(resolved.values()) + ([date_col] if date_col else [])))
+            reader = pd.read_csv(fh, usecols=usecols, dtype={c: str for c in text_cols}, chunksize=int(chunksize))
+            for chunk in reader:
+                yield _date_aggregate(chunk, cfg, resolved, date_col, fixed)
+        finally:
+            if own:
+                fh.close()
+    else:
+        raw, _ = read_xlsx_pruned(src, cfg, extra_cols=(cfg.get("columns_map") or {}).get("date", _DATE_DEFAULTS))
+        resolved = _resolve_columns(raw.columns, cfg)
+        date_col = None if fixed else _resolve_date_col(raw.columns, cfg)
+        if not fixed and not date_col:
+            raise ValueError(f"{name} 没有日期列（可在 columns_map.date 指定，或用 --date 指定报表日期）")
+        yield _date_aggregate(raw, cfg, resolved, date_col, fixed)
+
+def _date_aggregate(raw: pd.DataFrame, cfg: dict, resolved: dict, date_col, fixed) -> tuple:
+    df = _standardize_base(raw, cfg, resolved)
+    df["date"] = fixed if fixed else _parse_dates(raw[date_col].reset_index(drop=True))
+    n_in = len(df)
+    df = df[df["date"].notna()]
+    # dropna=False：空的 活动 / 广告组 / 搜索词 也入库，时间窗合计与原报表一致
+    agg = df.groupby(["date"] + _STD_KEYS, sort=False, as_index=False, dropna=False)[_STD_NUM_COLS].sum()
+    return agg[_ROW_COLS], n_in, n_in - len(df)
+
+# ---------- 数据库 ----------
+class HistoryStore:
+    """
+    SQLite 历史库（标准库自带，无需额外依赖）。
+    主键 (date, campaign, ad_group, search_term) 同时是聚簇索引：按日期区间汇总只扫描窗口内的行。
+    重叠日期的处理（on_overlap）：
+    - replace（默认）：新报表覆盖它包含的每一天（该天旧数据整天删除后写入；归因窗口内订单会回补，新导出更准）；
+    - upsert：只覆盖相同 (日期, 活动, 广告组, 搜索词) 的行，适合按活动拆分导出的报表。
+    """
+    def __init__(self, path: str = "history.sqlite"):
+        self.path = str(path)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- 写入 -----
+    def ingest_report(self, src, cfg: dict, name: str = None, date: str = None, on_overlap: str = None,
+                      strict: bool = False) -> dict:
+        """读取一份报表（CSV 分块 / XLSX 裁剪列）并增量写入；返回本次写入的统计。"""
+        chunk_rows = int((cfg.get("ingest", {}) or {}).get("chunk_rows", 200_000))
+        chunks = _iter_std_chunks(src, cfg, name=name, date=date, chunksize=chunk_rows)
+        return self.ingest_chunks(chunks, source=str(name or src),
+                                  on_overlap=on_overlap or history_settings(cfg)["on_overlap"], strict=strict)
+
+    def ingest_std(self, df: pd.DataFrame, source: str = "", on_overlap: str = "replace", strict: bool = False) -> dict:
+        """写入已标准化且带 date 列的数据（如 standardize_df 输出 + 日期）。"""
+        if "date" not in df.columns:
+            raise ValueError("ingest_std 需要 date 列")
+        df = df[_ROW_COLS].copy()
+        df["date"] = _parse_dates(df["date"])
+        for c in _STD_TEXT_COLS:
+            df[c] = df[c].where(df[c].notna(), "").astype(str)
+        n_in = len(df)
+        df = df[df["date"].notna()]
+        # dropna=False：空的 活动 / 广告组 / 搜索词 也入库，时间窗合计与原报表一致
+        agg = df.groupby(["date"] + _STD_KEYS, sort=False, as_index=False, dropna=False)[_STD_NUM_COLS].sum()
+        return self.ingest_chunks([(agg[_ROW_COLS], n_in, n_in - len(df))], source=source, on_overlap=on_overlap,
+                                  strict=strict)
+
+    def ingest_chunks(self, chunks, source: str = "", on_overlap: str = "replace", strict: bool = False) -> dict:
+        """
+        chunks 为 (已按主键汇总的数据, 读取行数, 日期无法解析而跳过的行数)。
+        分块先写入临时表，全部读完后在同一个事务里：按 on_overlap 删除重叠数据 →
+        对临时表按主键汇总（同一搜索词在多行出现时合并）→ 写入 term_daily。
+        读取失败时事务回滚，历史库保持原样；strict=True 时有日期无法解析的行也回滚并报错。
+        """
+        if on_overlap not in ("replace", "upsert"):
+            raise ValueError(f"on_overlap 只能是 replace / upsert：{on_overlap}")
+        t0 = time.perf_counter()
+        conn = self.conn
+        n_in = bad_dates = 0
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS temp.staging")
+            conn.execute("CREATE TEMP TABLE staging (date TEXT, campaign TEXT, ad_group TEXT, search_term TEXT, "
+                         "impressions INTEGER, clicks INTEGER, spend REAL, sales REAL, orders INTEGER)")
+            for part, rows, bad in chunks:
+                n_in += int(rows)
+                bad_dates += int(bad)
+                conn.executemany(_STAGING_INSERT, _to_records(part))
+            if strict and bad_dates:
+                raise ValueError(f"{source}：{bad_dates} 行日期无法解析（未写入任何数据）")
+
+            days = [r[0] for r in conn.execute("SELECT DISTINCT date FROM staging ORDER BY date")]
+            replaced = 0
+            if on_overlap == "replace" and days:
+                replaced = conn.execute(
+                    "DELETE FROM term_daily WHERE date IN (SELECT DISTINCT date FROM staging)").rowcount
+            cur = conn.execute(
+                "INSERT OR REPLACE INTO term_daily "
+                "SELECT date, campaign, ad_group, search_term, "
+                "SUM(impressions), SUM(clicks), SUM(spend), SUM(sales), SUM(orders) "
+                "FROM staging GROUP BY date, campaign, ad_group, search_term")
+            stored = cur.rowcount
+            conn.execute("DROP TABLE temp.staging")
+            stats = {
+                "source": source,
+                "ingested_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+                "date_min": days[0] if days else None,
+                "date_max": days[-1] if days else None,
+                "days": len(days),
+                "rows_in": n_in,
+                "rows_stored": stored,
+                "rows_replaced": replaced,
+                "on_overlap": on_overlap,
+            }
+            conn.execute("INSERT INTO ingest_log (source, ingested_at, date_min, date_max, days, rows_in, "
+                         "rows_stored, rows_replaced, on_overlap) VALUES (?,?,?,?,?,?,?,?,?)",
+                         tuple(stats.values()))
+        stats["rows_bad_date"] = bad_dates   # 日期无法解析、未入库的行（历史合计会比报表少这些行）
+        stats["seconds"] = round(time.perf_counter() - t0, 3)
+        return stats
+
+    # ----- 查询 -----
+    def date_range(self) -> tuple:
+        return tuple(self.conn.execute("SELECT MIN(date), MAX(date) FROM term_daily").fetchone())
+
+    def _window_bounds(self, days: int = None, end: str = None, start: str = None) -> tuple:
+        end = str(pd.Timestamp(end).date()) if end else self.date_range()[1]
+        if end is None:
+            return None, None
+        if start:
+            start = str(pd.Timestamp(start).date())
+        else:
+            start = str((pd.Timestamp(end) - pd.Timedelta(days=int(days or 60) - 1)).date())
+        return start, end
+
+    def window_std(self, days: int = None, end: str = None, start: str = None, cfg: dict = None) -> pd.DataFrame:
+        """
+        [start, end] 时间窗（默认截至库内最新日期的最近 days 天）按 (campaign, ad_group, search_term) 汇总，
+        返回与 standardize_df 相同结构的数据，可直接交给 calculate_metrics_from_std。
+        """
+        start, end = self._window_bounds(days, end, start)
+        df = pd.read_sql_query(
+            "SELECT search_term, SUM(clicks) AS clicks, SUM(impressions) AS impressions, SUM(spend) AS spend, "
+            "SUM(sales) AS sales, SUM(orders) AS orders, campaign, ad_group "
+            "FROM term_daily WHERE date BETWEEN ? AND ? "
+            "GROUP BY campaign, ad_group, search_term",
+            self.conn, params=(start or "", end or ""),
+        )
+        for c in _STD_NUM_COLS:
+            df[c] = pd.to_numeric(df[c]).fillna(0)
+        df = _compact_std_df(_add_rate_metrics(df), categorical=_std_compact_enabled(cfg or {}))
+        return _add_bayes_metrics(df, cfg or {})
+
+    def daily(self, days: int = None, end: str = None, start: str = None) -> pd.DataFrame:
+        """时间窗内的逐日明细（date, campaign, ad_group, search_term, 指标），按主键顺序。"""
+        start, end = self._window_bounds(days, end, start)
+        return pd.read_sql_query(
+            f"SELECT {', '.join(_ROW_COLS)} FROM term_daily WHERE date BETWEEN ? AND ? "
+            "ORDER BY date, campaign, ad_group, search_term",
+            self.conn, params=(start or "", end or ""),
+        )
+
+    def ingest_log(self) -> pd.DataFrame:
+        return pd.read_sql_query("SELECT * FROM ingest_log ORDER BY id", self.conn)
+
+    def info(self) -> dict:
+        n, terms = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT search_term) FROM term_daily").fetchone()
+        lo, hi = self.date_range()
+        n_days = self.conn.execute("SELECT COUNT(DISTINCT date) FROM term_daily").fetchone()[0]
+        return {"path": self.path, "rows": n, "search_terms": terms, "date_min": lo, "date_max": hi, "days": n_days}
+
+def _to_records(df: pd.DataFrame):
+    """DataFrame → 逐行元组（numpy 标量转为 Python 原生类型，sqlite3 才能绑定）。"""
+    cols = [df["date"].to_numpy(dtype=object)]
+    cols += [df[c].astype(str).to_numpy(dtype=object) for c in _STD_KEYS]
+    cols += [df[c].to_numpy(dtype="float64").tolist() for c in _STD_NUM_COLS]
+    return zip(*cols)
+
+# ---------- 命令行 ----------
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="PPC 历史库：增量写入每日报表 / 按时间窗汇总分析")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    ap_in = sub.add_parser("ingest", help="把报表增量写入历史库（重叠日期去重）")
+    ap_in.add_argument("reports", nargs="+")
+    ap_in.add_argument("--config", default="config.yaml")
+    ap_in.add_argument("--db", default=None, help="历史库路径（默认 history.db_path）")
+    ap_in.add_argument("--date", default=None, help="报表没有日期列时指定报表日期（YYYY-MM-DD）")
+    ap_in.add_argument("--on-overlap", choices=["replace", "upsert"], default=None)
+    ap_in.add_argument("--strict", action="store_true", help="有日期无法解析的行时整份报表不入库并报错")
+
+    ap_win = sub.add_parser("window", help="汇总时间窗并运行完整分析")
+    ap_win.add_argument("--config", default="config.yaml")
+    ap_win.add_argument("--db", default=None)
+    ap_win.add_argument("--days", type=int, default=None, help="窗口天数（默认 history.window_days）")
+    ap_win.add_argument("--end", default=None, help="窗口结束日期（默认库内最新日期）")
+    ap_win.add_argument("--start", default=None, help="窗口开始日期（指定后忽略 --days）")
+    ap_win.add_argument("--out", default="out")
+    ap_win.add_argument("--format", default="csv", choices=["csv", "xlsx", "csv_zip", "parquet"])
+    ap_win.add_argument("--no-trends", action="store_true", help="不计算 7/14/30 天趋势（规则只看窗口合计）")
+    ap_win.add_argument("--daily-trends", action="store_true",
+                        help="另输出 Trend_Daily：窗口内每个搜索词每天的 7/14/30 天滚动指标与日环比")
+
+    ap_info = sub.add_parser("info", help="历史库概况与写入记录")
+    ap_info.add_argument("--config", default="config.yaml")
+    ap_info.add_argument("--db", default=None)
+
+    args = ap.parse_args(argv)
+    cfg = load_config(args.config)
+    settings = history_settings(cfg)
+    with closing(HistoryStore(args.db or settings["db_path"])) as store:
+        if args.cmd == "ingest":
+            failed = 0
+            for path in args.reports:
+                try:
+                    st = store.ingest_report(path, cfg, name=path, date=args.date, on_overlap=args.on_overlap,
+                                             strict=args.strict)
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ {path}: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+                print(f"✅ {path}: {st['date_min']} ~ {st['date_max']}（{st['days']} 天）｜ 读取 {st['rows_in']} 行 ｜ "
+                      f"写入 {st['rows_stored']} 行 ｜ 覆盖旧数据 {st['rows_replaced']} 行 ｜ {st['seconds']}s")
+                if st["rows_bad_date"]:
+                    print(f"⚠️  {path}: {st['rows_bad_date']} 行日期无法解析，已跳过（可加 --strict 拒绝入库）", file=sys.stderr)
+            return 1 if failed else 0
+
+        if args.cmd == "window":
+            from ppc_optimizer_lib import run_pipeline_std
+            from ppc_optimize import write_tables
+            days = args.days or settings["window_days"]
+            start, end = store._window_bounds(days, args.end, args.start)
+            if end is None:
+                print("历史库为空，请先 ingest", file=sys.stderr)
+                return 1
+            df = store.window_std(days=days, end=end, start=start, cfg=cfg)
+            trends = None
+            if not args.no_trends:
+                from ppc_trends import rolling_trends, trend_settings, trend_snapshot
+                st = trend_settings(cfg)
+                lookback = max(max(st["windows"]), 2 * st["worsening_window"])
+                trends = trend_snapshot(store.daily(days=lookback, end=end), cfg, end=end)
+            results, v11 = run_pipeline_std(df, cfg, trends=trends)
+            if trends is not None and args.daily_trends:
+                # 窗口第一天的滚动值需要再往前 max(windows) 天的明细
+                pre = str((pd.Timestamp(start) - pd.Timedelta(days=max(st["windows"]))).date())
+                roll = rolling_trends(store.daily(start=pre, end=end), st["windows"])
+                results["Trend_Daily"] = roll[roll["date"].astype(str) >= start].reset_index(drop=True)
+            write_tables(results, args.out, args.format, stem="ppc_output")
+            write_tables(v11, args.out if args.format != "csv" else os.path.join(args.out, "v11"),
+                         args.format, stem="ppc_actions")
+            alerts = f" ｜ ACOS 恶化 {len(results['Trend_Alerts'])}" if "Trend_Alerts" in results else ""
+            print(f"✅ {start} ~ {end}：{len(df)} 个搜索词{alerts} → {args.out}")
+            return 0
+
+        print(pd.Series(store.info()).to_string())
+        log = store.ingest_log()
+        if len(log):
+            print()
+            print(log.tail(20).to_string(index=False))
+        return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
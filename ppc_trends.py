@@ -0,0 +1,146 @@
+# ppc_trends.py — 趋势指标：按搜索词计算 7/14/30 天滚动点击、花费、ACOS、CVR 与日环比
+# 输入为逐日明细（ppc_store.HistoryStore.daily() 的输出：date + campaign/ad_group/search_term + 指标）。
+# 全部为数组运算：按 (分组, 日期) 排序后做一次前缀和，任意窗口 = 两次 searchsorted 相减，
+# 与窗口个数、分组个数无关，千万级逐日行也只需几次排序的代价。
+import numpy as np
+import pandas as pd
+
+from ppc_optimizer_lib import _safe_div_array, _STD_KEYS
+
+TREND_METRICS = ["clicks", "spend", "sales", "orders"]
+
+def trend_settings(cfg: dict) -> dict:
+    t = cfg.get("trends", {}) or {}
+    return {
+        "windows": [int(w) for w in (t.get("windows") or [7, 14, 30])],
+        "worsening_window": int(t.get("worsening_window", 14)),
+        "worsening_ratio": float(t.get("worsening_ratio", 1.2)),
+        "worsening_min_clicks": int(t.get("worsening_min_clicks", 10)),
+        "block_scale_up": bool(t.get("block_scale_up_when_worsening", True)),
+        "bid_down": bool(t.get("bid_down_when_worsening", True)),
+    }
+
+class _WindowIndex:
+    """
+    (分组, 日期) 复合键排序后的前缀和。复合键 = gid * span + day（day 已加偏移，窗口下界不会越入前一个分组），
+    sum(gid, lo, hi) 返回该分组 lo < 日期 <= hi 的合计。
+    """
+    def __init__(self, gid: np.ndarray, day: np.ndarray, values: dict, max_window: int):
+        self.offset = 2 * int(max_window) + 1
+        self.span = int(day.max() if len(day) else 0) + 2 * self.offset + 1
+        order = np.lexsort((day, gid))
+        self.ck = gid[order].astype("int64") * self.span + day[order] + self.offset
+        self.cums = {}
+        for m, v in values.items():
+            c = np.zeros(len(order) + 1, dtype="float64")
+            np.cumsum(np.asarray(v, dtype="float64")[order], out=c[1:])
+            self.cums[m] = c
+
+    def _pos(self, gid, day):
+        return np.searchsorted(self.ck, gid.astype("int64") * self.span + day + self.offset, side="right")
+
+    def sums(self, gid: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> dict:
+        p_hi, p_lo = self._pos(gid, hi), self._pos(gid, lo)
+        return {m: c[p_hi] - c[p_lo] for m, c in self.cums.items()}
+
+def _encode(daily: pd.DataFrame):
+    """逐日明细 → (分组编号, 日序号, 第一个日期, 分组键表)。"""
+    gid = daily.groupby(_STD_KEYS, sort=False, observed=True, dropna=False).ngroup().to_numpy()   # 空键不得到 NaN 编号
+    days = pd.to_datetime(daily["date"]).to_numpy().astype("datetime64[D]").astype("int64")
+    d0 = int(days.min()) if len(days) else 0
+    _, first = np.unique(gid, return_index=True)
+    keys = daily[_STD_KEYS].iloc[first].reset_index(drop=True)
+    return gid, days - d0, d0, keys
+
+def _window_columns(out: dict, sums: dict, suffix: str):
+    for m in TREND_METRICS:
+        out[f"{m}_{suffix}"] = sums[m]
+    out[f"acos_{suffix}"] = _safe_div_array(sums["spend"], sums["sales"])
+    out[f"cvr_{suffix}"] = _safe_div_array(sums["orders"], sums["clicks"])
+
+def rolling_trends(daily: pd.DataFrame, windows=(7, 14, 30)) -> pd.DataFrame:
+    """
+    每个逐日行（按 分组、日期 排序）上截至当天的 N 天滚动合计与比率，以及日环比（与前一天相比，缺失日按 0）：
+    clicks_7d / spend_7d / sales_7d / orders_7d / acos_7d / cvr_7d …，clicks_dod / spend_dod / acos_dod。
+    """
+    windows = sorted({int(w) for w in windows})
+    gid, day, d0, _ = _encode(daily)
+    idx = _WindowIndex(gid, day, {m: daily[m].to_numpy() for m in TREND_METRICS}, max(windows + [2]))
+    order = np.lexsort((day, gid))
+    g, d = gid[order], day[order]
+
+    out = {c: daily[c].to_numpy()[order] for c in ["date"] + _STD_KEYS + TREND_METRICS}
+    for w in windows:
+        _window_columns(out, idx.sums(g, d - w, d), f"{w}d")
+    prev = idx.sums(g, d - 2, d - 1)
+    today_acos = _safe_div_array(out["spend"], out["sales"])
+    out["clicks_dod"] = out["clicks"] - prev["clicks"]
+    out["spend_dod"] = out["spend"] - prev["spend"]
+    out["acos_dod"] = today_acos - _safe_div_array(prev["spend"], prev["sales"])
+    return pd.DataFrame(out)
+
+def trend_snapshot(daily: pd.DataFrame, cfg: dict = None, end=None) -> pd.DataFrame:
+    """
+    每个 (campaign, ad_group, search_term) 截至 end（默认最新日期）的趋势指标，一行一个搜索词：
+    - {clicks,spend,sales,orders,acos,cvr}_{N}d：最近 N 天；
+    - acos_prev_{W}d / acos_delta_{W}d：前一个 W 天窗口的 ACOS 及变化（W = worsening_window）；
+    - acos_worsening：最近 W 天点击 ≥ worsening_min_clicks，前一窗口有销售，且最近 W 天
+      ACOS ≥ 前一窗口 × worsening_ratio 或有花费无销售；
+    - clicks_dod / spend_dod / acos_dod：最后一天相对前一天。
+    end 可以不在 daily 的日期范围内：早于第一天时各窗口为 0，晚于最后一天时窗口只含范围内的日期。
+    """
+    st = trend_settings(cfg or {})
+    windows = sorted(set(st["windows"]) | {st["worsening_window"]})
+    if daily is None or len(daily) == 0:
+        return pd.DataFrame(columns=_STD_KEYS + ["acos_worsening"])
+    gid, day, d0, keys = _encode(daily)
+    end_day = (int(pd.Timestamp(end).to_datetime64().astype("datetime64[D]").astype("int64")) - d0
+               if end is not None else int(day.max()))
+    # 截断到 [第一天前一天, 最后一天 + 2 × 最大窗口 + 1]：范围外各窗口本来就为 0，复合键也不会越界落到相邻分组
+    end_day = int(np.clip(end_day, -1, int(day.max()) + 2 * max(windows) + 1))
+    ww = st["worsening_window"]
+    idx = _WindowIndex(gid, day, {m: daily[m].to_numpy() for m in TREND_METRICS}, 2 * max(windows))
+
+    g = np.arange(len(keys))
+    e = np.full(len(keys), end_day, dtype="int64")
+    out = {}
+    for w in windows:
+        _window_columns(out, idx.sums(g, e - w, e), f"{w}d")
+
+    prev = idx.sums(g, e - 2 * ww, e - ww)
+    acos_prev = _safe_div_array(prev["spend"], prev["sales"])
+    acos_now = out[f"acos_{ww}d"]
+    out[f"acos_prev_{ww}d"] = acos_prev
+    out[f"acos_delta_{ww}d"] = acos_now - acos_prev
+    now_no_sales = (out[f"sales_{ww}d"] == 0) & (out[f"spend_{ww}d"] > 0)
+    worse = (prev["sales"] > 0) & ((acos_now >= acos_prev * st["worsening_ratio"]) | now_no_sales)
+    out["acos_worsening"] = worse & (out[f"clicks_{ww}d"] >= st["worsening_min_clicks"])
+
+    last = idx.sums(g, e - 1, e)
+    before = idx.sums(g, e - 2, e - 1)
+    out["clicks_dod"] = last["clicks"] - before["clicks"]
+    out["spend_dod"] = last["spend"] - before["spend"]
+    out["acos_dod"] = _safe_div_array(last["spend"], last["sales"]) - _safe_div_array(before["spend"], before["sales"])
+
+    snap = pd.concat([keys, pd.DataFrame(out)], axis=1)
+    for c in _STD_KEYS:
+        snap[c] = snap[c].astype(str)
+    return snap
+
+def attach_trends(df: pd.DataFrame, snap: pd.DataFrame) -> pd.DataFrame:
+    """把趋势快照按 (campaign, ad_group, search_term) 并到标准化数据上；没有历史的行趋势列为 0 / False。"""
+    if snap is None or len(snap) == 0:
+        return df
+    cols = [c for c in snap.columns if c not in _STD_KEYS and c not in df.columns]
+    key_l = pd.MultiIndex.from_arrays([df[c].astype(str) for c in _STD_KEYS])
+    key_r = pd.MultiIndex.from_frame(snap[_STD_KEYS])
+    pos = key_r.get_indexer(key_l)
+    hit = pos >= 0
+    df = df.copy(deep=False)
+    for c in cols:
+        v = snap[c].to_numpy()
+        fill = False if v.dtype == bool else 0
+        col = np.full(len(df), fill, dtype=v.dtype)
+        col[hit] = v[pos[hit]]
+        df[c] = col
+    return df
@@ -0,0 +1,13 @@
+# 测试从仓库根目录导入模块（仓库没有打包配置）
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(autouse=True)
+def _repo_cwd(monkeypatch):
+    """load_config("config.yaml") 等相对路径按仓库根目录解析。"""
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,59 @@
+import pandas as pd
+
+from ppc_bulksheet import ExistingBulk, build_bulksheet, split_bounds
+
+def _existing():
+    return ExistingBulk(pd.DataFrame({
+        "Entity": ["Campaign", "Ad Group", "Negative Keyword"],
+        "Campaign ID": ["111", "111", "111"],
+        "Ad Group ID": ["", "222", "222"],
+        "Campaign Name (Informational only)": ["Camp A", "Camp A", "Camp A"],
+        "Ad Group Name (Informational only)": ["", "AG 1", "AG 1"],
+        "Keyword Text": ["", "", "car mat"],
+        "Match Type": ["", "", "negativeExact"],
+    }))
+
+def test_negatives_deduped_against_bulksheet_2_export():
+    upload = pd.DataFrame({
+        "Campaign Name": ["Camp A", "Camp A"], "Ad Group Name": ["AG 1", "AG 1"],
+        "Negative Keyword": ["car mat", "seat cover"], "Match Type": ["negative exact", "Negative Phrase"],
+    })
+    bulk, stats = build_bulksheet({"Early_Negatives_Upload": upload}, {}, {"bulksheet": {"include": ["negatives"]}},
+                                  _existing())
+    assert stats["negatives_skipped_existing"] == 1
+    assert bulk["Keyword Text"].tolist() == ["seat cover"]
+    assert bulk["Match Type"].tolist() == ["negativePhrase"]
+    assert bulk[["Campaign ID", "Ad Group ID"]].iloc[0].tolist() == ["111", "222"]
+
+def test_bid_suggestions_only_update_existing_exact_keywords():
+    existing = ExistingBulk(pd.DataFrame({
+        "Entity": ["Keyword", "Keyword"],
+        "Campaign ID": ["111", "111"], "Ad Group ID": ["222", "222"], "Keyword ID": ["333", "444"],
+        "Campaign Name (Informational only)": ["Camp A", "Camp A"],
+        "Ad Group Name (Informational only)": ["AG 1", "AG 1"],
+        "Keyword Text": ["car mat", "seat cover"], "Match Type": ["Exact", "Phrase"],
+    }))
+    bid_sheet = pd.DataFrame({
+        "Campaign Name": ["Camp A", "Camp A"], "Ad Group Name": ["AG 1", "AG 1"],
+        "Search Term": ["Car Mat", "seat cover"], "Bid Type": ["Suggested Exact Bid"] * 2,
+        "Recommended Bid": [1.25, 0.8],
+    })
+    bulk, stats = build_bulksheet({"Bid_Sheet": bid_sheet}, {}, {"bulksheet": {"include": ["bids"]}}, existing)
+    assert bulk["Keyword ID"].tolist() == ["333"]
+    assert bulk["Bid"].tolist() == [1.25]
+    assert bulk["Match Type"].tolist() == ["exact"]
+    assert stats["bid_updates_without_keyword_id"] == 1
+
+def test_split_bounds_keeps_each_campaign_in_one_file():
+    sizes = {"A": 4, "B": 3, "C": 5, "D": 1, "E": 12}
+    bulk = pd.DataFrame({"Campaign ID": [c for c, n in sizes.items() for _ in range(n)]})
+    bounds = split_bounds(bulk, max_rows=8)
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(bulk)
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+    assert all(hi - lo <= 8 for lo, hi in bounds)
+    files = [set(bulk["Campaign ID"].iloc[lo:hi]) for lo, hi in bounds]
+    # 不超过上限的活动只出现在一个文件里；只有超过上限的 E 会被切开
+    for camp in ["A", "B", "C", "D"]:
+        assert sum(camp in f for f in files) == 1
+    assert sum("E" in f for f in files) == 2
+    assert split_bounds(bulk.head(5), max_rows=8) == [(0, 5)]
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from ppc_optimizer_lib import FrameCache
+
+def test_lru_evicts_least_recently_used_entry():
+    cache = FrameCache(max_entries=2)
+    cache.put("a", 1, nbytes=1)
+    cache.put("b", 2, nbytes=1)
+    assert cache.get("a") == 1          # a 变为最近使用
+    cache.put("c", 3, nbytes=1)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    cache.put("a", 10, nbytes=1)        # 覆盖同键不增加条目
+    assert len(cache) == 2 and cache.get("a") == 10
+
+def test_memory_cap_evicts_oldest_and_rejects_oversized():
+    cache = FrameCache(max_entries=10, max_bytes=100)
+    cache.put("a", "x", nbytes=40)
+    cache.put("b", "y", nbytes=40)
+    cache.put("c", "z", nbytes=40)      # 120 > 100 → 淘汰最久未用的 a
+    assert "a" not in cache and "b" in cache and "c" in cache
+    assert cache.total_bytes == 80
+    assert cache.put("big", "w", nbytes=101) is False
+    assert "big" not in cache and len(cache) == 2
+
+def test_frame_size_is_measured_when_not_given():
+    df = pd.DataFrame({"a": range(1000)})
+    cache = FrameCache(max_bytes=df.memory_usage(deep=True).sum() + 10)
+    assert cache.put("df", df)
+    assert cache.put("df2", df.copy())  # 两份放不下，先放的被淘汰
+    assert "df" not in cache and "df2" in cache
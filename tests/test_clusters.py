@@ -0,0 +1,23 @@
+from ppc_clusters import cluster_terms, stem
+
+CFG = {"clusters": {"stopwords": ["for", "the", "with"]}}
+
+def test_stem_folds_common_inflections():
+    assert [stem(w) for w in ["brewing", "heaters", "batteries", "running", "boxes", "glass"]] == \
+           ["brew", "heater", "battery", "run", "box", "glass"]
+
+def test_cluster_terms_groups_known_variants():
+    groups = [
+        ["brew heater", "brewing heater", "heater for brewing", "Brew Heaters", "the brew-heater"],
+        ["seed tray", "seed trays", "trays for seeds"],
+        ["reptile mat"],
+        ["heat mat with thermostat", "heat mats with thermostats"],
+    ]
+    terms = [t for g in groups for t in g]
+    cid, labels = cluster_terms(terms, CFG)
+    ids = iter(cid.tolist())
+    per_group = [{next(ids) for _ in g} for g in groups]
+    assert all(len(s) == 1 for s in per_group)                  # 组内同簇
+    assert len({next(iter(s)) for s in per_group}) == len(groups)   # 组间不同簇
+    assert len(labels) == len(groups)
+    assert labels[int(cid[0])] == "brew heater"
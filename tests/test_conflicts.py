@@ -0,0 +1,44 @@
+import pandas as pd
+
+from ppc_conflicts import ConflictIndex, annotate_exact_negatives, negative_conflicts
+
+CFG = {"negatives_scan": {"phrase_roots": ["heater"], "patterns": {}}}
+
+def _df():
+    return pd.DataFrame({
+        "campaign": ["C1", "C1", "C2", "C1"],
+        "ad_group": ["A", "B", "A", "A"],
+        "search_term": ["mat heater", "mat heaters", "mat heater", "seed tray"],
+        "clicks": [10, 10, 10, 10],
+        "orders": [2, 3, 4, 1],
+        "sales": [20.0, 30.0, 40.0, 10.0],
+        "spend": [5.0, 5.0, 5.0, 5.0],
+    })
+
+def test_negative_conflicts_scoped_and_account_wide():
+    df = _df()
+    upload = pd.DataFrame({
+        "Campaign Name": ["C1", "C1", "C3"],
+        "Ad Group Name": ["A", "B", "X"],
+        "Negative Keyword": ["mat heater", "mat heater", "mat heater"],
+        "Match Type": ["negative exact", "negative exact", "negative exact"],
+    })
+    out = negative_conflicts(df, CFG, early_upload=upload, index=ConflictIndex(df, CFG)).set_index(["Source", "Ad Group Name"])
+    # 精确否定只挡所在广告组（含单复数变体）；数据里没有的广告组不出现
+    assert out.loc[("Early_Negatives_Upload", "A"), "Blocked Orders"] == 2
+    assert out.loc[("Early_Negatives_Upload", "B"), "Blocked Orders"] == 3
+    assert ("Early_Negatives_Upload", "X") not in out.index
+    # 词组词根：整个账户
+    root = out.loc[("Neg_Phrase_Roots", "")]
+    assert (root["Blocked Terms"], root["Blocked Orders"], root["Blocked Sales"]) == (2, 9, 90.0)
+    assert root["Sample Terms"] == "mat heater | mat heaters"
+
+def test_annotate_exact_negatives_reuses_index():
+    df = _df()
+    neg = pd.DataFrame({"Negative Term": ["mat heater", "unknown"]}, index=[0, 3])
+    scope = df.loc[[0, 3], ["campaign", "ad_group"]]
+    built = annotate_exact_negatives(neg, scope, df, CFG)
+    reused = annotate_exact_negatives(neg, scope, df, CFG, index=ConflictIndex(df, CFG))
+    pd.testing.assert_frame_equal(built, reused)
+    assert built["Blocked Orders"].tolist() == [2.0, 0.0]
+    assert built["Orders Elsewhere"].tolist() == [7.0, 0.0]
@@ -0,0 +1,14 @@
+import io
+
+import pandas as pd
+
+from ppc_export import export_tables
+
+def test_xlsx_sheet_names_are_unique_case_insensitively():
+    df = pd.DataFrame({"a": [1]})
+    tables = {"X" * 29 + "_2": df, "X" * 31: df, "X" * 31 + "Z": df, "Foo": df, "foo": df}
+    payload = export_tables(tables, "xlsx")
+    names = pd.ExcelFile(io.BytesIO(payload)).sheet_names
+    assert len(names) == 5
+    assert len({n.lower() for n in names}) == 5
+    assert all(len(n) <= 31 for n in names)
@@ -0,0 +1,65 @@
+# 空的搜索词 / 活动 / 广告组（含 read_csv 识别为缺失的 "null"）不应让分析崩溃或丢行
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ppc_optimizer_lib import load_config, calculate_metrics, suggest_lexicon_updates, _build_ngram_index
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPORT = """Customer Search Term,Clicks,Impressions,Spend,7 Day Total Sales,7 Day Total Orders (#),Campaign Name,Ad Group Name
+car mat,40,500,30,0,0,C1,G1
+,35,300,20.5,0,0,C1,G1
+null,10,100,5,20,1,C1,G2
+n/a,12,100,6,0,0,C2,G3
+brew heater,50,900,40,100,3,C2,G3
+"""
+
+@pytest.fixture(scope="module")
+def cfg():
+    return load_config(os.path.join(ROOT, "config.yaml"))
+
+def test_ngram_index_skips_missing_terms():
+    counter, postings, uniq = _build_ngram_index(["car mat", np.nan, None, "car mat"], 2, set())
+    assert counter["car mat"] == 2
+    assert postings["car"] == [0]
+    assert len(uniq) == 3
+
+def test_lexicon_with_missing_categorical_terms(cfg):
+    df = pd.DataFrame({
+        "search_term": pd.Categorical(["cheap mat", None, "cheap mat", "cheap pad", None]),
+        "clicks": [5, 5, 5, 5, 5],
+        "orders": [0, 0, 0, 0, 1],
+    })
+    out = suggest_lexicon_updates(df, cfg)
+    assert "cheap mat" in set(out["Token"])
+
+def test_calculate_metrics_with_blank_and_null_terms(cfg):
+    raw = pd.read_csv(io.StringIO(REPORT))
+    assert raw["Customer Search Term"].isna().sum() == 3   # 空单元格、null、n/a
+    results = calculate_metrics(raw, cfg)
+    terms = results["All_Terms"]
+    assert len(terms) == len(raw)
+    assert terms["spend"].sum() == pytest.approx(raw["Spend"].sum())
+    assert not terms["search_term"].isna().any()
+
+def test_recommend_bids_with_blank_ad_group(cfg):
+    from ppc_optimizer_lib import recommend_bids, _deep_merge
+    df = pd.DataFrame({
+        "campaign": pd.Categorical(["C1", "C1", "C1", None]),
+        "ad_group": pd.Categorical(["G1", None, None, "G2"]),
+        "clicks": [10, 8, 6, 20],
+        "orders": [1, 1, 0, 2],
+        "sales": [20.0, 30.0, 0.0, 40.0],
+        "spend": [5.0, 4.0, 3.0, 10.0],
+    })
+    bids = recommend_bids(df, _deep_merge(cfg, {"bayes": {"enabled": False}}), 0.3)
+    assert len(bids) == len(df)
+    assert np.isfinite(bids["recommended_bid"]).all()
+    # 空广告组的两行自成一组：第 3 行无单，客单价取该组的 30 / 1，而不是报错或取账户均值
+    smoothed = df.assign(cvr_post=[0.1, 0.1, 0.1, 0.1])
+    bids = recommend_bids(smoothed, _deep_merge(cfg, {"bayes": {"enabled": False}, "bids": {"use_smoothed": True}}), 0.3)
+    assert bids["target_bid"].iloc[2] == pytest.approx(round(0.3 * 0.1 * 30.0, 2))
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from bench_pipeline import make_synthetic_report
+from ppc_optimizer_lib import load_config, scan_potential_negatives, standardize_df
+
+PATTERNS = {
+    "UNRELATED_CONTEXT": ["car", "car heater", "12v", "reptile"],
+    "LOW_INTENT": ["cheap", "free", "c++", "a.b"],
+    "PARTS": ["replacement", "spare", "adapter"],
+}
+
+def _reference_scan(df, patterns, mode):
+    """旧的逐行子串扫描（编译匹配器之前的实现），作为对照。"""
+    base = df[(df["clicks"] >= 1) & (df["orders"] == 0)]
+    out = {}
+    for _, r in base.iterrows():
+        term = str(r["search_term"]).lower()
+        reasons = [tag for tag, plist in patterns.items() if any(p.lower() in term for p in plist)]
+        if mode == "aggressive" and not reasons and any(g in term for g in ["pad", "belt", "starter", "bundle"]):
+            reasons.append("GENERIC_HEURISTIC")
+        if reasons:
+            out[(r["campaign"], r["ad_group"], r["search_term"])] = ";".join(sorted(set(reasons)))
+    return out
+
+@pytest.mark.parametrize("mode", ["conservative", "aggressive"])
+def test_compiled_matcher_matches_per_pattern_scan(mode):
+    cfg = load_config("config.yaml")
+    cfg["negatives_scan"].update({"mode": mode, "patterns": PATTERNS, "match_mode": "substring"})
+    cfg.setdefault("bayes", {})["use_for_rules"] = False
+    df = standardize_df(make_synthetic_report(5000, seed=3), cfg)
+    extra = pd.DataFrame({"search_term": ["C++ heater", "a.b mat", "axb mat", "CAR HEATER pad", "spare belt"],
+                          "campaign": "X", "ad_group": "Y", "clicks": 5, "orders": 0})
+    df = pd.concat([df, extra], ignore_index=True).fillna({"ctr": 0.0})
+
+    src, upload = scan_potential_negatives(df, cfg)
+    got = dict(zip(zip(src["Campaign Name"].astype(str), src["Ad Group Name"].astype(str),
+                       src["Customer Search Term"].astype(str)), src["Reason"]))
+    want = {tuple(map(str, k)): v for k, v in _reference_scan(df, PATTERNS, mode).items()}
+    assert len(want) > 10
+    assert got == want
+    assert len(upload) == len(src)
+    assert "axb mat" not in set(src["Customer Search Term"].astype(str))   # 模式里的 . 不是正则通配符
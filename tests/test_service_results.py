@@ -0,0 +1,29 @@
+import io
+
+import pandas as pd
+
+import ppc_service
+from ppc_export import export_tables
+
+def test_fetch_results_keeps_text_columns(monkeypatch):
+    upload = pd.DataFrame({
+        "Campaign Name": ["007", "12", ""],
+        "Ad Group Name": ["1", "2", "3"],
+        "Negative Keyword": ["null", "n/a", "None"],
+        "Match Type": ["negative exact"] * 3,
+    })
+    terms = pd.DataFrame({"search_term": ["null", "NA", "heater"], "campaign": ["007", "", "12"],
+                          "ad_group": ["1", "2", "3"], "clicks": [1, 2, 3], "spend": [0.5, None, 1.5]})
+    payload = export_tables({"Early_Negatives_Upload": upload, "All_Terms": terms, "Neg_Exact": terms}, "csv_zip")
+    monkeypatch.setattr(ppc_service.urllib.request, "urlopen", lambda *a, **kw: io.BytesIO(payload))
+
+    results, v11 = ppc_service.fetch_results("http://service", "job")
+    up = results["Early_Negatives_Upload"]
+    assert up["Campaign Name"].tolist() == ["007", "12", ""]
+    assert up["Ad Group Name"].tolist() == ["1", "2", "3"]
+    assert up["Negative Keyword"].tolist() == ["null", "n/a", "None"]
+    at = results["All_Terms"]
+    assert at["search_term"].tolist() == ["null", "NA", "heater"]
+    assert at["campaign"].tolist() == ["007", "", "12"]
+    assert at["spend"].isna().tolist() == [False, True, False]   # 数值列的空单元格仍是缺失值
+    assert v11["Neg_Exact"]["search_term"].tolist() == ["null", "NA", "heater"]
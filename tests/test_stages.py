@@ -0,0 +1,48 @@
+import time
+
+import pandas as pd
+import pytest
+
+from bench_pipeline import make_synthetic_report
+from ppc_optimizer_lib import calculate_metrics_from_std, load_config, standardize_df
+from ppc_stages import run_stage_graph
+
+def _toy_stages(log):
+    def stage(name, value, delay=0.0):
+        def fn(done):
+            time.sleep(delay)
+            log.append(name)
+            return value(done)
+        return fn
+    return [
+        ("a", stage("a", lambda d: 1, 0.02), [], None),
+        ("b", stage("b", lambda d: d["a"] + 1), ["a"], None),
+        ("c", stage("c", lambda d: 10), [], None),
+        ("d", stage("d", lambda d: d["b"] * d["c"]), ["b", "c"], None),
+    ]
+
+@pytest.mark.parametrize("executor", ["serial", "thread"])
+def test_stage_graph_respects_dependencies(executor):
+    log = []
+    out = run_stage_graph(_toy_stages(log), executor=executor, workers=3)
+    assert out == {"a": 1, "b": 2, "c": 10, "d": 20}
+    assert list(out) == ["a", "b", "c", "d"]       # 顺序同 stages，与完成先后无关
+    order = log
+    assert order.index("a") < order.index("b") < order.index("d") and order.index("c") < order.index("d")
+
+def test_stage_graph_reports_unsatisfiable_dependencies():
+    with pytest.raises(ValueError):
+        run_stage_graph([("x", lambda d: 1, ["missing"], None)], executor="thread", workers=2)
+
+def test_calculate_metrics_serial_and_thread_identical():
+    cfg = load_config("config.yaml")
+    df = standardize_df(make_synthetic_report(4000, seed=11), cfg)
+    results = {}
+    for executor in ["serial", "thread"]:
+        cfg["stages"] = {"executor": executor, "workers": 4}
+        results[executor] = calculate_metrics_from_std(df, cfg)
+    serial, thread = results["serial"], results["thread"]
+    tables = [k for k, v in serial.items() if isinstance(v, pd.DataFrame)]
+    assert tables == [k for k, v in thread.items() if isinstance(v, pd.DataFrame)]
+    for k in tables:
+        pd.testing.assert_frame_equal(serial[k], thread[k], obj=k)
@@ -0,0 +1,46 @@
+import io
+
+import pytest
+
+from ppc_store import HistoryStore
+
+HEADER = "Date,Customer Search Term,Clicks,Impressions,Spend,7 Day Total Sales,7 Day Total Orders (#),Campaign Name,Ad Group Name\n"
+
+def _csv(*rows) -> io.BytesIO:
+    return io.BytesIO((HEADER + "".join(r + "\n" for r in rows)).encode())
+
+def test_ingest_counts_rows_with_unparseable_dates():
+    store = HistoryStore(":memory:")
+    st = store.ingest_report(_csv("2026-10-01,car mat,10,100,5,0,0,C1,G1",
+                                  "not a date,car mat,7,70,3,0,0,C1,G1",
+                                  ",seed tray,1,10,1,0,0,C1,G1"), {}, name="r.csv")
+    assert (st["rows_in"], st["rows_stored"], st["rows_bad_date"]) == (3, 1, 2)
+
+    with pytest.raises(ValueError, match="2 行日期无法解析"):
+        store.ingest_report(_csv("2026-10-02,car mat,10,100,5,0,0,C1,G1",
+                                 "not a date,car mat,7,70,3,0,0,C1,G1",
+                                 ",seed tray,1,10,1,0,0,C1,G1"), {}, name="r.csv", strict=True)
+    assert store.date_range() == ("2026-10-01", "2026-10-01")   # strict 失败时整份报表回滚
+
+def _totals(store, start, end):
+    return store.window_std(start=start, end=end).set_index("search_term")["clicks"].to_dict()
+
+def test_replace_overwrites_whole_overlapping_days():
+    store = HistoryStore(":memory:")
+    store.ingest_report(_csv("2026-10-01,car mat,10,100,5,0,0,C1,G1",
+                             "2026-10-02,car mat,20,100,5,0,0,C1,G1",
+                             "2026-10-02,seed tray,3,30,1,0,0,C1,G1"), {}, name="a.csv")
+    st = store.ingest_report(_csv("2026-10-02,car mat,25,100,5,0,0,C1,G1",
+                                  "2026-10-03,car mat,7,70,3,0,0,C1,G1"), {}, name="b.csv", on_overlap="replace")
+    assert st["rows_replaced"] == 2          # 10-02 整天旧数据被删除，包括新报表里没有的 seed tray
+    assert _totals(store, "2026-10-01", "2026-10-03") == {"car mat": 42}
+
+def test_upsert_only_overwrites_matching_keys():
+    store = HistoryStore(":memory:")
+    store.ingest_report(_csv("2026-10-02,car mat,20,100,5,0,0,C1,G1",
+                             "2026-10-02,seed tray,3,30,1,0,0,C1,G1"), {}, name="a.csv")
+    store.ingest_report(_csv("2026-10-02,car mat,25,100,5,0,0,C1,G1",
+                             "2026-10-02,car mat,5,10,1,0,0,C1,G1"), {}, name="b.csv", on_overlap="upsert")
+    # 同一报表内的同键行先合并，再覆盖旧值；其它键保留
+    assert _totals(store, "2026-10-02", "2026-10-02") == {"car mat": 30, "seed tray": 3}
+    assert len(store.ingest_log()) == 2
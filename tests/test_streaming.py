@@ -0,0 +1,28 @@
+import io
+
+import pandas as pd
+
+from bench_pipeline import make_synthetic_report
+from ppc_optimizer_lib import _STD_KEYS, _STD_NUM_COLS, load_config, standardize_df, stream_standardize_csv
+
+def test_streamed_aggregation_matches_full_frame_groupby():
+    cfg = load_config("config.yaml")
+    raw = make_synthetic_report(6000, seed=7)
+    raw = pd.concat([raw, raw.sample(1500, random_state=1)], ignore_index=True)   # 跨分块的重复键
+    raw.loc[:9, "Campaign Name"] = ""
+    raw.loc[10:19, "Customer Search Term"] = ""
+    buf = io.BytesIO(raw.to_csv(index=False).encode("utf-8"))
+
+    seen = []
+    streamed, n_rows = stream_standardize_csv(buf, cfg, chunksize=1000, progress=lambda done, total, rows: seen.append(rows))
+    buf.seek(0)
+    full = standardize_df(pd.read_csv(buf), cfg)
+    want = full.groupby(_STD_KEYS, observed=True, dropna=False)[_STD_NUM_COLS].sum()
+
+    assert n_rows == len(raw)
+    assert seen and seen[-1] == len(raw)
+    got = streamed.assign(**{k: streamed[k].astype(str) for k in _STD_KEYS}).set_index(_STD_KEYS)[_STD_NUM_COLS]
+    want.index = want.index.set_levels([lvl.astype(str) for lvl in want.index.levels])
+    assert len(got) == len(want)
+    pd.testing.assert_frame_equal(got.sort_index().astype("float64"), want.sort_index().astype("float64"),
+                                  check_exact=False, rtol=1e-9)
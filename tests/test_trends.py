@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from ppc_trends import rolling_trends, trend_snapshot
+
+def _daily():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2026-01-01", periods=40).strftime("%Y-%m-%d")
+    rows = []
+    for term in ["a", "b"]:
+        for d in dates[::2] if term == "b" else dates:   # b 隔天才有数据
+            rows.append({"date": d, "campaign": "C", "ad_group": "G", "search_term": term,
+                         "clicks": int(rng.integers(0, 20)), "spend": float(rng.integers(0, 50)),
+                         "sales": float(rng.integers(0, 80)), "orders": int(rng.integers(0, 3))})
+    return pd.DataFrame(rows)
+
+def _window_sum(daily, term, end, days, col):
+    d = pd.to_datetime(daily["date"])
+    end = pd.Timestamp(end)
+    m = (daily["search_term"] == term) & (d > end - pd.Timedelta(days=days)) & (d <= end)
+    return daily.loc[m, col].sum()
+
+def test_rolling_trends_matches_brute_force():
+    daily = _daily()
+    out = rolling_trends(daily, windows=(7, 14))
+    assert len(out) == len(daily)
+    for _, r in out.sample(15, random_state=1).iterrows():
+        for w in (7, 14):
+            assert r[f"clicks_{w}d"] == _window_sum(daily, r["search_term"], r["date"], w, "clicks")
+        prev = _window_sum(daily, r["search_term"], pd.Timestamp(r["date"]) - pd.Timedelta(days=1), 1, "clicks")
+        assert r["clicks_dod"] == r["clicks"] - prev
+
+def test_trend_snapshot_end_outside_stored_range():
+    daily = _daily()
+    cfg = {"trends": {"windows": [7, 30], "worsening_window": 14}}
+    before = trend_snapshot(daily, cfg, end="2025-06-01")
+    assert (before[["clicks_7d", "clicks_30d", "clicks_dod"]] == 0).all().all()
+    for end in ["2026-02-15", "2026-12-31"]:
+        snap = trend_snapshot(daily, cfg, end=end).set_index("search_term")
+        for term in ["a", "b"]:
+            assert snap.loc[term, "clicks_30d"] == _window_sum(daily, term, end, 30, "clicks")
+            assert snap.loc[term, "spend_7d"] == _window_sum(daily, term, end, 7, "spend")
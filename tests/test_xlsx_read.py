@@ -0,0 +1,29 @@
+import io
+
+import pandas as pd
+import pytest
+
+from bench_pipeline import make_synthetic_report
+from ppc_optimizer_lib import load_config, read_xlsx_pruned, standardize_df
+
+@pytest.mark.parametrize("engine", ["openpyxl", "calamine"])
+def test_pruned_xlsx_read_matches_read_excel(engine):
+    if engine == "calamine":
+        pytest.importorskip("python_calamine")
+    cfg = load_config("config.yaml")
+    cfg.setdefault("ingest", {})["xlsx_engine"] = engine
+    raw = make_synthetic_report(1500, seed=5)
+    raw.insert(1, "Portfolio name", "P1")          # 不需要的列
+    raw["Currency"] = "USD"
+    raw.loc[3, "Customer Search Term"] = None
+    buf = io.BytesIO()
+    raw.to_excel(buf, index=False)
+
+    buf.seek(0)
+    pruned, stats = read_xlsx_pruned(buf, cfg)
+    buf.seek(0)
+    full = pd.read_excel(buf)
+
+    assert stats["engine"] == engine and stats["rows"] == len(raw)
+    assert "Portfolio name" not in pruned.columns and "Currency" not in pruned.columns
+    pd.testing.assert_frame_equal(standardize_df(pruned, cfg), standardize_df(full, cfg))